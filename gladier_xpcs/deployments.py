@@ -1,5 +1,7 @@
 import datetime
 import copy
+import os
+import pathlib
 from gladier_xpcs.collections import SharedCollection
 
 
@@ -17,6 +19,10 @@ voyager8IDI = SharedCollection('dc86d51b-81d1-4827-81be-2b5e64ba7dc1',
                                      '/gdata/dm/8IDI/', name='APS:DM:8IDI Guest')
 nersc_permutter = SharedCollection('6bdc7956-fc0f-4ad2-989c-7aa5ee643a79', 
                                      '/', name='NERSC#Perlmutter')
+# Local directories standing in for collections, used by gladier_xpcs.emulator
+local_root = pathlib.Path(os.getenv('XPCS_EMULATOR_ROOT', '/tmp/xpcs_emulator'))
+local_source = SharedCollection('local-source', local_root / 'source', name='Local Source')
+local_staging = SharedCollection('local-staging', local_root / 'staging', name='Local Staging')
 
 class BaseDeployment:
     source_collection: SharedCollection = None
@@ -28,6 +34,8 @@ class BaseDeployment:
     # Is this a "service account" that requires confidential client credentials?
     # This means setting GLADIER_CLIENT_ID and GLADIER_CLIENT_SECRET
     service_account = False
+    # Are flows run by the local emulator instead of Globus?
+    emulated = False
 
     def get_input(self):
         fi = self.flow_input.copy()
@@ -292,6 +300,34 @@ class RafPolaris(BaseDeployment):
         }
     }
 
+class LocalEmulator(BaseDeployment):
+    """Run flows locally with gladier_xpcs.emulator, without any Globus services.
+    Put input files under XPCS_EMULATOR_ROOT/source."""
+
+    source_collection = local_source
+    staging_collection = local_staging
+    pub_collection = local_source
+    emulated = True
+    # Seconds each emulated transfer takes at minimum
+    transfer_latency = float(os.getenv('XPCS_EMULATOR_TRANSFER_LATENCY', 5))
+
+    globus_endpoints = {
+        'globus_endpoint_source': local_source.uuid,
+        'globus_endpoint_proc': local_staging.uuid,
+    }
+
+    compute_endpoints = {
+        'login_node_endpoint': 'local-login',
+        'compute_endpoint': 'local-compute',
+    }
+
+    flow_input = {
+        'input': {
+            'staging_dir': local_staging.path / 'xpcs_staging',
+        }
+    }
+
+
 deployment_map = {
     'talc-prod': Talc(),
     'raf-polaris': RafPolaris(),
@@ -305,4 +341,5 @@ deployment_map = {
     # This is a hack for the SC demo in case we can't get nodes. You can remove this after Nov 16th, 2023.
     'aps8idi-polaris-backup': NickPolarisGPU(),
     'nersc': RyanNERSC(),
+    'local-emulator': LocalEmulator(),
 }
@@ -0,0 +1,390 @@
+"""
+A local stand-in for Globus Flows, Transfer and Compute, for throughput testing.
+
+The emulator interprets the same flow definitions Gladier generates for a client like
+XPCSBoost. Action states are dispatched on their ActionUrl: compute tasks run in a local
+process pool (one per compute endpoint), and transfers are local file copies between
+the directories backing each SharedCollection, delayed by a configurable latency.
+Choice and Pass states are evaluated as Globus Flows would.
+
+Runs are recorded with the same fields and run log entries as Globus Flows, so the
+tools which read those (gladier_xpcs.latency, gladier_xpcs.failures) work on emulated
+runs too.
+
+Select it with the 'local-emulator' deployment:
+
+    python scripts/xpcs_online_boost_client.py --deployment local-emulator ...
+"""
+import concurrent.futures
+import copy
+import datetime
+import importlib
+import logging
+import operator
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+from gladier.utils.name_generation import get_compute_function_name
+
+log = logging.getLogger(__name__)
+
+COMPUTE_ACTION_URLS = ['https://compute.actions.globus.org']
+TRANSFER_ACTION_URLS = [
+    'https://transfer.actions.globus.org/transfer/',
+    'https://actions.automate.globus.org/transfer/transfer',
+]
+# Globus Flows treats a failed action as a failed run unless told otherwise
+DEFAULT_EXCEPTION_ON_ACTION_FAILURE = True
+
+PATH_TOKEN = re.compile(r'\.([^.\[]+)|\[(\d+)\]')
+
+COMPARISONS = {
+    'BooleanEquals': operator.eq,
+    'StringEquals': operator.eq,
+    'NumericEquals': operator.eq,
+    'NumericLessThan': operator.lt,
+    'NumericLessThanEquals': operator.le,
+    'NumericGreaterThan': operator.gt,
+    'NumericGreaterThanEquals': operator.ge,
+}
+
+
+class EmulatorError(Exception):
+    pass
+
+
+class ActionFailed(EmulatorError):
+    pass
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def parse_path(path: str) -> list:
+    """Split a simple JSONPath like '$.input.transfer_items[0].source_path' into keys"""
+    if not path.startswith('$'):
+        raise EmulatorError(f'Unsupported path {path}, paths must start with "$"')
+    return [int(index) if index else key for key, index in PATH_TOKEN.findall(path[1:])]
+
+
+def get_path(document, path: str):
+    """Look up a path in a document. Raises KeyError if any part of it is missing."""
+    value = document
+    for key in parse_path(path):
+        try:
+            value = value[key]
+        except (KeyError, IndexError, TypeError):
+            raise KeyError(f'{path} not found in the flow state')
+    return value
+
+
+def is_present(document, path: str) -> bool:
+    try:
+        get_path(document, path)
+        return True
+    except KeyError:
+        return False
+
+
+def set_path(document: dict, path: str, value) -> dict:
+    """Store a value at a path, creating dicts along the way. Returns the document,
+    which is replaced entirely if the path is '$'."""
+    keys = parse_path(path)
+    if not keys:
+        return value
+    parent = document
+    for key in keys[:-1]:
+        parent = parent.setdefault(key, {})
+    parent[keys[-1]] = value
+    return document
+
+
+def resolve_parameters(parameters, document):
+    """Fill in any keys ending in '.$' with the value found at their path"""
+    if isinstance(parameters, dict):
+        resolved = {}
+        for key, value in parameters.items():
+            if key.endswith('.$'):
+                resolved[key[:-2]] = copy.deepcopy(get_path(document, value))
+            else:
+                resolved[key] = resolve_parameters(value, document)
+        return resolved
+    if isinstance(parameters, list):
+        return [resolve_parameters(item, document) for item in parameters]
+    return parameters
+
+
+def evaluate_rule(rule: dict, document) -> bool:
+    """Evaluate a single Choice rule, including nested And/Or/Not rules"""
+    if 'And' in rule:
+        return all(evaluate_rule(r, document) for r in rule['And'])
+    if 'Or' in rule:
+        return any(evaluate_rule(r, document) for r in rule['Or'])
+    if 'Not' in rule:
+        return not evaluate_rule(rule['Not'], document)
+
+    variable = rule['Variable']
+    if 'IsPresent' in rule:
+        return is_present(document, variable) == rule['IsPresent']
+    if not is_present(document, variable):
+        return False
+    value = get_path(document, variable)
+    if 'IsNull' in rule:
+        return (value is None) == rule['IsNull']
+    for name, compare in COMPARISONS.items():
+        if name in rule:
+            return compare(value, rule[name])
+        if f'{name}Path' in rule:
+            return compare(value, get_path(document, rule[f'{name}Path']))
+    raise EmulatorError(f'Unsupported Choice rule: {rule}')
+
+
+def get_function_path(function) -> str:
+    return f'{function.__module__}:{function.__qualname__}'
+
+
+def run_compute_function(function_path: str, payload: dict):
+    """Import and call a compute function. Runs in a pool process, so functions are
+    passed by import path rather than pickled."""
+    module, name = function_path.split(':')
+    function = getattr(importlib.import_module(module), name)
+    return function(**payload)
+
+
+class LocalFlowsEmulator:
+    """
+    Run a flow definition locally. Runs are started in the background, and may be
+    checked with get_run() or get_status(), or waited on with wait().
+
+    :param flow_definition: A Globus Flows definition, like client.get_flow_definition()
+    :param collections: SharedCollections used in transfers. Globus paths on each
+        collection are copied to and from the collection's local path.
+    :param functions: Compute functions, by function id. Function ids in the flow
+        input are looked up here, and filled in automatically if missing.
+    :param transfer_latency: Seconds each transfer takes at minimum, however small
+    :param transfer_bandwidth: Bytes per second each transfer is limited to, if set
+    :param compute_workers: Processes in the pool for each compute endpoint
+    :param max_runs: Runs which may execute at once. Runs over this are queued.
+    """
+
+    def __init__(self, flow_definition: dict, collections: list, functions: dict = None,
+                 transfer_latency: float = 0.0, transfer_bandwidth: float = None,
+                 compute_workers: int = None, max_runs: int = None):
+        self.flow_definition = flow_definition
+        self.collections = {collection.uuid: collection for collection in collections}
+        self.functions = functions or {}
+        self.transfer_latency = transfer_latency
+        self.transfer_bandwidth = transfer_bandwidth
+        self.compute_workers = compute_workers
+        self.runs = dict()
+        self.run_logs = dict()
+        self.compute_pools = dict()
+        self.futures = dict()
+        self.lock = threading.Lock()
+        self.run_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_runs,
+                                                                  thread_name_prefix='emulated-run')
+
+    @classmethod
+    def from_client(cls, client, deployment, **kwargs):
+        """Build an emulator for a Gladier client, with the collections of a deployment.
+        Any functions given replace the client's compute functions with the same id."""
+        functions = {
+            get_compute_function_name(function): function
+            for tool in client.tools for function in tool.compute_functions
+        }
+        functions.update(kwargs.pop('functions', {}))
+        collections = [c for c in (deployment.source_collection, deployment.staging_collection,
+                                   deployment.pub_collection) if c is not None]
+        kwargs.setdefault('transfer_latency', getattr(deployment, 'transfer_latency', 0.0))
+        return cls(client.get_flow_definition(), collections, functions=functions, **kwargs)
+
+    def run_flow(self, flow_input: dict, label: str = None, tags: list = None) -> dict:
+        """Start a run, with the same arguments as GladierBaseClient.run_flow()"""
+        flow_input = copy.deepcopy(flow_input)
+        for function_id, function in self.functions.items():
+            flow_input['input'].setdefault(function_id, get_function_path(function))
+
+        run_id = str(uuid.uuid4())
+        run = {
+            'run_id': run_id,
+            'action_id': run_id,
+            'flow_id': 'local-emulator',
+            'label': label,
+            'tags': tags or [],
+            'status': 'ACTIVE',
+            'start_time': now(),
+            'completion_time': None,
+            'details': {},
+        }
+        with self.lock:
+            self.runs[run_id] = run
+            self.run_logs[run_id] = []
+        self.log(run_id, 'FlowStarted', input=copy.deepcopy(flow_input))
+        self.futures[run_id] = self.run_executor.submit(self.execute, run_id, flow_input)
+        return copy.deepcopy(run)
+
+    def get_run(self, run_id: str) -> dict:
+        with self.lock:
+            return copy.deepcopy(self.runs[run_id])
+
+    def get_status(self, action_id: str) -> dict:
+        return self.get_run(action_id)
+
+    def get_run_logs(self, run_id: str) -> list:
+        with self.lock:
+            return copy.deepcopy(self.run_logs[run_id])
+
+    def wait(self, run_id: str, timeout: float = None) -> dict:
+        """Block until a run has finished, and return it"""
+        self.futures[run_id].result(timeout=timeout)
+        return self.get_run(run_id)
+
+    def shutdown(self):
+        self.run_executor.shutdown(wait=True)
+        for pool in self.compute_pools.values():
+            pool.shutdown(wait=True)
+
+    def log(self, run_id: str, code: str, /, **details):
+        with self.lock:
+            self.run_logs[run_id].append({'code': code, 'time': now(), 'details': details})
+
+    def finish(self, run_id: str, status: str, /, **details):
+        self.log(run_id, 'FlowSucceeded' if status == 'SUCCEEDED' else 'FlowFailed', **details)
+        with self.lock:
+            self.runs[run_id].update(status=status, completion_time=now(), details=details)
+
+    def execute(self, run_id: str, document: dict):
+        states = self.flow_definition['States']
+        state_name = self.flow_definition['StartAt']
+        while state_name:
+            try:
+                document, state_name = self.execute_state(run_id, state_name, states[state_name], document)
+            except Exception as e:
+                log.debug(f'Emulated run {run_id} failed in {state_name}', exc_info=True)
+                self.finish(run_id, 'FAILED', state_name=state_name, code=type(e).__name__,
+                            description=str(e))
+                return
+        self.finish(run_id, 'SUCCEEDED', output=copy.deepcopy(document))
+
+    def execute_state(self, run_id: str, state_name: str, state: dict, document: dict) -> tuple:
+        """Run a single state. Returns the new flow state, and the name of the next
+        state to run, or None if the flow has ended."""
+        next_state = None if state.get('End') else state.get('Next')
+        state_type = state['Type']
+        if state_type == 'Choice':
+            self.log(run_id, 'ChoiceStarted', state_name=state_name)
+            next_state = next((c['Next'] for c in state['Choices'] if evaluate_rule(c, document)),
+                              state.get('Default'))
+            if next_state is None:
+                raise EmulatorError(f'No Choice matched in {state_name}, and there is no Default')
+            self.log(run_id, 'ChoiceCompleted', state_name=state_name, next_state=next_state)
+        elif state_type == 'Pass':
+            self.log(run_id, 'PassStarted', state_name=state_name)
+            if 'Parameters' in state or 'Result' in state:
+                result = resolve_parameters(state.get('Parameters', state.get('Result')), document)
+                document = set_path(document, state.get('ResultPath', '$'), result)
+            self.log(run_id, 'PassCompleted', state_name=state_name, output=copy.deepcopy(document))
+        elif state_type == 'Action':
+            document = self.execute_action(run_id, state_name, state, document)
+        else:
+            raise EmulatorError(f'{state_name}: state type {state_type} is not supported by the emulator')
+        return document, next_state
+
+    def execute_action(self, run_id: str, state_name: str, state: dict, document: dict) -> dict:
+        self.log(run_id, 'ActionStarted', state_name=state_name)
+        if 'InputPath' in state:
+            body = copy.deepcopy(get_path(document, state['InputPath']))
+        else:
+            body = resolve_parameters(state.get('Parameters', {}), document)
+
+        action_url, code = state['ActionUrl'], 'ActionCompleted'
+        try:
+            if action_url in COMPUTE_ACTION_URLS:
+                result = self.run_compute(body, state.get('WaitTime'))
+            elif action_url in TRANSFER_ACTION_URLS:
+                result = self.run_transfer(body)
+            else:
+                raise ActionFailed(f'{action_url} is not supported by the emulator')
+        except concurrent.futures.TimeoutError:
+            self.log(run_id, 'ActionTimeout', state_name=state_name,
+                     error=f'Action did not complete within WaitTime of {state.get("WaitTime")}s')
+            raise ActionFailed(f'{state_name} exceeded its WaitTime')
+        except Exception as e:
+            if state.get('ExceptionOnActionFailure', DEFAULT_EXCEPTION_ON_ACTION_FAILURE):
+                self.log(run_id, 'ActionFailed', state_name=state_name, error=repr(e))
+                raise
+            code, result = 'ActionFailed', {'status': 'FAILED', 'details': {'error': repr(e)}}
+
+        document = set_path(document, state.get('ResultPath', '$'), result)
+        # Like Globus Flows, the output is the whole flow state after the action
+        self.log(run_id, code, state_name=state_name, output=copy.deepcopy(document))
+        return document
+
+    def get_compute_pool(self, endpoint: str) -> concurrent.futures.ProcessPoolExecutor:
+        with self.lock:
+            if endpoint not in self.compute_pools:
+                self.compute_pools[endpoint] = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.compute_workers)
+            return self.compute_pools[endpoint]
+
+    def run_compute(self, body: dict, wait_time: float = None) -> dict:
+        """Run each task on the pool for its endpoint, in the same form as the
+        Globus Compute action provider returns results."""
+        futures = []
+        for task in body['tasks']:
+            function_path = task['function']
+            if ':' not in function_path:
+                raise ActionFailed(f'Function {function_path} is not a local function path')
+            pool = self.get_compute_pool(task['endpoint'])
+            futures.append(pool.submit(run_compute_function, function_path, task.get('payload', {})))
+
+        deadline = time.time() + wait_time if wait_time else None
+        results = []
+        for future in futures:
+            timeout = max(deadline - time.time(), 0) if deadline else None
+            results.append({'task_id': str(uuid.uuid4()), 'output': future.result(timeout=timeout)})
+        return {'status': 'SUCCEEDED', 'details': {'results': results}}
+
+    def get_local_path(self, endpoint: str, path: str):
+        if endpoint not in self.collections:
+            raise ActionFailed(f'Collection {endpoint} is not known to the emulator')
+        # Globus paths are relative to the collection root, even though they start with '/'
+        return self.collections[endpoint].path / path.lstrip('/')
+
+    def run_transfer(self, body: dict) -> dict:
+        """Copy each transfer item between the local paths of each collection"""
+        source = body.get('source_endpoint', body.get('source_endpoint_id'))
+        destination = body.get('destination_endpoint', body.get('destination_endpoint_id'))
+        items = body.get('DATA', body.get('transfer_items', []))
+
+        start, files, size = time.time(), 0, 0
+        for item in items:
+            src = self.get_local_path(source, item['source_path'])
+            dst = self.get_local_path(destination, item['destination_path'])
+            if not src.exists():
+                raise ActionFailed(f'No such file or directory: {item["source_path"]}')
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if src.is_dir():
+                if not item.get('recursive'):
+                    raise ActionFailed(f'{item["source_path"]} is a directory, but recursive is not set')
+                shutil.copytree(src, dst, dirs_exist_ok=True)
+                copied = [p for p in src.rglob('*') if p.is_file()]
+            else:
+                shutil.copy2(src, dst)
+                copied = [src]
+            files += len(copied)
+            size += sum(os.path.getsize(p) for p in copied)
+
+        delay = self.transfer_latency
+        if self.transfer_bandwidth:
+            delay += size / self.transfer_bandwidth
+        time.sleep(max(delay - (time.time() - start), 0))
+        return {
+            'status': 'SUCCEEDED',
+            'details': {'files': files, 'files_transferred': files, 'bytes_transferred': size},
+        }
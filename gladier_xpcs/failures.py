@@ -0,0 +1,77 @@
+"""
+Classify failed flow runs from their Globus Flows run logs.
+
+Some failures are transient (a transfer or compute node which timed out) and a retry
+will likely succeed. Others are deterministic (a bad qmap causing corr to exit non-zero,
+a missing 'dataDir' in the HDF metadata, a search field which changed type) and will
+fail again no matter how many times they are retried.
+"""
+import json
+import re
+
+TRANSFER_TIMEOUT = 'transfer_timeout'
+NODE_ACQUISITION_TIMEOUT = 'node_acquisition_timeout'
+CORR_NON_ZERO_EXIT = 'corr_non_zero_exit'
+METADATA_KEY_ERROR = 'metadata_key_error'
+INGEST_TYPE_CONFLICT = 'ingest_type_conflict'
+UNKNOWN = 'unknown'
+
+# Run log codes which carry the details of a failure
+FAILURE_CODES = ['ActionFailed', 'ActionTimeout', 'FlowFailed', 'FlowTimeout']
+
+TIMEOUT_PATTERN = r'time[ds]? ?out|ActionTimedOut|deadline exceeded|WaitTime'
+
+# Categories are checked in order, and the first category where both the state name
+# and the failure text match is used. Each entry is:
+#   (category, state_name regex, failure text regex)
+FAILURE_CATEGORIES = [
+    (TRANSFER_TIMEOUT, r'Transfer', TIMEOUT_PATTERN),
+    (INGEST_TYPE_CONFLICT, r'Ingest|Publish',
+     r'mapper_parsing_exception|failed to parse|type mismatch|cannot be changed from type|'
+     r'illegal_argument_exception'),
+    (METADATA_KEY_ERROR, r'Metadata', r'KeyError'),
+    (CORR_NON_ZERO_EXIT, r'Corr',
+     r'non-zero exit|returned non-zero|exit status [1-9]|CalledProcessError|returncode'),
+    # Compute tasks which time out are almost always waiting in the scheduler for a node
+    (NODE_ACQUISITION_TIMEOUT, r'.', TIMEOUT_PATTERN),
+]
+
+# Only these categories are worth spending node-hours on again. Unknown failures
+# are retried, which matches the behavior before failures were classified.
+RETRYABLE = {TRANSFER_TIMEOUT, NODE_ACQUISITION_TIMEOUT, UNKNOWN}
+
+
+def get_failure_entries(run_log_entries: list) -> list:
+    return [entry for entry in run_log_entries if entry.get('code') in FAILURE_CODES]
+
+
+def classify_entry(entry: dict) -> str:
+    details = entry.get('details') or {}
+    state_name = details.get('state_name', '')
+    failure_text = json.dumps(details, default=str)
+    for category, state_regex, text_regex in FAILURE_CATEGORIES:
+        if re.search(state_regex, state_name) and re.search(text_regex, failure_text, re.IGNORECASE):
+            return category
+    return UNKNOWN
+
+
+def classify_failure(run_log_entries: list) -> dict:
+    """Classify a failed run given all of its run log entries. The first failure
+    entry that matches a known category wins, since later entries (like FlowFailed)
+    only repeat the cause of the first failed state.
+
+    Returns a dict with the category, the state which failed, and whether the run is
+    worth retrying."""
+    failures = get_failure_entries(run_log_entries)
+    for entry in failures:
+        category = classify_entry(entry)
+        if category != UNKNOWN:
+            break
+    else:
+        category, entry = UNKNOWN, failures[0] if failures else {}
+
+    return {
+        'category': category,
+        'state_name': (entry.get('details') or {}).get('state_name'),
+        'retryable': category in RETRYABLE,
+    }
@@ -0,0 +1,60 @@
+"""
+Fingerprint search records, so records which haven't changed aren't ingested again.
+
+gather_xpcs_metadata fingerprints the 'dc' and 'project_metadata' it writes, and stores
+the fingerprint in the record as project_metadata['metadata_fingerprint']. Fields which
+change on every run without the data changing (creation dates, run times) are left out.
+gather_xpcs_metadata runs on endpoints without gladier_xpcs, so it has its own copy of
+get_fingerprint(), and the two must be changed together.
+
+Fingerprints of records Search has confirmed ingesting are kept in a FingerprintStore,
+a JSON file shared by everything publishing to an index. Unchanged records are only
+skipped on the batch path: xpcs_batch_ingest.py leaves out records with the same
+fingerprint as the one stored, and stores the fingerprints of the ones Search confirms.
+Flows which ingest their own record always ingest it, since nothing records whether
+that ingest succeeded. Only confirmed ingests are recorded, so an ingest which failed
+is never skipped on a retry.
+"""
+import copy
+import hashlib
+import json
+
+from gladier_xpcs.state import JSONStateFile
+
+FINGERPRINT_FIELD = 'metadata_fingerprint'
+# Bump this when the fields below change, so every record is ingested once more. Bump
+# it in gather_xpcs_metadata's get_fingerprint() too.
+FINGERPRINT_VERSION = 1
+# Paths within the record which are left out of the fingerprint
+VOLATILE_FIELDS = [
+    ('dc', 'dates'),
+    ('dc', 'publicationYear'),
+    ('project_metadata', 'executable', 'execution_time_seconds'),
+    ('project_metadata', FINGERPRINT_FIELD),
+]
+
+
+def get_fingerprint(metadata: dict) -> str:
+    """A stable fingerprint of a record's 'dc' and 'project_metadata'. Key order doesn't
+    matter."""
+    stable = copy.deepcopy({k: metadata.get(k) for k in ('dc', 'project_metadata')})
+    for path in VOLATILE_FIELDS:
+        parent = stable
+        for key in path[:-1]:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        if isinstance(parent, dict):
+            parent.pop(path[-1], None)
+    document = json.dumps(stable, sort_keys=True, separators=(',', ':'), default=str)
+    return f'v{FINGERPRINT_VERSION}:{hashlib.sha256(document.encode("utf-8")).hexdigest()}'
+
+
+class FingerprintStore(JSONStateFile):
+    """Fingerprints of ingested records, by index and subject"""
+
+    def get(self, index: str, subject: str) -> str:
+        return self.load().get(index, {}).get(subject)
+
+    def update(self, index: str, fingerprints: dict):
+        """Record the fingerprints (by subject) of records Search has ingested"""
+        if fingerprints:
+            self.modify(lambda stored: stored.setdefault(index, {}).update(fingerprints))
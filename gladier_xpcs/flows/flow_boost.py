@@ -7,7 +7,9 @@ Summary: This flow executes new xpcs_boost CPU/GPU flow.
 - Nodes are "warmed"
 - Boost Multitau and/or Twotime is applied using CPU/GPU
 - Plots are made
+- Relaxation times and contrast are fit for every q bin
 - Gather + Publish the final data to the portal
+- Profiles are transferred back, if compute functions were profiled
 """
 import os
 from gladier import GladierBaseClient, generate_flow_definition, utils
@@ -31,8 +33,11 @@ class XPCSBoost(GladierBaseClient):
         'gladier_xpcs.tools.BoostCorr',
         'gladier_xpcs.tools.ResultTransfer',
         'gladier_xpcs.tools.MakeCorrPlots',
+        # Fit relaxation times and contrast, published as searchable fields
+        'gladier_xpcs.tools.FitCorrelation',
         'gladier_xpcs.tools.gather_xpcs_metadata.GatherXPCSMetadata',
         # Publication is currently broken due to the destination collection being down.
         # Uncomment this to re-enable
         # 'gladier_tools.publish.Publishv2',
+        'gladier_xpcs.tools.ProfileTransfer',
     ]
@@ -71,6 +71,8 @@ class XPCSReprocessingFlow(GladierBaseClient):
                 # Extra groups can be specified here. The XPCS Admins group will always
                 # be provided automatically.
                 'groups': dep_input.get('groups', []),
+                # Shared by every publish from this deployment, so each ACL is created once
+                'acl_state_file': str(staging_dir / 'acl_state.json'),
             },
             'hdf_file_source': str(hdf_source),
             'imm_file_source': str(imm_source),
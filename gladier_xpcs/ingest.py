@@ -0,0 +1,192 @@
+"""
+Ingest many published datasets into Globus Search at once.
+
+Each flow normally ends by ingesting its own search document, which for a reprocessing
+campaign means thousands of single-document Search tasks, each polled by Flows. Instead,
+flows can be run without ingesting (publishv2 'enable_publish': False), and their
+documents ingested afterwards from the xpcs_metadata.json each one leaves in its proc_dir.
+
+Documents are built by the same function Publishv2 uses, so records are identical to the
+ones a flow would have ingested. They are sent as GMetaList ingests bounded by both a
+number of entries and a size in bytes. All batches are submitted before any are waited
+on, since Search works through queued tasks on its own. If a batch fails, it is split in half and
+each half is ingested again, until every subject in it has either succeeded or failed on
+its own, so each subject is reported separately.
+
+With a FingerprintStore, records Search already holds unchanged are left out, and the
+fingerprints of records which were ingested are stored afterwards.
+"""
+import json
+import logging
+import pathlib
+import time
+
+from gladier_xpcs.fingerprint import FINGERPRINT_FIELD, get_fingerprint
+
+log = logging.getLogger(__name__)
+
+METADATA_FILENAME = 'xpcs_metadata.json'
+# Search rejects ingest documents over 10 MB, leave some room for the GMetaList wrapper
+MAX_BATCH_BYTES = 9 * 1024 ** 2
+MAX_BATCH_ENTRIES = 100
+POLL_INTERVAL = 5
+TASK_TIMEOUT = 60 * 60
+
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'
+UNCHANGED = 'UNCHANGED'
+TASK_DONE_STATES = [SUCCESS, FAILED]
+
+
+def find_metadata_file(proc_dir) -> pathlib.Path:
+    """gather_xpcs_metadata writes the metadata file next to the result HDF, which is
+    normally proc_dir/output. Returns None if it hasn't been written."""
+    proc_dir = pathlib.Path(proc_dir)
+    expected = proc_dir / 'output' / METADATA_FILENAME
+    if expected.exists():
+        return expected
+    return next(proc_dir.rglob(METADATA_FILENAME), None)
+
+
+def get_publish_input(proc_dir, publishv2: dict) -> dict:
+    """publishv2 input for a dataset, as gather_xpcs_metadata would have returned it.
+    publishv2 holds the settings shared by every dataset (collections, index, visible_to,
+    and the base destination)."""
+    metadata_file = find_metadata_file(proc_dir)
+    if metadata_file is None:
+        raise FileNotFoundError(f'No {METADATA_FILENAME} found in {proc_dir}')
+    project_metadata = json.loads(metadata_file.read_text())['project_metadata']
+    return dict(
+        publishv2,
+        dataset=str(proc_dir),
+        destination=str(pathlib.Path(publishv2['destination']) / project_metadata['aps_cycle_v2']),
+        metadata_file=str(metadata_file),
+    )
+
+
+def gather_entry(publish_input: dict) -> dict:
+    """Build the GMetaEntry for a dataset, with the same content Publishv2 would ingest"""
+    from gladier_tools.publish.publishv2 import publishv2_gather_metadata
+    search = publishv2_gather_metadata(**publish_input)['search']
+    return {
+        'subject': search['subject'],
+        'id': search['id'],
+        'visible_to': search['visible_to'],
+        'content': search['content'],
+    }
+
+
+def get_entry_size(entry: dict) -> int:
+    return len(json.dumps(entry).encode('utf-8'))
+
+
+def batch_entries(entries: list, max_entries: int = MAX_BATCH_ENTRIES,
+                  max_bytes: int = MAX_BATCH_BYTES):
+    """Yield lists of entries, each with at most max_entries entries and max_bytes bytes.
+    An entry larger than max_bytes on its own is still yielded alone, so Search can report
+    it as failed."""
+    batch, batch_bytes = [], 0
+    for entry in entries:
+        size = get_entry_size(entry)
+        if batch and (len(batch) >= max_entries or batch_bytes + size > max_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(entry)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def get_gmeta_list(entries: list) -> dict:
+    return {
+        'ingest_type': 'GMetaList',
+        'ingest_data': {'gmeta': entries},
+    }
+
+
+def submit_batch(search_client, index: str, entries: list) -> dict:
+    """Submit a batch, returning its task id, or the error if Search refused it outright"""
+    import globus_sdk
+    try:
+        return {'task_id': search_client.ingest(index, get_gmeta_list(entries))['task_id']}
+    except globus_sdk.SearchAPIError as sapie:
+        return {'error': f'{sapie.http_status} {sapie.code}: {sapie.message}'}
+
+
+def wait_for_tasks(search_client, task_ids: list, poll_interval: float = POLL_INTERVAL,
+                   timeout: float = TASK_TIMEOUT) -> dict:
+    """Wait for every task to finish, returning each task by id. Tasks still running at
+    the timeout are returned as they are."""
+    tasks, pending = {}, list(task_ids)
+    deadline = time.time() + timeout
+    while pending:
+        for task_id in list(pending):
+            tasks[task_id] = search_client.get_task(task_id).data
+            if tasks[task_id]['state'] in TASK_DONE_STATES:
+                pending.remove(task_id)
+        if pending:
+            if time.time() >= deadline:
+                break
+            time.sleep(poll_interval)
+    return tasks
+
+
+def ingest(search_client, index: str, entries: list, max_entries: int = MAX_BATCH_ENTRIES,
+           max_bytes: int = MAX_BATCH_BYTES, poll_interval: float = POLL_INTERVAL,
+           timeout: float = TASK_TIMEOUT) -> dict:
+    """Ingest entries in bounded batches. Returns a result for each subject, with its
+    'status', the 'task_id' which ingested it, and any 'error'. The status is SUCCESS or
+    FAILED, or the state of the task if it was still running at the timeout."""
+    results = {}
+    batches = list(batch_entries(entries, max_entries, max_bytes))
+    deadline = time.time() + timeout
+    while batches:
+        submitted = [(batch, submit_batch(search_client, index, batch)) for batch in batches]
+        task_ids = [s['task_id'] for _, s in submitted if 'task_id' in s]
+        tasks = wait_for_tasks(search_client, task_ids, poll_interval, max(deadline - time.time(), 0))
+        batches = []
+        for batch, submission in submitted:
+            task = tasks.get(submission.get('task_id'), {})
+            # Refused outright, or failed once ingested
+            failed = 'error' in submission or task.get('state') == FAILED
+            if failed and len(batch) > 1:
+                # Find which subjects caused the failure
+                log.info(f'Batch of {len(batch)} failed, retrying in halves')
+                batches.extend([batch[:len(batch) // 2], batch[len(batch) // 2:]])
+                continue
+            result = {
+                'status': FAILED if failed else task['state'],
+                'task_id': submission.get('task_id'),
+                'error': submission.get('error') or task.get('message') if failed else None,
+            }
+            for entry in batch:
+                results[entry['subject']] = dict(result)
+        if time.time() >= deadline:
+            for batch in batches:
+                for entry in batch:
+                    results[entry['subject']] = {'status': FAILED, 'task_id': None,
+                                                 'error': 'Timed out before retrying'}
+            break
+    return results
+
+
+def get_entry_fingerprint(entry: dict) -> str:
+    """The fingerprint gather_xpcs_metadata stored in the record, or a new one for records
+    gathered before fingerprints were added"""
+    return entry['content'].get('project_metadata', {}).get(FINGERPRINT_FIELD) or get_fingerprint(entry['content'])
+
+
+def split_unchanged(entries: list, store, index: str) -> tuple:
+    """Split entries into those to ingest, and those Search already holds unchanged"""
+    stored = store.load().get(index, {})
+    changed, unchanged = [], []
+    for entry in entries:
+        unchanged_entry = stored.get(entry['subject']) == get_entry_fingerprint(entry)
+        (unchanged if unchanged_entry else changed).append(entry)
+    return changed, unchanged
+
+
+def record_ingested(store, index: str, entries: list, results: dict):
+    """Store the fingerprints of entries which were ingested"""
+    store.update(index, {e['subject']: get_entry_fingerprint(e) for e in entries
+                         if results.get(e['subject'], {}).get('status') == SUCCESS})
@@ -0,0 +1,134 @@
+"""
+Derive per-state latencies from Globus Flows run logs.
+
+Each state in a run logs a '*Started' entry and a '*Completed' (or '*Failed') entry
+with a timestamp. Pairing those gives how long each state took, which can then be
+summarized across many runs to find where a dataset's wall time goes.
+"""
+import collections
+import datetime
+import math
+from gladier_xpcs.deployments import deployment_map
+
+TOTAL = 'Total'
+PERCENTILES = [50, 95, 99]
+END_SUFFIXES = ('Completed', 'Failed', 'Timeout', 'Succeeded')
+
+
+def parse_time(timestamp: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+
+def find_key(data, key):
+    """Recursively search nested dicts/lists for the first value stored under key"""
+    if isinstance(data, dict):
+        if key in data:
+            return data[key]
+        data = list(data.values())
+    if isinstance(data, list):
+        for item in data:
+            found = find_key(item, key)
+            if found is not None:
+                return found
+    return None
+
+
+def get_flow_input(run_log_entries: list) -> dict:
+    for entry in run_log_entries:
+        if entry.get('code') == 'FlowStarted':
+            return entry.get('details', {}).get('input', {})
+    return {}
+
+
+def get_deployment_name(flow_input: dict) -> str:
+    """Guess which deployment a run used. Several deployments share compute endpoints,
+    so the source collection is used to tell them apart where it was set."""
+    fi = flow_input.get('input', {})
+    compute = fi.get('compute_endpoint')
+    source = fi.get('source_transfer', {}).get('source_endpoint_id')
+    candidates = [
+        name for name, dep in deployment_map.items()
+        if compute and dep.compute_endpoints.get('compute_endpoint') == compute
+    ]
+    for name in candidates:
+        dep = deployment_map[name]
+        if source and dep.source_collection and dep.source_collection.uuid == source:
+            return name
+    return candidates[0] if candidates else 'unknown'
+
+
+def get_state_durations(run_log_entries: list) -> list:
+    """Pair the start and end entries for each state in a run.
+
+    Compute states which report 'execution_time_seconds' (xpcs_boost_corr) are
+    additionally split into time spent waiting for a node and time spent running,
+    since the difference is mostly scheduler queue time."""
+    started = {}
+    durations = []
+    for entry in run_log_entries:
+        code = entry.get('code', '')
+        details = entry.get('details') or {}
+        state = details.get('state_name')
+        if code in ('FlowStarted', 'FlowSucceeded', 'FlowFailed'):
+            state = TOTAL
+        if not state or not entry.get('time'):
+            continue
+
+        if code.endswith('Started'):
+            started[state] = parse_time(entry['time'])
+        elif code.endswith(END_SUFFIXES) and state in started:
+            start, end = started.pop(state), parse_time(entry['time'])
+            seconds = (end - start).total_seconds()
+            durations.append({
+                'state': state,
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'seconds': seconds,
+                'status': 'FAILED' if code.endswith(('Failed', 'Timeout')) else 'SUCCEEDED',
+            })
+            # Output holds the whole flow state, so only look at the result of this state
+            execution_time = find_key((details.get('output') or {}).get(state), 'execution_time_seconds')
+            if state != TOTAL and isinstance(execution_time, (int, float)):
+                durations.append(dict(durations[-1], state=f'{state} (queue wait)',
+                                      seconds=max(seconds - execution_time, 0)))
+                durations.append(dict(durations[-2], state=f'{state} (execution)',
+                                      seconds=execution_time))
+    return durations
+
+
+def get_run_timings(run: dict, run_log_entries: list) -> dict:
+    """Build a compact, cacheable record of a single run's state durations"""
+    return {
+        'run_id': run['run_id'],
+        'label': run.get('label'),
+        'day': parse_time(run['start_time']).date().isoformat(),
+        'deployment': get_deployment_name(get_flow_input(run_log_entries)),
+        'states': get_state_durations(run_log_entries),
+    }
+
+
+def percentile(values: list, pct: float) -> float:
+    """Linearly interpolated percentile, the same as numpy.percentile's default"""
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(run_timings: list, group_by=('deployment', 'day', 'state')) -> list:
+    """Summarize state durations across many runs. Returns one row per group,
+    with a count, mean and each of the PERCENTILES in seconds."""
+    groups = collections.defaultdict(list)
+    for timings in run_timings:
+        for state in timings['states']:
+            row = dict(timings, **state)
+            groups[tuple(row[g] for g in group_by)].append(state['seconds'])
+
+    summary = []
+    for key, seconds in sorted(groups.items()):
+        row = dict(zip(group_by, key))
+        row['count'] = len(seconds)
+        row['mean'] = round(sum(seconds) / len(seconds), 2)
+        row.update({f'p{p}': round(percentile(seconds, p), 2) for p in PERCENTILES})
+        summary.append(row)
+    return summary
@@ -0,0 +1,165 @@
+"""
+Replay beamline sample lists at a realistic cadence, and report sustained throughput.
+
+Datasets don't arrive at a fixed rate. A series of measurements on one sample tends to
+come in back to back, followed by a pause while the sample is changed. Each of the
+INTERARRIVALS distributions generates the gaps between datasets, with the same mean
+so runs with different distributions are comparable.
+
+Compute functions are replaced by SIMULATED_FUNCTIONS when running against the local
+emulator, which sleep for a configured time per stage instead of running boost_corr.
+
+See scripts/xpcs_load_test.py.
+"""
+import math
+import random
+
+from gladier_xpcs import latency
+
+# Within a burst, datasets arrive this fraction of the mean interval apart
+BURST_INTERVAL_FRACTION = 0.25
+
+
+def parse_sample(line: str) -> dict:
+    """Parse a line of DM style 'key:value' arguments, as found in samples_dm.txt"""
+    return dict(token.split(':', 1) for token in line.split() if ':' in token)
+
+
+def fixed_intervals(rng: random.Random, count: int, mean: float, **kwargs) -> list:
+    return [mean] * count
+
+
+def exponential_intervals(rng: random.Random, count: int, mean: float, **kwargs) -> list:
+    """Poisson arrivals, for datasets which arrive independently of each other"""
+    return [rng.expovariate(1 / mean) for _ in range(count)]
+
+
+def lognormal_intervals(rng: random.Random, count: int, mean: float, sigma: float = 0.5, **kwargs) -> list:
+    """Mostly regular intervals with a long tail, like a user stepping through a series
+    with the occasional realignment"""
+    mu = math.log(mean) - sigma ** 2 / 2
+    return [rng.lognormvariate(mu, sigma) for _ in range(count)]
+
+
+def burst_intervals(rng: random.Random, count: int, mean: float, burst_size: int = 10, **kwargs) -> list:
+    """Series of burst_size datasets arriving close together, separated by a pause long
+    enough to keep the overall mean interval"""
+    short = mean * BURST_INTERVAL_FRACTION
+    pause = mean * burst_size - short * (burst_size - 1)
+    return [pause if idx % burst_size == 0 else rng.expovariate(1 / short) for idx in range(count)]
+
+
+INTERARRIVALS = {
+    'fixed': fixed_intervals,
+    'exponential': exponential_intervals,
+    'lognormal': lognormal_intervals,
+    'burst': burst_intervals,
+}
+
+
+def get_arrival_offsets(distribution: str, count: int, mean: float, seed: int = None, **kwargs) -> list:
+    """Seconds from the start of the test at which each dataset arrives. The first
+    dataset always arrives immediately."""
+    intervals = INTERARRIVALS[distribution](random.Random(seed), count, mean, **kwargs)
+    offsets, offset = [], 0.0
+    for interval in [0] + intervals[1:]:
+        offset += interval
+        offsets.append(offset)
+    return offsets
+
+
+def simulate_stage(stage: str, data: dict) -> float:
+    import time
+    seconds = data.get('simulated_seconds', {}).get(stage, 0)
+    time.sleep(seconds)
+    return seconds
+
+
+def simulated_xpcs_boost_corr(**data):
+    """Stand in for boost_corr by copying the metadata file to where the result goes"""
+    import os
+    import shutil
+    from gladier_xpcs.loadgen import simulate_stage
+
+    os.makedirs(os.path.dirname(data['hdf_file']), exist_ok=True)
+    shutil.copy(data['metadata_file'], data['hdf_file'])
+    return {
+        'result': 'SUCCESS',
+        'proc_dir': data['proc_dir'],
+        'execution_time_seconds': simulate_stage('xpcs_boost_corr', data),
+    }
+
+
+def simulated_make_corr_plots(**data):
+    from gladier_xpcs.loadgen import simulate_stage
+    simulate_stage('make_corr_plots', data)
+    return {'plots': []}
+
+
+def simulated_fit_correlation(**data):
+    from gladier_xpcs.loadgen import simulate_stage
+    simulate_stage('fit_correlation', data)
+    return {'fitted_bins': 0}
+
+
+def simulated_gather_xpcs_metadata(**data):
+    from gladier_xpcs.loadgen import simulate_stage
+    simulate_stage('gather_xpcs_metadata', data)
+    return {'proc_dir': data['proc_dir']}
+
+
+SIMULATED_FUNCTIONS = {
+    'xpcs_boost_corr_function_id': simulated_xpcs_boost_corr,
+    'make_corr_plots_function_id': simulated_make_corr_plots,
+    'fit_correlation_function_id': simulated_fit_correlation,
+    'gather_xpcs_metadata_function_id': simulated_gather_xpcs_metadata,
+}
+
+
+def get_queue_delay(arrival: float, run_log_entries: list) -> float:
+    """Seconds from when a dataset arrived until the first state of its run started"""
+    for entry in run_log_entries:
+        details = entry.get('details') or {}
+        if entry.get('code', '').endswith('Started') and details.get('state_name'):
+            return max(latency.parse_time(entry['time']).timestamp() - arrival, 0)
+    return None
+
+
+def get_percentiles(values: list) -> dict:
+    return {f'p{p}': round(latency.percentile(values, p), 2) if values else None
+            for p in latency.PERCENTILES}
+
+
+def summarize_load(results: list) -> dict:
+    """Summarize a load test. Each result is a dict with the dataset 'arrival' time (epoch
+    seconds), and the 'run' and 'run_logs' for the dataset once it has finished."""
+    succeeded = [r for r in results if r['run']['status'] == 'SUCCEEDED']
+    completions = [latency.parse_time(r['run']['completion_time']).timestamp()
+                   for r in results if r['run'].get('completion_time')]
+    elapsed = max(completions) - min(r['arrival'] for r in results) if completions else 0
+    delays = [d for d in (get_queue_delay(r['arrival'], r['run_logs']) for r in results) if d is not None]
+    timings = [latency.get_run_timings(r['run'], r['run_logs']) for r in succeeded]
+    return {
+        'datasets': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'elapsed_seconds': round(elapsed, 2),
+        'datasets_per_hour': round(len(succeeded) / elapsed * 3600, 2) if elapsed else None,
+        'queue_delay': get_percentiles(delays),
+        'stages': latency.summarize(timings, group_by=('state',)),
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f'Datasets: {report["datasets"]} ({report["succeeded"]} succeeded, {report["failed"]} failed) '
+        f'in {report["elapsed_seconds"]}s',
+        f'Throughput: {report["datasets_per_hour"]} datasets/hour',
+        'Queueing delay (s): ' + ', '.join(f'{k} {v}' for k, v in report['queue_delay'].items()),
+        '',
+        f'{"State":<40}{"Count":>8}{"Mean":>10}' + ''.join(f'{f"p{p}":>10}' for p in latency.PERCENTILES),
+    ]
+    for row in report['stages']:
+        lines.append(f'{row["state"]:<40}{row["count"]:>8}{row["mean"]:>10}' +
+                     ''.join(f'{row[f"p{p}"]:>10}' for p in latency.PERCENTILES))
+    return '\n'.join(lines)
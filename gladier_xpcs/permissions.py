@@ -0,0 +1,43 @@
+"""
+Make each permission change once, instead of once per dataset.
+
+The DM workflow used to run dm-restore-permissions over the experiment's results for
+every job. PermissionState records restores in a JSON file shared by every job on the
+same filesystem. The first job for an experiment in each window claims the restore and
+runs it. Jobs in the rest of the window skip it and mark the experiment pending. The
+next claim after the window covers everything skipped, and get_pending_restores() lists
+experiments whose last jobs were skipped, so they can be flushed (ex: from cron).
+
+Publishes record the read ACLs they create on cycle/group folders the same way, under
+'acls'. Compute endpoints don't have gladier_xpcs, so that's done inside the publish
+compute functions in gladier_xpcs/tools/publish.py.
+"""
+import time
+
+from gladier_xpcs.state import JSONStateFile
+
+RESTORE_WINDOW_SECONDS = 10 * 60
+
+
+class PermissionState(JSONStateFile):
+
+    def claim_restore(self, experiment: str, window: float = RESTORE_WINDOW_SECONDS,
+                      now: float = None) -> bool:
+        """True if the caller should restore permissions for the experiment now. Otherwise
+        the experiment is marked pending, for the next claim or flush to cover."""
+        now = time.time() if now is None else now
+
+        def claim(state):
+            restore = state.setdefault('restores', {}).setdefault(experiment, {'last': None, 'pending': False})
+            if restore['last'] is not None and now - restore['last'] < window:
+                restore['pending'] = True
+                return False
+            restore.update(last=now, pending=False)
+            return True
+        return self.modify(claim)
+
+    def get_pending_restores(self, window: float = RESTORE_WINDOW_SECONDS, now: float = None) -> list:
+        """Experiments with skipped restores, whose window has passed"""
+        now = time.time() if now is None else now
+        return sorted(experiment for experiment, restore in self.load().get('restores', {}).items()
+                      if restore['pending'] and now - restore['last'] >= window)
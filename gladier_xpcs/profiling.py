@@ -0,0 +1,24 @@
+"""
+Opt-in profiling for compute functions.
+
+Setting ``profile: true`` in the flow input runs compute functions under a profiler.
+Profiles are written next to the dataset proc_dir rather than inside it, to
+``.profiles/<dataset>``, so they aren't published with the dataset. The ProfileTransfer
+tool sends them back with the results at the end of the flow, so a slow stage can be
+looked at after the fact.
+
+Endpoints aren't required to have gladier_xpcs installed, so compute functions profile
+themselves rather than importing this. Python functions are profiled with cProfile.
+Stages which shell out to another program (like boost_corr) are profiled with py-spy,
+if it is on the PATH. Profile locations here must match those in the compute functions.
+"""
+import pathlib
+
+PROFILE_DIRNAME = '.profiles'
+
+
+def get_profile_dir(proc_dir: str) -> pathlib.Path:
+    """Profiles for a dataset, in a hidden directory beside its proc_dir. Publishing a
+    dataset publishes everything in its proc_dir."""
+    proc_dir = pathlib.Path(proc_dir)
+    return proc_dir.parent / PROFILE_DIRNAME / proc_dir.name
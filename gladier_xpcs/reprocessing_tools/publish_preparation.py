@@ -5,35 +5,73 @@ def publish_preparation(**event):
     """Rename proc_dir and hdf_file with the reprocessing_suffix,
     delete the qmap file, and add reprocessing metadata to pilot"""
     import pathlib
+    import contextlib
+    import os
+    import resource
+    import socket
+    import sys
+    import time
 
-    # Delete the qmap file (it's just clutter, we don't want to upload it)
-    if event.get('delete_qmap') is True:
-        pathlib.Path(event.get('qmap_file')).unlink(missing_ok=False)
-
-    # .../A001_Aerogel_1mm_att6_Lq0_001_0001-1000/A001_Aerogel_1mm_att6_Lq0_001_0001-1000.hdf
-    hdf = pathlib.Path(event['hdf_file'])
-    # A001_Aerogel_1mm_att6_Lq0_001_0001-1000<reprocessing_suffix>
-    new_hdf_name = f'{str(hdf.with_suffix("").name)}{event["reprocessing_suffix"]}.hdf'
-
-    proc_dir = pathlib.Path(event['proc_dir'])
-    # Rename the HDF first before the dataset (parent) directory changes
-    # .../A001_Aerogel_1mm_att6_Lq0_001_0001-1000<reprocessing_suffix>.hdf
-    new_hdf = hdf.rename(proc_dir / new_hdf_name)
-    # Rename the parent dataset directory
-    new_proc_dir = proc_dir.rename(proc_dir.parent / new_hdf.with_suffix('').name)
-    # Prepend the new dataset (parent) directory to the HDF Filename
-    new_hdf_with_new_proc_dir = new_proc_dir / new_hdf.name
-
-    names = {
-        'proc_dir': str(proc_dir),
-        'new_proc_dir': str(new_proc_dir),
-        'new_hdf_with_new_dataset_dir': str(new_hdf_with_new_proc_dir),
-        'hdf': str(hdf),
-        'new_hdf': str(new_hdf),
-        'new_hdf_name': str(new_hdf_name),
-    }
-    if not new_proc_dir.exists() or not new_hdf_with_new_proc_dir.exists():
-        raise FileNotFoundError(f'File does not exist after rename: {names}')
+    @contextlib.contextmanager
+    def account(name):
+        """Record the wall time, CPU time, peak memory and storage I/O of this process
+        and the children it has waited on inside this context, in the dict it yields"""
+        def usage():
+            rusage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            if os.path.exists('/proc/self/io'):
+                with open('/proc/self/io') as f:
+                    io = dict(line.split(': ') for line in f.read().splitlines())
+                read, written = int(io['read_bytes']), int(io['write_bytes'])
+            else:
+                read = sum(u.ru_inblock for u in rusage) * 512
+                written = sum(u.ru_oublock for u in rusage) * 512
+            return {'cpu': sum(u.ru_utime + u.ru_stime for u in rusage), 'read': read,
+                    'written': written, 'peak_rss': max(u.ru_maxrss for u in rusage)}
+
+        resources = {'name': name, 'hostname': socket.gethostname()}
+        wall_start, start = time.perf_counter(), usage()
+        try:
+            yield resources
+        finally:
+            end = usage()
+            resources.update({
+                'wall_time_seconds': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_seconds': round(end['cpu'] - start['cpu'], 3),
+                # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+                'peak_rss_bytes': end['peak_rss'] * (1 if sys.platform == 'darwin' else 1024),
+                'bytes_read': end['read'] - start['read'],
+                'bytes_written': end['written'] - start['written'],
+            })
+
+    with account('publish_preparation') as resources:
+        # Delete the qmap file (it's just clutter, we don't want to upload it)
+        if event.get('delete_qmap') is True:
+            pathlib.Path(event.get('qmap_file')).unlink(missing_ok=False)
+
+        # .../A001_Aerogel_1mm_att6_Lq0_001_0001-1000/A001_Aerogel_1mm_att6_Lq0_001_0001-1000.hdf
+        hdf = pathlib.Path(event['hdf_file'])
+        # A001_Aerogel_1mm_att6_Lq0_001_0001-1000<reprocessing_suffix>
+        new_hdf_name = f'{str(hdf.with_suffix("").name)}{event["reprocessing_suffix"]}.hdf'
+
+        proc_dir = pathlib.Path(event['proc_dir'])
+        # Rename the HDF first before the dataset (parent) directory changes
+        # .../A001_Aerogel_1mm_att6_Lq0_001_0001-1000<reprocessing_suffix>.hdf
+        new_hdf = hdf.rename(proc_dir / new_hdf_name)
+        # Rename the parent dataset directory
+        new_proc_dir = proc_dir.rename(proc_dir.parent / new_hdf.with_suffix('').name)
+        # Prepend the new dataset (parent) directory to the HDF Filename
+        new_hdf_with_new_proc_dir = new_proc_dir / new_hdf.name
+
+        names = {
+            'proc_dir': str(proc_dir),
+            'new_proc_dir': str(new_proc_dir),
+            'new_hdf_with_new_dataset_dir': str(new_hdf_with_new_proc_dir),
+            'hdf': str(hdf),
+            'new_hdf': str(new_hdf),
+            'new_hdf_name': str(new_hdf_name),
+        }
+        if not new_proc_dir.exists() or not new_hdf_with_new_proc_dir.exists():
+            raise FileNotFoundError(f'File does not exist after rename: {names}')
 
     # Update metadata
     pilot = event['pilot']
@@ -59,7 +97,8 @@ def publish_preparation(**event):
     event.update({
         'proc_dir': str(new_proc_dir),
         'hdf_file': str(new_hdf_with_new_proc_dir),
-        'pilot': pilot
+        'pilot': pilot,
+        'resources': resources,
     })
     return event
 
@@ -0,0 +1,46 @@
+"""
+Small JSON state files shared by concurrent processes on the same filesystem.
+
+Updates hold an exclusive lock on a sibling '.lock' file for the whole read, change and
+write, and replace the file whole, so readers never see a partial file and two writers
+never lose each other's changes.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import pathlib
+import tempfile
+
+
+class JSONStateFile:
+
+    def __init__(self, filename):
+        self.filename = pathlib.Path(filename).expanduser()
+
+    def load(self) -> dict:
+        try:
+            return json.loads(self.filename.read_text())
+        except FileNotFoundError:
+            return {}
+
+    @contextlib.contextmanager
+    def lock(self):
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        with open(f'{self.filename}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def modify(self, change):
+        """Call change() with the current state, which it may modify in place, and save
+        the state. Returns whatever change() returns."""
+        with self.lock():
+            state = self.load()
+            result = change(state)
+            with tempfile.NamedTemporaryFile('w', dir=self.filename.parent, delete=False) as tmp:
+                json.dump(state, tmp, indent=2, sort_keys=True)
+            os.replace(tmp.name, self.filename)
+        return result
@@ -2,10 +2,12 @@ from .transfer_from_clutch_to_theta import TransferFromClutchToTheta
 from .pre_publish import PrePublish
 from .source_transfer import SourceTransfer
 from .result_transfer import ResultTransfer
+from .profile_transfer import ProfileTransfer
 from .eigen_corr import EigenCorr
 from .xpcs_boost_corr import BoostCorr
 
 from .plot import MakeCorrPlots
+from .fit_corr import FitCorrelation
 from .gather_xpcs_metadata import GatherXPCSMetadata
 from .publish import Publish
 from .acquire_nodes import AcquireNodes
@@ -19,8 +21,10 @@ __all__ = [
     'EigenCorr',
     'BoostCorr',
     'MakeCorrPlots',
+    'FitCorrelation',
     'GatherXPCSMetadata',
     'Publish',
     'AcquireNodes',
-    'ResultTransfer'
+    'ResultTransfer',
+    'ProfileTransfer',
     ]
@@ -2,11 +2,63 @@ from gladier import GladierBaseTool, generate_flow_definition
 
 
 def eigen_corr(**data):
+    """Run the corr executable on hdf_file. Returns a dict with its 'stdout', and the
+    'resources' used."""
     import os
     import h5py
     import subprocess
+    import contextlib
+    import pathlib
+    import shlex
+    import shutil
+    import resource
+    import socket
+    import sys
+    import time
     from subprocess import PIPE
 
+    @contextlib.contextmanager
+    def account(name):
+        """Record the wall time, CPU time, peak memory and storage I/O of this process
+        and the children it has waited on inside this context, in the dict it yields"""
+        def usage():
+            rusage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            if os.path.exists('/proc/self/io'):
+                with open('/proc/self/io') as f:
+                    io = dict(line.split(': ') for line in f.read().splitlines())
+                read, written = int(io['read_bytes']), int(io['write_bytes'])
+            else:
+                read = sum(u.ru_inblock for u in rusage) * 512
+                written = sum(u.ru_oublock for u in rusage) * 512
+            return {'cpu': sum(u.ru_utime + u.ru_stime for u in rusage), 'read': read,
+                    'written': written, 'peak_rss': max(u.ru_maxrss for u in rusage)}
+
+        resources = {'name': name, 'hostname': socket.gethostname()}
+        wall_start, start = time.perf_counter(), usage()
+        try:
+            yield resources
+        finally:
+            end = usage()
+            resources.update({
+                'wall_time_seconds': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_seconds': round(end['cpu'] - start['cpu'], 3),
+                # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+                'peak_rss_bytes': end['peak_rss'] * (1 if sys.platform == 'darwin' else 1024),
+                'bytes_read': end['read'] - start['read'],
+                'bytes_written': end['written'] - start['written'],
+            })
+
+    def profile_command(cmd, name):
+        """Wrap a shell command to be recorded by py-spy, if the flow input sets 'profile'
+        and py-spy is on the PATH. Written beside the proc_dir like other profiles."""
+        py_spy = shutil.which('py-spy')
+        if not profile_enabled or not py_spy:
+            return cmd
+        profile_dir = pathlib.Path(proc_dir).parent / '.profiles' / pathlib.Path(proc_dir).name
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profile_file = shlex.quote(str(profile_dir / f'{name}.speedscope.json'))
+        return f'{py_spy} record --subprocesses --format speedscope -o {profile_file} -- {cmd}'
+
     ##minimal data inputs payload
     proc_dir = data.get('proc_dir') # location of the HDF/QMAP process file / result
 
@@ -15,6 +67,7 @@ def eigen_corr(**data):
 
     ##optional
     corr_loc = data.get('corr_loc', 'corr')
+    profile_enabled = data.get('profile', False)
 
     if not os.path.exists(proc_dir):
         raise NameError(f'{proc_dir} \n Proc dir does not exist!')
@@ -35,8 +88,10 @@ def eigen_corr(**data):
                     f.write(str(e))
 
     cmd = f"{corr_loc} {hdf_file} -imm {imm_file} {flags}"
+    cmd = profile_command(cmd, 'eigen_corr')
   
-    res = subprocess.run(cmd, stdout=PIPE, stderr=PIPE,
+    with account('eigen_corr') as resources:
+        res = subprocess.run(cmd, stdout=PIPE, stderr=PIPE,
                              shell=True, executable='/bin/bash')
     
     with open(os.path.join(proc_dir,'corr_output.log'), 'w+') as f:
@@ -45,7 +100,10 @@ def eigen_corr(**data):
     with open(os.path.join(proc_dir,'corr_errors.log'), 'w+') as f:
                 f.write(res.stderr.decode('utf-8'))
     
-    return str(res.stdout)
+    return {
+        'stdout': str(res.stdout),
+        'resources': resources,
+    }
 
 
 @generate_flow_definition(modifiers={
@@ -0,0 +1,356 @@
+import sys
+import pathlib
+from gladier import GladierBaseTool
+
+
+def fit_correlation(**data):
+    import json
+    import contextlib
+    import cProfile
+    import pathlib
+    import resource
+    import sys
+    import os
+    import socket
+    import time
+    import uuid
+    import h5py
+    import numpy
+
+    # Each q bin is fit to a single exponential decay. For a fixed tau the model is linear
+    # in beta and baseline, so those are solved exactly with weighted least squares. Every
+    # tau on a log spaced grid is tried for every bin at once, as a few matrix products,
+    # and the best tau is then refined between its neighbours. Nothing loops over bins.
+    MODEL = 'g2 = baseline + beta * exp(-2 * delay / tau)'
+    # Bump this when the model or the published fields change.
+    FIT_VERSION = 1
+    FIT_METADATA_FILENAME = 'fit_metadata.json'
+
+    G2 = 'xpcs/multitau/normalized_g2'
+    G2_ERR = 'xpcs/multitau/normalized_g2_err'
+    DELAY = 'xpcs/multitau/delay_list'
+    # Dynamic q values, in the order boost_corr has used them. Correlations are stored
+    # per dynamic bin, q major, so phi bins of the same q sit next to each other.
+    Q_LISTS = ['xpcs/qmap/dynamic_v_list_dim0', 'xpcs/dqlist']
+
+    # Tau is searched from a decade below the first delay to a decade past the last.
+    # Fits which land on either end of the grid have no decay within the measured
+    # delays, and are dropped.
+    GRID_DECADES_PADDING = 1
+    GRID_POINTS_PER_DECADE = 16
+
+    # Inverse angstroms. A bin is published for a reference q if its q is within
+    # REFERENCE_Q_TOLERANCE (as a fraction) of it.
+    REFERENCE_Q = [0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1]
+    REFERENCE_Q_TOLERANCE = 0.1
+    SIGNIFICANT_DIGITS = 6
+
+    @contextlib.contextmanager
+    def account(name):
+        """Record the wall time, CPU time, peak memory and storage I/O of this process
+        and the children it has waited on inside this context, in the dict it yields"""
+        def usage():
+            rusage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            if os.path.exists('/proc/self/io'):
+                with open('/proc/self/io') as f:
+                    io = dict(line.split(': ') for line in f.read().splitlines())
+                read, written = int(io['read_bytes']), int(io['write_bytes'])
+            else:
+                read = sum(u.ru_inblock for u in rusage) * 512
+                written = sum(u.ru_oublock for u in rusage) * 512
+            return {'cpu': sum(u.ru_utime + u.ru_stime for u in rusage), 'read': read,
+                    'written': written, 'peak_rss': max(u.ru_maxrss for u in rusage)}
+
+        resources = {'name': name, 'hostname': socket.gethostname()}
+        wall_start, start = time.perf_counter(), usage()
+        try:
+            yield resources
+        finally:
+            end = usage()
+            resources.update({
+                'wall_time_seconds': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_seconds': round(end['cpu'] - start['cpu'], 3),
+                # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+                'peak_rss_bytes': end['peak_rss'] * (1 if sys.platform == 'darwin' else 1024),
+                'bytes_read': end['read'] - start['read'],
+                'bytes_written': end['written'] - start['written'],
+            })
+
+    @contextlib.contextmanager
+    def profile(name):
+        """Run this context under cProfile if the flow input sets 'profile'. The profile is
+        written to .profiles/<dataset> beside the proc_dir, so it isn't published."""
+        if not data.get('profile'):
+            yield
+            return
+        proc_dir = pathlib.Path(data['proc_dir'])
+        profile_dir = proc_dir.parent / '.profiles' / proc_dir.name
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(profile_dir / f'{name}.prof'))
+
+    def get_weights(g2, g2_err=None):
+        """Inverse variance weights. Points without a usable value or error are given no
+        weight, rather than failing the whole bin."""
+        weights = numpy.ones_like(g2) if g2_err is None else numpy.zeros_like(g2)
+        if g2_err is not None:
+            usable = numpy.isfinite(g2_err) & (g2_err > 0)
+            weights[usable] = 1 / g2_err[usable] ** 2
+        weights[~numpy.isfinite(g2)] = 0
+        return weights
+
+    def solve(basis_sums, sums):
+        """Weighted least squares for beta and baseline, given the sums of the basis f
+        (Sf, Sff, Sfy) and of the data (S, Sy, Syy). Returns beta, baseline and chi2."""
+        sf, sff, sfy = basis_sums
+        s, sy, syy = sums
+        det = s * sff - sf ** 2
+        beta = (s * sfy - sf * sy) / det
+        baseline = (sy - beta * sf) / s
+        # The normal equations reduce chi2 to this at the optimum
+        chi2 = syy - baseline * sy - beta * sfy
+        chi2 = numpy.where((beta > 0) & (det > 0), chi2, numpy.inf)
+        return beta, baseline, chi2
+
+    def fit_g2(delay, g2, g2_err=None) -> dict:
+        """Fit every column of g2 (delays x bins) at once. Returns arrays of tau, beta,
+        baseline and chi2 with one value per bin, and 'fitted', which is False for bins
+        without a usable fit. Values of bins which weren't fitted are nan."""
+        delay = numpy.asarray(delay, dtype=float).ravel()
+        g2 = numpy.asarray(g2, dtype=float)
+        if g2.ndim == 1:
+            g2 = g2[:, None]
+        if g2.shape[0] != delay.size and g2.shape[1] == delay.size:
+            g2 = g2.T
+        if g2_err is not None:
+            g2_err = numpy.asarray(g2_err, dtype=float).reshape(g2.shape)
+        weights = get_weights(g2, g2_err)
+        values = numpy.where(weights > 0, g2, 0)
+        weighted = weights * values
+        sums = weights.sum(axis=0), weighted.sum(axis=0), (weighted * values).sum(axis=0)
+
+        positive = delay[delay > 0]
+        low = numpy.log10(positive.min()) - GRID_DECADES_PADDING
+        high = numpy.log10(positive.max()) + GRID_DECADES_PADDING
+        log_grid = numpy.linspace(low, high, int(numpy.ceil((high - low) * GRID_POINTS_PER_DECADE)) + 1)
+        # grid x delays
+        basis = numpy.exp(-2 * delay[None, :] / 10 ** log_grid[:, None])
+
+        with numpy.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            # grid x bins
+            grid_sums = basis @ weights, (basis ** 2) @ weights, basis @ weighted
+            _, _, grid_chi2 = solve(grid_sums, sums)
+            best = numpy.argmin(grid_chi2, axis=0)
+            bins = numpy.arange(g2.shape[1])
+            inside = (best > 0) & (best < log_grid.size - 1)
+
+            # Refine with the vertex of a parabola through the best tau and its neighbours
+            left, right = numpy.clip(best - 1, 0, None), numpy.clip(best + 1, None, log_grid.size - 1)
+            c0, c1, c2 = grid_chi2[left, bins], grid_chi2[best, bins], grid_chi2[right, bins]
+            step = log_grid[1] - log_grid[0]
+            offset = numpy.clip(0.5 * step * (c0 - c2) / (c0 - 2 * c1 + c2), -step, step)
+            offset = numpy.where(inside & numpy.isfinite(offset), offset, 0)
+
+            results = {}
+            for name, log_tau in (('grid', log_grid[best]), ('refined', log_grid[best] + offset)):
+                # delays x bins
+                refined_basis = numpy.exp(-2 * delay[:, None] / 10 ** log_tau[None, :])
+                refined_sums = ((refined_basis * weights).sum(axis=0),
+                                (refined_basis ** 2 * weights).sum(axis=0),
+                                (refined_basis * weighted).sum(axis=0))
+                results[name] = (10 ** log_tau, *solve(refined_sums, sums))
+            use_refined = results['refined'][3] <= results['grid'][3]
+            tau, beta, baseline, chi2 = [numpy.where(use_refined, r, g)
+                                         for r, g in zip(results['refined'], results['grid'])]
+
+        # Three parameters need more than three points
+        fitted = inside & numpy.isfinite(chi2) & ((weights > 0).sum(axis=0) > 3)
+        return {
+            'tau': numpy.where(fitted, tau, numpy.nan),
+            'beta': numpy.where(fitted, beta, numpy.nan),
+            'baseline': numpy.where(fitted, baseline, numpy.nan),
+            'chi2': numpy.where(fitted, chi2, numpy.nan),
+            'fitted': fitted,
+        }
+
+    def get_bin_q(q_list, n_bins: int):
+        """The q of every dynamic bin, or None if it can't be matched to the bins"""
+        if q_list is None:
+            return None
+        q_list = numpy.asarray(q_list, dtype=float).ravel()
+        if q_list.size == 0 or n_bins % q_list.size:
+            return None
+        return numpy.repeat(q_list, n_bins // q_list.size)
+
+    def read_result(hdf_file) -> tuple:
+        """Read delays, g2, g2 errors and dynamic q values from a boost_corr result"""
+        with h5py.File(hdf_file, 'r') as hframe:
+            delay = hframe[DELAY][()]
+            g2 = hframe[G2][()]
+            g2_err = hframe[G2_ERR][()] if G2_ERR in hframe else None
+            q_list = next((hframe[name][()] for name in Q_LISTS if name in hframe), None)
+        return delay, g2, g2_err, q_list
+
+    def fit_result_file(hdf_file) -> tuple:
+        """Fit every bin in a boost_corr result file. Returns the q of each bin (or None)
+        and the fit."""
+        delay, g2, g2_err, q_list = read_result(hdf_file)
+        fit = fit_g2(delay, g2, g2_err)
+        return get_bin_q(q_list, fit['fitted'].size), fit
+
+    def get_reference_q_key(q: float) -> str:
+        """Search field names can't hold '.', so 0.005 becomes q_0p005"""
+        return f'q_{q:g}'.replace('.', 'p').replace('-', 'm')
+
+    def to_number(value):
+        return float(f'{value:.{SIGNIFICANT_DIGITS}g}')
+
+    def get_fit_metadata(q, fit: dict) -> dict:
+        """Metadata published under project_metadata['fit']. Only bins with a usable fit are
+        listed, and bins are left out of 'bins' entirely rather than published as null."""
+        fitted = fit['fitted']
+        metadata = {
+            'model': MODEL,
+            'version': FIT_VERSION,
+            'fitted_bins': int(fitted.sum()),
+            'total_bins': int(fitted.size),
+        }
+        if not fitted.any():
+            return metadata
+
+        params = ['tau', 'beta', 'baseline']
+        for param in params:
+            metadata[f'{param}_median'] = to_number(numpy.median(fit[param][fitted]))
+        metadata['tau_min'] = to_number(fit['tau'][fitted].min())
+        metadata['tau_max'] = to_number(fit['tau'][fitted].max())
+        metadata['bins'] = {param: [to_number(v) for v in fit[param][fitted]] for param in params}
+        if q is None:
+            return metadata
+
+        fitted_q = q[fitted]
+        metadata['bins']['q'] = [to_number(v) for v in fitted_q]
+        for reference in REFERENCE_Q:
+            nearest = fitted_q[numpy.argmin(numpy.abs(fitted_q - reference))]
+            if abs(nearest - reference) > REFERENCE_Q_TOLERANCE * reference:
+                continue
+            # Every phi bin at the nearest q
+            same_q = fitted_q == nearest
+            metadata[get_reference_q_key(reference)] = dict(
+                q=to_number(nearest),
+                **{param: to_number(numpy.median(fit[param][fitted][same_q])) for param in params}
+            )
+        return metadata
+
+    @contextlib.contextmanager
+    def span(name, **attributes):
+        """Append a span for this function to trace_spans.jsonl in the proc_dir, in the
+        record format of gladier_xpcs.tracing. Nothing is recorded without a trace_id."""
+        if not data.get('trace_id'):
+            yield attributes
+            return
+        record = {'trace_id': data['trace_id'], 'span_id': uuid.uuid4().hex[:16], 'name': name,
+                  'hostname': socket.gethostname(), 'pid': os.getpid(), 'status': 'OK',
+                  'start': time.time()}
+        try:
+            yield attributes
+        except Exception as e:
+            record['status'], record['error'] = 'ERROR', repr(e)
+            raise
+        finally:
+            record['end'] = time.time()
+            record['duration'] = round(record['end'] - record['start'], 3)
+            record['attributes'] = attributes
+            with open(os.path.join(data['proc_dir'], 'trace_spans.jsonl'), 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    with account('fit_correlation') as resources, \
+            span('fit_correlation') as attributes, \
+            profile('fit_correlation'):
+        q, fit = fit_result_file(data['hdf_file'])
+        metadata = {'fit': get_fit_metadata(q, fit)}
+        attributes['fitted_bins'] = metadata['fit']['fitted_bins']
+
+    # Merged into the published metadata by gather_xpcs_metadata
+    fit_metadata_file = data.get('fit_metadata_file') or os.path.join(data['proc_dir'], FIT_METADATA_FILENAME)
+    with open(fit_metadata_file, 'w') as f:
+        f.write(json.dumps(metadata, indent=2))
+
+    return {
+        'fit_metadata_file': fit_metadata_file,
+        'fitted_bins': metadata['fit']['fitted_bins'],
+        'total_bins': metadata['fit']['total_bins'],
+        'resources': resources,
+    }
+
+
+class FitCorrelation(GladierBaseTool):
+    """Fit relaxation times and contrast for every q bin. Only needs numpy and h5py, and
+    runs in well under a minute. A failed fit doesn't stop the dataset from being
+    published, it's published without one.
+
+    Deployments pin the function ids the portal starts flows with, and runs whose
+    input has no fit_correlation_function_id skip the fit instead of failing."""
+
+    flow_definition = {
+        'Comment': 'Fit relaxation times and contrast of the correlation results',
+        'StartAt': 'FitCorrelationChoice',
+        'States': {
+            'FitCorrelationChoice': {
+                'Comment': 'Skip the fit if this run has no fit_correlation function',
+                'Type': 'Choice',
+                'Choices': [{
+                    'Variable': '$.input.fit_correlation_function_id',
+                    'IsPresent': True,
+                    'Next': 'FitCorrelation',
+                }],
+                'Default': 'FitCorrelationSkip',
+            },
+            'FitCorrelation': {
+                'Comment': 'Fit the correlation results on the login node',
+                'Type': 'Action',
+                'ActionUrl': 'https://compute.actions.globus.org',
+                'ExceptionOnActionFailure': False,
+                'Parameters': {
+                    'tasks': [{
+                        'endpoint.$': '$.input.login_node_endpoint',
+                        'function.$': '$.input.fit_correlation_function_id',
+                        'payload.$': '$.input',
+                    }]
+                },
+                'ResultPath': '$.FitCorrelation',
+                'WaitTime': 300,
+                'Next': 'FitCorrelationDone',
+            },
+            'FitCorrelationSkip': {
+                'Comment': 'No fit_correlation function was given, the dataset is published without a fit',
+                'Type': 'Pass',
+                'Next': 'FitCorrelationDone',
+            },
+            'FitCorrelationDone': {
+                'Comment': 'Fit Correlation has finished execution',
+                'Type': 'Pass',
+                'End': True,
+            },
+        }
+    }
+
+    required_input = [
+        'proc_dir',
+        'hdf_file',
+    ]
+
+    compute_functions = [
+        fit_correlation
+    ]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print('Usage: python fit_corr.py my_file.hdf')
+    input_file = pathlib.Path(sys.argv[1]).absolute()
+    print(fit_correlation(proc_dir=str(input_file.parent), hdf_file=str(input_file)))
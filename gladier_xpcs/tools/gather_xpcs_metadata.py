@@ -11,6 +11,85 @@ def gather_xpcs_metadata(**data):
     import h5py
     import copy
     import numpy
+    import contextlib
+    import cProfile
+    import resource
+    import sys
+    import uuid
+    import time
+    import socket
+    import hashlib
+
+    @contextlib.contextmanager
+    def account(name):
+        """Record the wall time, CPU time, peak memory and storage I/O of this process
+        and the children it has waited on inside this context, in the dict it yields"""
+        def usage():
+            rusage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            if os.path.exists('/proc/self/io'):
+                with open('/proc/self/io') as f:
+                    io = dict(line.split(': ') for line in f.read().splitlines())
+                read, written = int(io['read_bytes']), int(io['write_bytes'])
+            else:
+                read = sum(u.ru_inblock for u in rusage) * 512
+                written = sum(u.ru_oublock for u in rusage) * 512
+            return {'cpu': sum(u.ru_utime + u.ru_stime for u in rusage), 'read': read,
+                    'written': written, 'peak_rss': max(u.ru_maxrss for u in rusage)}
+
+        resources = {'name': name, 'hostname': socket.gethostname()}
+        wall_start, start = time.perf_counter(), usage()
+        try:
+            yield resources
+        finally:
+            end = usage()
+            resources.update({
+                'wall_time_seconds': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_seconds': round(end['cpu'] - start['cpu'], 3),
+                # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+                'peak_rss_bytes': end['peak_rss'] * (1 if sys.platform == 'darwin' else 1024),
+                'bytes_read': end['read'] - start['read'],
+                'bytes_written': end['written'] - start['written'],
+            })
+
+    @contextlib.contextmanager
+    def profile(name):
+        """Run this context under cProfile if the flow input sets 'profile'. The profile is
+        written to .profiles/<dataset> beside the proc_dir, so it isn't published."""
+        if not data.get('profile'):
+            yield
+            return
+        proc_dir = pathlib.Path(data['proc_dir'])
+        profile_dir = proc_dir.parent / '.profiles' / proc_dir.name
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(profile_dir / f'{name}.prof'))
+
+    @contextlib.contextmanager
+    def span(name, **attributes):
+        """Append a span for this function to trace_spans.jsonl in the proc_dir, in the
+        record format of gladier_xpcs.tracing. Nothing is recorded without a trace_id."""
+        if not data.get('trace_id'):
+            yield attributes
+            return
+        record = {'trace_id': data['trace_id'], 'span_id': uuid.uuid4().hex[:16], 'name': name,
+                  'hostname': socket.gethostname(), 'pid': os.getpid(), 'status': 'OK',
+                  'start': time.time()}
+        try:
+            yield attributes
+        except Exception as e:
+            record['status'], record['error'] = 'ERROR', repr(e)
+            raise
+        finally:
+            record['end'] = time.time()
+            record['duration'] = round(record['end'] - record['start'], 3)
+            record['attributes'] = attributes
+            with open(os.path.join(data['proc_dir'], 'trace_spans.jsonl'), 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
 
     # These are the keys we collect with version 2 of the metadata
     # Version 2 refers to July 2024, when 8idi first started to run
@@ -165,10 +244,83 @@ def gather_xpcs_metadata(**data):
         return clean_metadata(metadata, spoiled_keys)
 
 
+    def gather_preview_categories(dataset_dir, extra_files):
+        """Sort every file under dataset_dir, as it will be published, into the preview
+        sections of the portal detail page, so the portal doesn't have to on every page view. The
+        rules are the portal's, in xpcs_portal/xpcs_index/fields.py. Bump 'version' along
+        with PREVIEW_CATEGORIES_VERSION there when they change.
+
+        extra_files are written to dataset_dir after this. Categories hold paths relative
+        to dataset_dir, and 'default_visible' lists the files shown before a user changes
+        any filters."""
+        dataset_dir = pathlib.Path(dataset_dir)
+        files = [pathlib.Path(root) / name for root, _, names in os.walk(dataset_dir) for name in names]
+        files += [pathlib.Path(f) for f in extra_files if dataset_dir in pathlib.Path(f).parents]
+        paths = sorted({f.relative_to(dataset_dir).as_posix() for f in files})
+
+        single_categories = ['listing_preview', 'total_intensity_vs_time_preview']
+        categories = {name: None for name in single_categories}
+        categories.update({name: [] for name in ['correlation_plot_previews', 'correlation_plot_with_fit_previews',
+                                                 'intensity_plot_previews', 'text_outputs',
+                                                 'structural_analysis_prev']})
+        for path in paths:
+            matched = [name for name, is_match in [
+                ('listing_preview', path.endswith('scattering_pattern_log.png')),
+                ('total_intensity_vs_time_preview', path.endswith('total_intensity_vs_time.png')),
+                ('correlation_plot_previews', 'g2_corr' in path and 'g2_corr_fit' not in path),
+                ('correlation_plot_with_fit_previews', 'g2_corr_fit' in path or path.endswith('_corr_params.png')),
+                ('intensity_plot_previews', path.endswith(('intensity.png', 'intensity_t.png'))),
+                # Logs are published with the text/x-log mime type
+                ('text_outputs', path.endswith('.log')),
+            ] if is_match]
+            # Only the first listing and total intensity previews are used
+            matched = [name for name in matched if name not in single_categories or categories[name] is None]
+            for name in matched:
+                if name in single_categories:
+                    categories[name] = path
+                else:
+                    categories[name].append(path)
+            if not matched:
+                categories['structural_analysis_prev'].append(path)
+
+        # SHOW_BY_DEFAULT in xpcs_portal/xpcs_index/filter_regexes.py
+        show_by_default = re.compile(r'scattering_pattern_log.png|total_intensity_vs_time.png|'
+                                     r'.+_g2_corr_fit000_008.png|.+_intensity.png|.+_intensity_t.png')
+        categories['default_visible'] = [path for path in paths
+                                         if show_by_default.match(pathlib.PurePosixPath(path).name)]
+        categories['version'] = 1
+        return categories
+
+
+    def get_fingerprint(metadata):
+        """A stable fingerprint of the record, so xpcs_batch_ingest.py can skip records
+        which haven't changed. Fields which change on every run without the data changing
+        are left out. This must match get_fingerprint() in gladier_xpcs/fingerprint.py,
+        bump the version in both when the fields change."""
+        volatile_fields = [
+            ('dc', 'dates'),
+            ('dc', 'publicationYear'),
+            ('project_metadata', 'executable', 'execution_time_seconds'),
+            ('project_metadata', 'metadata_fingerprint'),
+        ]
+        stable = copy.deepcopy({k: metadata.get(k) for k in ('dc', 'project_metadata')})
+        for path in volatile_fields:
+            parent = stable
+            for key in path[:-1]:
+                parent = parent.get(key) if isinstance(parent, dict) else None
+            if isinstance(parent, dict):
+                parent.pop(path[-1], None)
+        document = json.dumps(stable, sort_keys=True, separators=(',', ':'), default=str)
+        return f'v1:{hashlib.sha256(document.encode("utf-8")).hexdigest()}'
+
+
     # Generate metadata
     hdf_file = data['hdf_file']
     exp_name = pathlib.Path(hdf_file).name.replace(".hdf", "")
-    gathered_metadata = gather(hdf_file)
+    with account('gather_xpcs_metadata') as resources, \
+            span('gather_xpcs_metadata'), \
+            profile('gather_xpcs_metadata'):
+        gathered_metadata = gather(hdf_file)
     dc_metadata = {
         'descriptions': [{
             "description": f"{exp_name}: Automated data processing.",
@@ -233,12 +385,24 @@ def gather_xpcs_metadata(**data):
             project_metadata.update(json.load(f))
         os.unlink(data['execution_metadata_file'])
 
+    # Written by fit_correlation, if it ran and succeeded, under the same name
+    fit_metadata_file = data.get('fit_metadata_file') or os.path.join(data['proc_dir'], 'fit_metadata.json')
+    if os.path.exists(fit_metadata_file):
+        with open(fit_metadata_file) as f:
+            project_metadata.update(json.load(f))
+        os.unlink(fit_metadata_file)
+
+    metadata_file = pathlib.Path(hdf_file).parent / "xpcs_metadata.json"
+    # Classify the output files once here, so the portal doesn't on every page view
+    project_metadata['preview_categories'] = gather_preview_categories(
+        data['publishv2'].get('dataset', data['proc_dir']), extra_files=[metadata_file])
+
     metadata = {
         "dc": dc_metadata,
         "project_metadata": project_metadata,
     }
+    project_metadata['metadata_fingerprint'] = get_fingerprint(metadata)
 
-    metadata_file = pathlib.Path(hdf_file).parent / "xpcs_metadata.json"
     with open(metadata_file, 'w') as f:
         json.dump(metadata, f, indent=2)
 
@@ -249,6 +413,7 @@ def gather_xpcs_metadata(**data):
         "destination": str(pathlib.Path(data["publishv2"]["destination"]) / project_metadata["aps_cycle_v2"]),
         "metadata_file": str(metadata_file),
         "unexpected_xpcs_keys": unexpected_xpcs_keys,
+        "resources": resources,
     }
     publish_data = data['publishv2']
     publish_data.update(new_data)
@@ -4,12 +4,96 @@ from gladier import GladierBaseTool, generate_flow_definition
 
 
 def make_corr_plots(**data):
+    """Plot the results in hdf_file to the proc_dir. Returns a dict with the names of the
+    'plots' in the proc_dir, and the 'resources' used."""
     import os
     import json
+    import contextlib
+    import cProfile
+    import pathlib
+    import resource
+    import sys
+    import uuid
+    import time
+    import socket
     from xpcs_webplot.plot_images import hdf2web_safe
     from xpcs_webplot import __version__ as webplot_version
 
-    hdf2web_safe(data['hdf_file'], target_dir=data['proc_dir'], image_only=True)
+    @contextlib.contextmanager
+    def account(name):
+        """Record the wall time, CPU time, peak memory and storage I/O of this process
+        and the children it has waited on inside this context, in the dict it yields"""
+        def usage():
+            rusage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            if os.path.exists('/proc/self/io'):
+                with open('/proc/self/io') as f:
+                    io = dict(line.split(': ') for line in f.read().splitlines())
+                read, written = int(io['read_bytes']), int(io['write_bytes'])
+            else:
+                read = sum(u.ru_inblock for u in rusage) * 512
+                written = sum(u.ru_oublock for u in rusage) * 512
+            return {'cpu': sum(u.ru_utime + u.ru_stime for u in rusage), 'read': read,
+                    'written': written, 'peak_rss': max(u.ru_maxrss for u in rusage)}
+
+        resources = {'name': name, 'hostname': socket.gethostname()}
+        wall_start, start = time.perf_counter(), usage()
+        try:
+            yield resources
+        finally:
+            end = usage()
+            resources.update({
+                'wall_time_seconds': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_seconds': round(end['cpu'] - start['cpu'], 3),
+                # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+                'peak_rss_bytes': end['peak_rss'] * (1 if sys.platform == 'darwin' else 1024),
+                'bytes_read': end['read'] - start['read'],
+                'bytes_written': end['written'] - start['written'],
+            })
+
+    @contextlib.contextmanager
+    def profile(name):
+        """Run this context under cProfile if the flow input sets 'profile'. The profile is
+        written to .profiles/<dataset> beside the proc_dir, so it isn't published."""
+        if not data.get('profile'):
+            yield
+            return
+        proc_dir = pathlib.Path(data['proc_dir'])
+        profile_dir = proc_dir.parent / '.profiles' / proc_dir.name
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(str(profile_dir / f'{name}.prof'))
+
+    @contextlib.contextmanager
+    def span(name, **attributes):
+        """Append a span for this function to trace_spans.jsonl in the proc_dir, in the
+        record format of gladier_xpcs.tracing. Nothing is recorded without a trace_id."""
+        if not data.get('trace_id'):
+            yield attributes
+            return
+        record = {'trace_id': data['trace_id'], 'span_id': uuid.uuid4().hex[:16], 'name': name,
+                  'hostname': socket.gethostname(), 'pid': os.getpid(), 'status': 'OK',
+                  'start': time.time()}
+        try:
+            yield attributes
+        except Exception as e:
+            record['status'], record['error'] = 'ERROR', repr(e)
+            raise
+        finally:
+            record['end'] = time.time()
+            record['duration'] = round(record['end'] - record['start'], 3)
+            record['attributes'] = attributes
+            with open(os.path.join(data['proc_dir'], 'trace_spans.jsonl'), 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    with account('make_corr_plots') as resources, \
+            span('make_corr_plots'), \
+            profile('make_corr_plots'):
+        hdf2web_safe(data['hdf_file'], target_dir=data['proc_dir'], image_only=True)
 
     metadata = {
         'plotting': {
@@ -23,7 +107,10 @@ def make_corr_plots(**data):
         with open(data['plotting_metadata_file'], 'w') as f:
             f.write(json.dumps(metadata, indent=2))
 
-    return [img for img in os.listdir(data['proc_dir']) if img.endswith('.png')]
+    return {
+        'plots': [img for img in os.listdir(data['proc_dir']) if img.endswith('.png')],
+        'resources': resources,
+    }
 
 
 @generate_flow_definition(modifiers={
@@ -0,0 +1,69 @@
+from gladier import GladierBaseTool
+
+
+class ProfileTransfer(GladierBaseTool):
+    """Transfer profiles written by compute functions back with the results. This runs
+    at the end of the flow instead of with the ResultTransfer, so profiles from stages
+    after the result transfer (plotting and metadata gathering) are included."""
+
+    flow_definition = {
+        'Comment': 'Transfer profiles of compute functions in Globus',
+        'StartAt': 'ProfileTransferChoice',
+        'States': {
+            "ProfileTransferChoice": {
+                "Comment": "Determine if compute functions were profiled in this run",
+                "Type": "Choice",
+                "Choices": [
+                    {
+                        "And": [
+                            {
+                                "Variable": "$.input.profile",
+                                "IsPresent": True,
+                            },
+                            {
+                                "Variable": "$.input.profile",
+                                "BooleanEquals": True,
+                            },
+                            {
+                                "Variable": "$.input.profile_transfer",
+                                "IsPresent": True,
+                            },
+                        ],
+                        "Next": "ProfileTransferDoTransfer",
+                    }
+                ],
+                "Default": "ProfileTransferSkipTransfer",
+            },
+            'ProfileTransferDoTransfer': {
+                'Comment': 'Transfer profiles from the staging location back to the source collection',
+                'Type': 'Action',
+                'ActionUrl': 'https://transfer.actions.globus.org/transfer/',
+                'Parameters': {
+                    'source_endpoint.$': '$.input.profile_transfer.source_endpoint_id',
+                    'destination_endpoint.$': '$.input.profile_transfer.destination_endpoint_id',
+                    'DATA.$': '$.input.profile_transfer.transfer_items',
+                },
+                'ResultPath': '$.ProfileTransferDoTransfer',
+                'WaitTime': 600,
+                "Next": "ProfileTransferDone",
+            },
+            "ProfileTransferSkipTransfer": {
+                "Comment": "Profiling was not enabled, so there is nothing to transfer",
+                "Type": "Pass",
+                "Next": "ProfileTransferDone",
+            },
+            "ProfileTransferDone": {
+                "Comment": "Profile Transfer has finished execution",
+                "Type": "Pass",
+                "End": True,
+            },
+        }
+    }
+
+    flow_input = {
+        'profile': False,
+    }
+
+    required_input = [
+        'profile',
+    ]
@@ -2,10 +2,28 @@ from gladier import GladierBaseTool, generate_flow_definition
 
 
 def publish_gather_metadata(**data):
+    import json
+    import os
+    import time
     import traceback
     from pilot.client import PilotClient
     from pilot.exc import PilotClientException, FileOrFolderDoesNotExist
 
+    # Recorded ACLs are skipped for a day, so an ACL which was removed is created again
+    # the next day at most
+    ACL_RECHECK_SECONDS = 24 * 60 * 60
+
+    def is_acl_recorded(state_file, endpoint_id, path, principal):
+        """True if publish_record_acl recorded this ACL as created in the last
+        ACL_RECHECK_SECONDS, so this publish doesn't need to create it"""
+        if not path.endswith('/'):
+            path += '/'
+        try:
+            with open(os.path.expanduser(state_file)) as f:
+                recorded = json.load(f).get('acls', {}).get(f'{endpoint_id}:{path}:{principal}')
+        except FileNotFoundError:
+            return False
+        return recorded is not None and time.time() - recorded < ACL_RECHECK_SECONDS
 
     try:
         dataset, destination = data['dataset'], data.get('destination', '/')
@@ -26,6 +44,14 @@ def publish_gather_metadata(**data):
         permissions_path = pc.get_path(destination)
         if not permissions_path.endswith('/'):
             permissions_path += '/'
+        # Every dataset in a cycle/group shares this ACL, so it's only created until a
+        # publish records that it exists.
+        principal = groups[0] if groups else None
+        create_acl = bool(principal)
+        record_acl = bool(principal and data.get('acl_state_file'))
+        if record_acl:
+            create_acl = not is_acl_recorded(data['acl_state_file'], pc.get_endpoint(),
+                                             permissions_path, principal)
         return {
             'search': {
                 'id': data.get('id', 'metadata'),
@@ -47,14 +73,56 @@ def publish_gather_metadata(**data):
             'permissions': {
                 'endpoint_id': pc.get_endpoint(),
                 'path': permissions_path,
-                'principal_identifier': groups[0] if groups else None,
-                'principal_type': 'group'
+                'principal_identifier': principal,
+                'principal_type': 'group',
+                'create': create_acl,
+                'record': record_acl,
+                'acl_state_file': data.get('acl_state_file'),
             }
         }
     except (PilotClientException, FileOrFolderDoesNotExist):
         return traceback.format_exc()
 
 
+def publish_record_acl(**data):
+    import fcntl
+    import json
+    import os
+    import pathlib
+    import tempfile
+    import time
+
+    def record_acl(state_file, endpoint_id, path, principal):
+        """Record an ACL once it's known to exist. The state file is shared by every
+        publish, so it's changed under an exclusive lock on a sibling '.lock' file and
+        replaced whole, the same as gladier_xpcs.state.JSONStateFile."""
+        if not path.endswith('/'):
+            path += '/'
+        state_file = pathlib.Path(state_file).expanduser()
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(f'{state_file}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    state = json.loads(state_file.read_text())
+                except FileNotFoundError:
+                    state = {}
+                state.setdefault('acls', {})[f'{endpoint_id}:{path}:{principal}'] = time.time()
+                with tempfile.NamedTemporaryFile('w', dir=state_file.parent, delete=False) as tmp:
+                    json.dump(state, tmp, indent=2, sort_keys=True)
+                os.replace(tmp.name, state_file)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    result = data.get('set_permission') or {}
+    created = result.get('status') == 'SUCCEEDED'
+    # Another publish created it first, Transfer reports this as an 'Exists' error
+    exists = 'Exists' in json.dumps(result.get('details', {}), default=str)
+    if created or exists:
+        record_acl(data['acl_state_file'], data['endpoint_id'], data['path'], data['principal_identifier'])
+    return {'recorded': created or exists}
+
+
 class Publish(GladierBaseTool):
 
     flow_definition = {
@@ -85,7 +153,25 @@ class Publish(GladierBaseTool):
                 'InputPath': '$.PublishGatherMetadata.details.results[0].output.transfer',
                 'ResultPath': '$.PublishTransfer',
                 'WaitTime': 1800,
-                'Next': 'PublishTransferSetPermission',
+                'Next': 'PublishChoiceSetPermission',
+            },
+            'PublishChoiceSetPermission': {
+                'Comment': 'Skip creating the ACL if another publish already has',
+                'Type': 'Choice',
+                'Choices': [{
+                    'And': [
+                        {
+                            'Variable': '$.PublishGatherMetadata.details.results[0].output.permissions.create',
+                            'IsPresent': True,
+                        },
+                        {
+                            'Variable': '$.PublishGatherMetadata.details.results[0].output.permissions.create',
+                            'BooleanEquals': False,
+                        },
+                    ],
+                    'Next': 'PublishIngest',
+                }],
+                'Default': 'PublishTransferSetPermission',
             },
             "PublishTransferSetPermission": {
                 "Comment": "Grant read permission on the data to the Tutorial users group",
@@ -102,7 +188,51 @@ class Publish(GladierBaseTool):
                 },
                 "ExceptionOnActionFailure": False,
                 "ResultPath": "$.SetPermission",
-                "Next": "PublishIngest"
+                "Next": "PublishChoiceRecordACL"
+            },
+            'PublishChoiceRecordACL': {
+                'Comment': 'Record the ACL so later publishes skip it, if this run is keeping track',
+                'Type': 'Choice',
+                'Choices': [{
+                    'And': [
+                        {
+                            'Variable': '$.input.publish_record_acl_function_id',
+                            'IsPresent': True,
+                        },
+                        {
+                            'Variable': '$.PublishGatherMetadata.details.results[0].output.permissions.record',
+                            'IsPresent': True,
+                        },
+                        {
+                            'Variable': '$.PublishGatherMetadata.details.results[0].output.permissions.record',
+                            'BooleanEquals': True,
+                        },
+                    ],
+                    'Next': 'PublishRecordACL',
+                }],
+                'Default': 'PublishIngest',
+            },
+            'PublishRecordACL': {
+                'Comment': 'Record the ACL once SetPermission created it, or found it already exists',
+                'Type': 'Action',
+                'ActionUrl': 'https://compute.actions.globus.org',
+                'ExceptionOnActionFailure': False,
+                'Parameters': {
+                    'tasks': [{
+                        'endpoint.$': '$.input.compute_endpoint_non_compute',
+                        'function.$': '$.input.publish_record_acl_function_id',
+                        'payload': {
+                            'acl_state_file.$': '$.PublishGatherMetadata.details.results[0].output.permissions.acl_state_file',
+                            'endpoint_id.$': '$.PublishGatherMetadata.details.results[0].output.permissions.endpoint_id',
+                            'path.$': '$.PublishGatherMetadata.details.results[0].output.permissions.path',
+                            'principal_identifier.$': '$.PublishGatherMetadata.details.results[0].output.permissions.principal_identifier',
+                            'set_permission.$': '$.SetPermission',
+                        },
+                    }]
+                },
+                'ResultPath': '$.PublishRecordACL',
+                'WaitTime': 300,
+                'Next': 'PublishIngest',
             },
             'PublishIngest': {
                 'Comment': 'Ingest the search document',
@@ -128,4 +258,5 @@ class Publish(GladierBaseTool):
 
     compute_functions = [
         publish_gather_metadata,
+        publish_record_acl,
     ]
@@ -7,8 +7,79 @@ def xpcs_boost_corr(**data):
     import logging
     import subprocess
     import pathlib
+    import contextlib
+    import shlex
+    import shutil
+    import resource
+    import sys
+    import uuid
+    import socket
     from boost_corr import __version__ as boost_version
 
+    @contextlib.contextmanager
+    def account(name):
+        """Record the wall time, CPU time, peak memory and storage I/O of this process
+        and the children it has waited on inside this context, in the dict it yields"""
+        def usage():
+            rusage = [resource.getrusage(who) for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)]
+            if os.path.exists('/proc/self/io'):
+                with open('/proc/self/io') as f:
+                    io = dict(line.split(': ') for line in f.read().splitlines())
+                read, written = int(io['read_bytes']), int(io['write_bytes'])
+            else:
+                read = sum(u.ru_inblock for u in rusage) * 512
+                written = sum(u.ru_oublock for u in rusage) * 512
+            return {'cpu': sum(u.ru_utime + u.ru_stime for u in rusage), 'read': read,
+                    'written': written, 'peak_rss': max(u.ru_maxrss for u in rusage)}
+
+        resources = {'name': name, 'hostname': socket.gethostname()}
+        wall_start, start = time.perf_counter(), usage()
+        try:
+            yield resources
+        finally:
+            end = usage()
+            resources.update({
+                'wall_time_seconds': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_seconds': round(end['cpu'] - start['cpu'], 3),
+                # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+                'peak_rss_bytes': end['peak_rss'] * (1 if sys.platform == 'darwin' else 1024),
+                'bytes_read': end['read'] - start['read'],
+                'bytes_written': end['written'] - start['written'],
+            })
+
+    @contextlib.contextmanager
+    def span(name, **attributes):
+        """Append a span for this function to trace_spans.jsonl in the proc_dir, in the
+        record format of gladier_xpcs.tracing. Nothing is recorded without a trace_id."""
+        if not data.get('trace_id'):
+            yield attributes
+            return
+        record = {'trace_id': data['trace_id'], 'span_id': uuid.uuid4().hex[:16], 'name': name,
+                  'hostname': socket.gethostname(), 'pid': os.getpid(), 'status': 'OK',
+                  'start': time.time()}
+        try:
+            yield attributes
+        except Exception as e:
+            record['status'], record['error'] = 'ERROR', repr(e)
+            raise
+        finally:
+            record['end'] = time.time()
+            record['duration'] = round(record['end'] - record['start'], 3)
+            record['attributes'] = attributes
+            with open(os.path.join(data['proc_dir'], 'trace_spans.jsonl'), 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    def profile_command(cmd, name):
+        """Wrap a shell command to be recorded by py-spy, if the flow input sets 'profile'
+        and py-spy is on the PATH. Written beside the proc_dir like other profiles."""
+        py_spy = shutil.which('py-spy')
+        if not data.get('profile') or not py_spy:
+            return cmd
+        profile_dir = pathlib.Path(data['proc_dir']).parent / '.profiles' / pathlib.Path(data['proc_dir']).name
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profile_file = shlex.quote(str(profile_dir / f'{name}.speedscope.json'))
+        return f'{py_spy} record --subprocesses --format speedscope -o {profile_file} -- {cmd}'
+
     if not os.path.exists(data['proc_dir']):
         raise NameError(f'{data["proc_dir"]} \n Proc dir does not exist!')
 
@@ -40,8 +111,13 @@ def xpcs_boost_corr(**data):
         "--overwrite" if boost_corr["overwrite"] else "",
         "--verbose" if boost_corr["verbose"] else "",
     ]
+    command = " ".join(cmd)
+    command = profile_command(command, 'xpcs_boost_corr')
     corr_start = time.time()
-    result = subprocess.run([" ".join(cmd)], shell=True, capture_output=True, text=True)
+    with account('xpcs_boost_corr') as resources, \
+            span('xpcs_boost_corr', atype=boost_corr['atype']) as attributes:
+        result = subprocess.run([command], shell=True, capture_output=True, text=True)
+        attributes['returncode'] = result.returncode
     execution_time_seconds = round(time.time() - corr_start, 2)
     pathlib.Path(log_file).write_text(str(result.stderr))
 
@@ -69,6 +145,7 @@ def xpcs_boost_corr(**data):
         'proc_dir': data['proc_dir'],
         'boost_corr': data['boost_corr'],
         'execution_time_seconds': execution_time_seconds,
+        'resources': resources,
     }
 
 
@@ -0,0 +1,124 @@
+"""
+Lightweight tracing across submission, flow states and compute functions.
+
+A trace_id is generated when a dataset is submitted and carried in the flow input as
+``trace_id``. Client scripts and compute functions each record spans (a named, timed
+piece of work) tagged with that trace_id, and append them as JSON lines to a local file.
+Compute functions write to ``trace_spans.jsonl`` in the dataset proc_dir, client scripts
+write to TRACE_FILE. ``scripts/xpcs_trace_timeline.py`` assembles all of them into a
+per-dataset timeline.
+
+Nothing is recorded if no trace_id is given, so untraced runs behave as before. Endpoints
+aren't required to have gladier_xpcs installed, so compute functions can't import this.
+Each writes its own span inline, in the same record format as span() below.
+"""
+import contextlib
+import json
+import os
+import pathlib
+import socket
+import time
+import uuid
+
+SPAN_FILENAME = 'trace_spans.jsonl'
+TRACE_FILE = os.getenv('XPCS_TRACE_FILE', '/tmp/XPCSTraceSpans.jsonl')
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def get_span_file(proc_dir: str) -> str:
+    return os.path.join(proc_dir, SPAN_FILENAME)
+
+
+def export_span(span_file: str, span_record: dict):
+    """Append a single finished span to a span file. Each span is one line, so
+    many processes may safely append to the same file."""
+    with open(span_file, 'a') as f:
+        f.write(json.dumps(span_record, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def span(name: str, trace_id: str, span_file: str, **attributes):
+    """Record the time spent inside this context as a span. Yields the attributes
+    dict, so callers may add attributes (like a run_id) discovered along the way."""
+    if not trace_id:
+        yield attributes
+        return
+
+    record = {
+        'trace_id': trace_id,
+        'span_id': uuid.uuid4().hex[:16],
+        'name': name,
+        'hostname': socket.gethostname(),
+        'pid': os.getpid(),
+        'status': 'OK',
+        'start': time.time(),
+    }
+    try:
+        yield attributes
+    except Exception as e:
+        record['status'] = 'ERROR'
+        record['error'] = repr(e)
+        raise
+    finally:
+        record['end'] = time.time()
+        record['duration'] = round(record['end'] - record['start'], 3)
+        record['attributes'] = attributes
+        export_span(span_file, record)
+
+
+def load_spans(paths: list) -> list:
+    """Load spans from any number of span files, or directories containing them"""
+    spans = []
+    for path in map(pathlib.Path, paths):
+        span_files = path.rglob(SPAN_FILENAME) if path.is_dir() else [path]
+        for span_file in span_files:
+            with open(span_file) as f:
+                spans.extend(json.loads(line) for line in f if line.strip())
+    return spans
+
+
+def flow_state_spans(spans: list, run_timings: dict) -> list:
+    """Build spans for each flow state from batch_status run timings, for any run
+    whose run_id was recorded on a span when it was submitted."""
+    from gladier_xpcs.latency import parse_time
+
+    state_spans = []
+    for sp in spans:
+        timings = run_timings.get(sp.get('attributes', {}).get('run_id'))
+        for state in (timings or {}).get('states', []):
+            start, end = parse_time(state['start']).timestamp(), parse_time(state['end']).timestamp()
+            state_spans.append({
+                'trace_id': sp['trace_id'],
+                'name': f'flow:{state["state"]}',
+                'hostname': 'globus-flows',
+                'status': 'ERROR' if state['status'] == 'FAILED' else 'OK',
+                'start': start,
+                'end': end,
+                'duration': state['seconds'],
+                'attributes': {'run_id': timings['run_id']},
+            })
+    return state_spans
+
+
+def build_timelines(spans: list) -> dict:
+    """Group spans by trace_id, each sorted by start time"""
+    timelines = {}
+    for sp in spans:
+        timelines.setdefault(sp['trace_id'], []).append(sp)
+    for trace_spans in timelines.values():
+        trace_spans.sort(key=lambda s: s['start'])
+    return timelines
+
+
+def format_timeline(trace_id: str, trace_spans: list) -> str:
+    trace_start = trace_spans[0]['start']
+    trace_end = max(s['end'] for s in trace_spans)
+    lines = [f'Trace {trace_id} ({round(trace_end - trace_start, 2)}s total)']
+    for sp in trace_spans:
+        offset = round(sp['start'] - trace_start, 2)
+        status = '' if sp['status'] == 'OK' else f' [{sp["status"]}]'
+        lines.append(f'  +{offset:>10}s {sp["duration"]:>10}s  {sp["name"]} ({sp["hostname"]}){status}')
+    return '\n'.join(lines)
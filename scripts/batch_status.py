@@ -1,5 +1,6 @@
 import pprint
 import os
+import csv as csv_module
 import sys
 import datetime
 import zoneinfo
@@ -13,8 +14,14 @@ import pathlib
 import asyncio
 import collections
 from gladier_xpcs.flows.flow_boost import XPCSBoost
+from gladier_xpcs import failures, latency
 from gladier import FlowsManager
 
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
 
 FILTER_RANGE_MIN = datetime.datetime.now(tz=zoneinfo.ZoneInfo('UTC')) - datetime.timedelta(days=3)
 FILTER_RANGE_MAX = datetime.datetime.now(tz=zoneinfo.ZoneInfo('UTC'))
@@ -28,6 +35,9 @@ RUNS_CACHE = f'/tmp/{FLOW_CLASS.__name__}RunsCache.json'
 FLOW_ID = "56c933db-16c3-4416-b8df-6fa31379a602"
 RUNS_CACHE = f"/tmp/{FLOW_CLASS.__name__}RunsCache.json"
 RUN_LOGS_CACHE = f"/tmp/{FLOW_CLASS.__name__}RunLogsCache.json"
+# Failed runs never change, so their classification is cached per run_id without a TTL
+FAILURE_CACHE = f"/tmp/{FLOW_CLASS.__name__}FailureCache.json"
+RUN_TIMINGS_CACHE = f"/tmp/{FLOW_CLASS.__name__}RunTimingsCache.json"
 # Keep cache for a week
 CACHE_TTL = 60 * 60 * 24 * 7
 USE_CACHE = False
@@ -109,6 +119,24 @@ def save_run_logs_cache(run_logs):
         json.dump({"run_logs": run_logs, "timestamp": time.time()}, f)
 
 
+def get_failure_cache() -> dict:
+    return load_cache(FAILURE_CACHE).get("failures", dict())
+
+
+def save_failure_cache(failures):
+    with open(FAILURE_CACHE, "w") as f:
+        json.dump({"failures": failures, "timestamp": time.time()}, f)
+
+
+def get_run_timings_cache() -> dict:
+    return load_cache(RUN_TIMINGS_CACHE).get("run_timings", dict())
+
+
+def save_run_timings_cache(run_timings):
+    with open(RUN_TIMINGS_CACHE, "w") as f:
+        json.dump({"run_timings": run_timings, "timestamp": time.time()}, f)
+
+
 def get_query_params(since_days=0):
     query_params = {"orderby": ("start_time DESC",)}
     if since_days > 0:
@@ -190,6 +218,13 @@ def make_csv(runs, sort_field='start_time'):
     return '\n'.join(formatted)
 
 
+def make_table(rows):
+    if not rows:
+        return 'No finished runs to summarize.'
+    fields = list(rows[0].keys())
+    return '\n'.join([','.join(fields)] + [','.join(str(row[f]) for f in fields) for row in rows])
+
+
 def sort_runs(runs, sort_field='start_time'):
     if sort_field not in RUN_FIELDS:
         raise ValueError(f'"{sort_field}" is not in RUN_FIELDS. Please add it.')
@@ -257,6 +292,126 @@ def update_run_logs(runs):
     return run_logs
 
 
+def get_all_run_logs(run):
+    return list(get_flows_client().paginated.get_run_logs(run["run_id"]).items())
+
+
+def classify_run(run):
+    entries = get_all_run_logs(run)
+    # The run itself may also carry a short description of the failure
+    if run.get("details"):
+        entries.append({"code": "FlowFailed", "details": run["details"]})
+    return failures.classify_failure(entries)
+
+
+def get_run_timings(run):
+    return latency.get_run_timings(run, get_all_run_logs(run))
+
+
+async def _fetch_single_run(worker_name: str, queue, results: dict, fetch):
+    print(f"Worker {worker_name} started.")
+    while not queue.empty():
+        run = await queue.get()
+        results[run["run_id"]] = await asyncio.to_thread(fetch, run)
+        queue.task_done()
+
+
+async def _fetch_runs_loop(runs, results, fetch, workers=3):
+    """Call fetch(run) in worker threads for each run not already in results"""
+    fetch_queue = asyncio.Queue()
+    for run in runs:
+        if run["run_id"] not in results:
+            fetch_queue.put_nowait(run)
+
+    if fetch_queue.empty():
+        return
+    else:
+        print(f"Fetching {fetch_queue.qsize()} run logs")
+
+    initial_size = fetch_queue.qsize()
+    tasks = []
+    for i in range(workers):
+        task = asyncio.create_task(
+            _fetch_single_run(f"worker-{i}", fetch_queue, results, fetch)
+        )
+        tasks.append(task)
+
+    while not fetch_queue.empty():
+        print(f"Working on queue ({initial_size - fetch_queue.qsize()}/{initial_size})")
+        await asyncio.sleep(1)
+    await fetch_queue.join()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def update_failures(runs):
+    """Classify each FAILED run by the cause of its failure. Results are cached
+    per run_id, so only newly failed runs fetch their logs."""
+    run_failures = get_failure_cache()
+    exit_now = False
+
+    try:
+        asyncio.run(_fetch_runs_loop(
+            [r for r in runs if r["status"] == "FAILED"], run_failures, classify_run
+        ))
+    except KeyboardInterrupt:
+        print("Interrupt Received! Saving and exiting...")
+        exit_now = True
+    finally:
+        save_failure_cache(run_failures)
+        if exit_now:
+            sys.exit(1)
+    return run_failures
+
+
+def update_run_timings(runs):
+    """Fetch per-state timings for each finished run. Results are cached per run_id,
+    since finished runs never change."""
+    run_timings = get_run_timings_cache()
+    exit_now = False
+
+    try:
+        asyncio.run(_fetch_runs_loop(
+            [r for r in runs if r["status"] in ("SUCCEEDED", "FAILED")], run_timings, get_run_timings
+        ))
+    except KeyboardInterrupt:
+        print("Interrupt Received! Saving and exiting...")
+        exit_now = True
+    finally:
+        save_run_timings_cache(run_timings)
+        if exit_now:
+            sys.exit(1)
+    return run_timings
+
+
+def export_summary(summary, filename, fmt):
+    if fmt == "parquet":
+        if pandas is None:
+            raise ValueError("Please install pandas and pyarrow to export parquet files")
+        pandas.DataFrame(summary).to_parquet(filename, index=False)
+        return
+    with open(filename, "w", newline="") as f:
+        writer = csv_module.DictWriter(f, fieldnames=list(summary[0].keys()) if summary else [])
+        writer.writeheader()
+        writer.writerows(summary)
+
+
+def filter_retryable_runs(runs, run_failures):
+    """Drop any FAILED runs whose failure is deterministic, and will fail again
+    if retried."""
+    retryable = []
+    for run in runs:
+        failure = run_failures.get(run["run_id"])
+        if run["status"] == "FAILED" and failure and not failure["retryable"]:
+            print(
+                f"Skipping {run['label']}, failed in {failure['state_name']} with "
+                f"non-retryable failure {failure['category']}"
+            )
+            continue
+        retryable.append(run)
+    print(f"Filtered {len(runs)} runs down to {len(retryable)} retryable runs.")
+    return retryable
+
+
 def filter_unsuccessful_failure_runs(runs, run_logs):
     """
     Filter any runs that have previously failed, and have not been retried successfully.
@@ -345,6 +500,40 @@ def summary(flow):
     click.secho(', '.join(output))
 
 
+@batch_status.command()
+@click.option('--flow', help='Flow id to use')
+def failures_summary(flow):
+    runs = [run for run in get_runs(flow) if run['status'] == 'FAILED']
+    categories = [f['category'] for f in update_failures(runs).values()]
+    output = sorted([f'{category}: {categories.count(category)}'
+                     for category in set(categories)])
+    output.append(f'Total Failed Runs: {len(runs)}')
+    click.secho(', '.join(output))
+
+
+@batch_status.command()
+@click.option('--flow', help='Flow id to use')
+@click.option('--since-days', default=0, help='Only profile runs started in the last N days')
+@click.option('--group-by', multiple=True, default=('deployment', 'day', 'state'),
+              type=click.Choice(['deployment', 'day', 'state', 'label']),
+              help='Fields to group latencies by, may be given more than once')
+@click.option('--output', default=None, help='Export the summary to this file')
+@click.option('--format', 'fmt', default='csv', type=click.Choice(['csv', 'parquet']))
+def profile(flow, since_days, group_by, output, fmt):
+    """Report p50/p95/p99 latency of each flow state from run logs"""
+    runs = get_runs(flow, since_days=since_days)
+    run_timings = update_run_timings(runs)
+    # The cache holds every run ever profiled, only summarize the runs requested
+    summary = latency.summarize(
+        [run_timings[r['run_id']] for r in runs if r['run_id'] in run_timings], group_by=group_by
+    )
+    if output:
+        export_summary(summary, output, fmt)
+        click.secho(f'Wrote {len(summary)} rows to {output}', fg='green')
+    else:
+        click.echo(make_table(summary))
+
+
 @batch_status.command()
 @click.option('--run', help='Run to retry', required=True)
 @click.option('--flow', default=None, help='Flow id to use')
@@ -370,12 +559,19 @@ def dump_run_input(run, flow):
 @click.option('--preview', is_flag=True, default=False, help='Flow id to use')
 @click.option('--since', help='Re-run all failed jobs since the label of this failed job')
 @click.option('--workers', help='Number of parallel processing jobs', default=30)
-def retry_runs(flow, local_fx, status, preview, since, workers):
+@click.option('--filter-unsuccessful-failures/--no-filter-unsuccessful-failures', default=True,
+              help='Only retry the most recent failure for datasets which never succeeded')
+@click.option('--retry-all-failures', is_flag=True, default=False,
+              help='Also retry failures which are deterministic, such as a bad qmap or missing metadata')
+def retry_runs(flow, local_fx, status, preview, since, workers, filter_unsuccessful_failures,
+               retry_all_failures):
     runs = [run for run in get_runs(flow) if run['status'] == status]
     runs = sort_runs(runs)
     if filter_unsuccessful_failures:
         run_logs = update_run_logs(runs)
         runs = filter_unsuccessful_failure_runs(runs, run_logs)
+    if not retry_all_failures:
+        runs = filter_retryable_runs(runs, update_failures(runs))
     if since:
         try:
             runs = get_runs_since_label(runs, label=since)
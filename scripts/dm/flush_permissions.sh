@@ -0,0 +1,18 @@
+#!/bin/bash
+
+# Restores permissions for experiments whose last jobs skipped it, since
+# permissions.sh only restores once per window. Run it from cron at least
+# as often as the window, ex:
+#   */10 * * * * sh flush_permissions.sh /home/dm/etc/dm.workflow_setup.sh
+
+WORKFLOW_SETUP_FILE=${1:-/home/dm/workflows/dm.workflow_setup.sh}
+source $WORKFLOW_SETUP_FILE
+
+RESTORE_WINDOW=${XPCS_PERMISSIONS_WINDOW:-600}
+
+source $CONDA_PATH
+conda activate $CONDA_ENV
+
+for EXPERIMENT_NAME in $(python $DM_WORKFLOWS_DIR/scripts/xpcs_permissions.py pending-restores --window $RESTORE_WINDOW); do
+    sh $DM_WORKFLOWS_DIR/scripts/dm/permissions.sh $WORKFLOW_SETUP_FILE $EXPERIMENT_NAME
+done
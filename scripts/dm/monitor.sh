@@ -8,6 +8,7 @@ WORKFLOW_SETUP_FILE=${1:-/home/dm/etc/dm.workflow_setup.sh}
 source $WORKFLOW_SETUP_FILE
 
 flowID=$2
+traceID=$3
 source $CONDA_PATH
 conda activate $CONDA_ENV
-python $DM_WORKFLOWS_DIR/scripts/get_status.py --run_id $flowID
\ No newline at end of file
+python $DM_WORKFLOWS_DIR/scripts/get_status.py --run_id $flowID ${traceID:+--trace-id $traceID}
\ No newline at end of file
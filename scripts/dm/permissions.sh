@@ -1,5 +1,10 @@
 #!/bin/bash
 
+# Restores permissions on an experiment's results, at most once per
+# experiment every XPCS_PERMISSIONS_WINDOW seconds (default 600). Jobs
+# within the window skip it, and the next restore covers all of
+# analysis/ so their results are included. Run flush_permissions.sh
+# from cron to cover the last jobs of an experiment.
 
 USAGE_TXT="Usage: permissions.sh workflow_setup_file experiment"
 
@@ -14,5 +19,13 @@ if [[ "$#" -lt 2 || "$EXPERIMENT_NAME" == "" ]]; then
 fi
 
 RESULT_PATH=${3:-analysis/}
+RESTORE_WINDOW=${XPCS_PERMISSIONS_WINDOW:-600}
 
-dm-restore-permissions --relative-path $RESULT_PATH --experiment $EXPERIMENT_NAME
\ No newline at end of file
+source $CONDA_PATH
+conda activate $CONDA_ENV
+
+if python $DM_WORKFLOWS_DIR/scripts/xpcs_permissions.py claim-restore $EXPERIMENT_NAME --window $RESTORE_WINDOW; then
+    dm-restore-permissions --relative-path analysis/ --experiment $EXPERIMENT_NAME
+else
+    echo "Permissions for $EXPERIMENT_NAME were restored in the last $RESTORE_WINDOW seconds, skipping $RESULT_PATH"
+fi
@@ -46,14 +46,15 @@
             'outputVariableRegexList' : [
                 'Flow Action ID: (?P<flowActionID>.*)',
                 'URL: (?P<url>.*)',
-                'Status: (?P<gladierStatus>.*)'
+                'Status: (?P<gladierStatus>.*)',
+                'Trace ID: (?P<traceID>.*)',
             ]
         },
         '06-MONITOR' : {
             'runIf': '"$analysisMachine" == "polaris"',
             'command': 'sh /home/dm/workflows/xpcs8/gladier-xpcs/scripts/dm/monitor.sh ' + \
                         '/home/dm/etc/dm.workflow_setup.sh ' + \
-                       '$flowActionID',
+                       '$flowActionID $traceID',
         },
         '07-PERMISSIONS' : {
             'command': 'sh /home/dm/workflows/xpcs8/gladier-xpcs/scripts/dm/permissions.sh ' + \
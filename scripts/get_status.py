@@ -4,6 +4,7 @@ import os
 import sys
 import time
 import globus_sdk
+from gladier_xpcs import tracing
 
 # Get client id/secret
 CLIENT_ID = os.getenv("GLADIER_CLIENT_ID")
@@ -23,6 +24,9 @@ def arg_parse():
     parser.add_argument(
         "--interval", help="Interval between checking statuses", type=int, default=5
     )
+    parser.add_argument(
+        "--trace-id", help="Record time spent monitoring under this trace", default=None
+    )
     parser.add_argument(
         "--max-wait",
         help="Maixmum time to wait for a run before exiting",
@@ -91,4 +95,6 @@ def main_loop(args: argparse.ArgumentParser, flows_client: globus_sdk.FlowsClien
 
 
 if __name__ == "__main__":
-    main_loop(arg_parse(), get_flows_client())
+    args = arg_parse()
+    with tracing.span("monitor", args.trace_id, tracing.TRACE_FILE, run_id=args.run_id, step=args.step):
+        main_loop(args, get_flows_client())
@@ -0,0 +1,148 @@
+#!/home/beams/8IDIUSER/.conda/envs/gladier/bin/python
+"""
+Ingest the search records of many processed datasets in a few GMetaList ingests.
+
+Run flows with xpcs_online_boost_client.py --defer-ingest, then run this on a host which
+can read their proc_dirs once they have finished:
+
+    python xpcs_batch_ingest.py --deployment voyager-8idi-polaris --experiment comm202410
+    python xpcs_batch_ingest.py /eagle/.../comm202410/A001 /eagle/.../comm202410/A002
+    python xpcs_batch_ingest.py --from-file proc_dirs.txt --report ingest.csv
+    python xpcs_batch_ingest.py --experiment comm202410 --fingerprint-store ~/.xpcs/fingerprints.json
+
+Prints the outcome for each subject, and exits non-zero if any failed.
+"""
+import argparse
+import csv
+import os
+import pathlib
+import sys
+
+import globus_sdk
+from gladier_xpcs import ingest
+from gladier_xpcs.fingerprint import FingerprintStore
+from gladier_xpcs.deployments import deployment_map
+
+CLIENT_ID = os.getenv("GLADIER_CLIENT_ID")
+CLIENT_SECRET = os.getenv("GLADIER_CLIENT_SECRET")
+DEVELOPER_GROUP = '368beb47-c9c5-11e9-b455-0efb3ba9a670'
+REPORT_FIELDS = ['subject', 'proc_dir', 'status', 'task_id', 'error']
+
+
+def arg_parse(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('proc_dirs', nargs='*', help='Dataset proc_dirs to ingest')
+    parser.add_argument('--from-file', help='File listing one proc_dir per line')
+    parser.add_argument('--experiment', help='Ingest every dataset processed for this DM experiment')
+    parser.add_argument('--deployment', '-d', default='voyager-8idi-polaris',
+                        help=f'Deployment configs. Available: {list(deployment_map.keys())}')
+    parser.add_argument('--index', default='6871e83e-866b-41bc-8430-e3cf83b43bdc', help='Globus Search index')
+    parser.add_argument('--group', help='Visibility in Search', default=DEVELOPER_GROUP)
+    parser.add_argument('--destination', default='/XPCSDATA/Automate/', help='Base publication path')
+    parser.add_argument('--url-hostname', default='https://g-f6125.fd635.8443.data.globus.org',
+                        help='HTTPS server of the publication collection')
+    parser.add_argument('--max-entries', type=int, default=ingest.MAX_BATCH_ENTRIES,
+                        help='Most records in a single ingest')
+    parser.add_argument('--max-bytes', type=int, default=ingest.MAX_BATCH_BYTES,
+                        help='Largest single ingest, in bytes')
+    parser.add_argument('--timeout', type=int, default=ingest.TASK_TIMEOUT,
+                        help='Seconds to wait for every ingest to finish')
+    parser.add_argument('--fingerprint-store', help='Skip records which are unchanged since they were last '
+                        'ingested, and record the fingerprints of the ones which are ingested')
+    parser.add_argument('--report', help='Write the outcome for each subject to this CSV file')
+    parser.add_argument('--dry-run', action='store_true', default=False,
+                        help='Gather records and report batch sizes without ingesting')
+    return parser.parse_args(argv)
+
+
+def get_search_client():
+    if not CLIENT_ID or not CLIENT_SECRET:
+        raise Exception(
+            "No client credentials specified. Please set these env vars: GLADIER_CLIENT_ID, GLADIER_CLIENT_SECRET"
+        )
+    app = globus_sdk.ClientApp(
+        app_name="XPCSBatchIngest",
+        client_id=CLIENT_ID,
+        client_secret=CLIENT_SECRET,
+    )
+    return globus_sdk.SearchClient(app=app)
+
+
+def get_proc_dirs(args, deployment) -> list:
+    proc_dirs = list(args.proc_dirs)
+    if args.from_file:
+        proc_dirs += [line.strip() for line in pathlib.Path(args.from_file).read_text().splitlines()
+                      if line.strip()]
+    if args.experiment:
+        # Matches the dataset_dir used by xpcs_online_boost_client.py
+        experiment_dir = pathlib.Path(deployment.get_input()['input']['staging_dir']) / args.experiment
+        # Hidden directories (like .profiles) aren't datasets
+        proc_dirs += sorted(str(p) for p in experiment_dir.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    return proc_dirs
+
+
+def get_publishv2(args, deployment) -> dict:
+    """Settings shared by every dataset, the same as xpcs_online_boost_client.py uses"""
+    visible_to = {f'urn:globus:groups:id:{g}' for g in (args.group, DEVELOPER_GROUP)}
+    return {
+        'destination': args.destination,
+        'source_collection': deployment.staging_collection.uuid,
+        'source_collection_basepath': str(deployment.staging_collection.path),
+        'destination_collection': str(deployment.pub_collection.uuid),
+        'index': args.index,
+        'visible_to': sorted(visible_to),
+        'destination_url_hostname': args.url_hostname,
+    }
+
+
+def write_report(filename: str, rows: list):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+    deployment = deployment_map.get(args.deployment)
+    if not deployment:
+        raise ValueError(f'Invalid Deployment, deployments available: {list(deployment_map.keys())}')
+    publishv2 = get_publishv2(args, deployment)
+
+    entries, rows = [], []
+    for proc_dir in get_proc_dirs(args, deployment):
+        try:
+            publish_input = ingest.get_publish_input(proc_dir, publishv2)
+            entry = ingest.gather_entry(publish_input)
+        except Exception as e:
+            rows.append({'subject': None, 'proc_dir': proc_dir, 'status': ingest.FAILED,
+                         'task_id': None, 'error': f'Unable to gather metadata: {e}'})
+            continue
+        entries.append(entry)
+        rows.append({'subject': entry['subject'], 'proc_dir': proc_dir})
+    print(f'Gathered {len(entries)} records, {len(rows) - len(entries)} datasets failed')
+
+    store = FingerprintStore(args.fingerprint_store) if args.fingerprint_store else None
+    results = {}
+    if store:
+        entries, unchanged = ingest.split_unchanged(entries, store, args.index)
+        results.update({e['subject']: {'status': ingest.UNCHANGED} for e in unchanged})
+        print(f'Skipping {len(unchanged)} unchanged records')
+
+    if args.dry_run:
+        for number, batch in enumerate(ingest.batch_entries(entries, args.max_entries, args.max_bytes)):
+            size = sum(ingest.get_entry_size(e) for e in batch)
+            print(f'Batch {number}: {len(batch)} records, {size} bytes')
+        sys.exit(0)
+
+    results.update(ingest.ingest(get_search_client(), args.index, entries, args.max_entries,
+                                 args.max_bytes, timeout=args.timeout))
+    if store:
+        ingest.record_ingested(store, args.index, entries, results)
+    for row in rows:
+        if row['subject'] in results:
+            row.update(results[row['subject']])
+        print(f'{row["status"]}: {row["subject"] or row["proc_dir"]}' + (f' ({row["error"]})' if row.get('error') else ''))
+    if args.report:
+        write_report(args.report, rows)
+    sys.exit(int(any(row['status'] not in (ingest.SUCCESS, ingest.UNCHANGED) for row in rows)))
@@ -0,0 +1,169 @@
+#!/home/beams/8IDIUSER/.conda/envs/gladier/bin/python
+"""
+Replay a sample list at a beamline cadence, and report sustained throughput.
+
+Each sample is submitted the same way xpcs_online_boost_client.py would, at arrival
+times drawn from --distribution. Once every run has finished, the throughput in
+datasets/hour, the queueing delay before each run started processing, and latency
+percentiles for each flow state are reported.
+
+By default this runs against the local emulator, with boost_corr and the other compute
+functions replaced by stand-ins which sleep for --corr-seconds etc. Use --speedup to
+compress the time between arrivals:
+
+    python scripts/xpcs_load_test.py -n 50 --distribution burst --mean-interval 60 --speedup 20
+
+Pass a real --deployment to submit to Globus instead. In that case sample paths must
+exist on the deployment's source collection.
+"""
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import time
+
+from gladier_xpcs import loadgen, tracing
+from gladier_xpcs.deployments import deployment_map
+from gladier_xpcs.emulator import LocalFlowsEmulator
+from gladier_xpcs.flows import XPCSBoost
+
+import xpcs_online_boost_client as boost_client
+
+SAMPLES = pathlib.Path(__file__).parent / 'test' / 'samples_dm.txt'
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser(description='Replay a sample list and report sustained throughput.')
+    parser.add_argument('-f', '--samples', default=str(SAMPLES), help='Sample list, one DM job per line')
+    parser.add_argument('-n', '--count', type=int, default=10, help='Number of samples to replay, -1 for all')
+    parser.add_argument('--distribution', choices=list(loadgen.INTERARRIVALS), default='burst',
+                        help='Distribution of time between datasets')
+    parser.add_argument('--mean-interval', type=float, default=60, help='Mean seconds between datasets')
+    parser.add_argument('--burst-size', type=int, default=10, help='Datasets in each series, for --distribution burst')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for inter-arrival times')
+    parser.add_argument('--speedup', type=float, default=1, help='Divide inter-arrival times by this')
+    parser.add_argument('-d', '--deployment', default='local-emulator',
+                        help=f'Deployment to submit to. Available: {list(deployment_map.keys())}')
+    parser.add_argument('-q', '--qmap', default=None, help='Qmap for every sample, if not given in the sample list')
+    parser.add_argument('--poll-interval', type=float, default=5, help='Seconds between checking on runs')
+    parser.add_argument('--output', default=None, help='Write the report and every run to this JSON file')
+
+    emulated = parser.add_argument_group('local emulator')
+    emulated.add_argument('--corr-seconds', type=float, default=30, help='Time each boost_corr stand-in takes')
+    emulated.add_argument('--plot-seconds', type=float, default=5, help='Time each plotting stand-in takes')
+    emulated.add_argument('--fit-seconds', type=float, default=1, help='Time each fitting stand-in takes')
+    emulated.add_argument('--metadata-seconds', type=float, default=2, help='Time each metadata stand-in takes')
+    emulated.add_argument('--file-size', type=int, default=1024 ** 2, help='Size in bytes of each generated raw file')
+    emulated.add_argument('--transfer-bandwidth', type=float, default=None, help='Bytes per second for each transfer')
+    emulated.add_argument('--compute-workers', type=int, default=4, help='Processes for each compute endpoint')
+    emulated.add_argument('--max-runs', type=int, default=None, help='Runs which may be active at once')
+    return parser.parse_args()
+
+
+def get_sample_paths(sample: dict, qmap: str = None) -> dict:
+    """Work out the paths for a sample, following the post-APSU layout where the raw
+    file sits next to the metadata file in a directory named after the dataset."""
+    hdf = pathlib.PurePosixPath(sample['filePath'])
+    experiment_dir = hdf.parent.parent
+    return {
+        'experiment': sample.get('experimentName', experiment_dir.name),
+        'hdf': str(hdf),
+        'raw': sample.get('raw', str(hdf.with_suffix('.h5'))),
+        'qmap': sample.get('qmap', qmap or str(experiment_dir / 'qmap.h5')),
+        'output_dir': str(experiment_dir / 'analysis' / 'Multitau'),
+    }
+
+
+def make_emulated_files(paths: dict, deployment, file_size: int) -> dict:
+    """Create placeholder input files under the emulated source collection, and return
+    the sample paths moved there"""
+    local = {k: str(deployment.source_collection.path / v.lstrip('/')) if k != 'experiment' else v
+             for k, v in paths.items()}
+    for name in ('hdf', 'raw', 'qmap'):
+        path = pathlib.Path(local[name])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists():
+            path.write_bytes(b'\0' * (file_size if name == 'raw' else 1024))
+    return local
+
+
+def get_run_logs(client, run_id: str) -> list:
+    if isinstance(client, LocalFlowsEmulator):
+        return client.get_run_logs(run_id)
+    return list(client.flows_manager.flows_client.paginated.get_run_logs(run_id).items())
+
+
+def submit(client, sample: dict, args, deployment) -> dict:
+    paths = get_sample_paths(sample, args.qmap)
+    if deployment.emulated:
+        paths = make_emulated_files(paths, deployment, args.file_size)
+    client_args = boost_client.arg_parse([
+        '--experiment', paths['experiment'], '--hdf', paths['hdf'], '--raw', paths['raw'],
+        '--qmap', paths['qmap'], '--output_dir', paths['output_dir'], '--deployment', args.deployment,
+    ])
+    trace_id = tracing.new_trace_id()
+    # The client prints each path it works out, which is just noise here
+    with contextlib.redirect_stdout(io.StringIO()):
+        flow_input = boost_client.get_flow_input(client_args, deployment, trace_id)
+    if deployment.emulated:
+        flow_input['input']['simulated_seconds'] = {
+            'xpcs_boost_corr': args.corr_seconds,
+            'make_corr_plots': args.plot_seconds,
+            'fit_correlation': args.fit_seconds,
+            'gather_xpcs_metadata': args.metadata_seconds,
+        }
+
+    arrival = time.time()
+    label = pathlib.Path(paths['hdf']).name[:62]
+    run = client.run_flow(flow_input=flow_input, label=label, tags=['aps', 'xpcs', 'load-test'])
+    print(f'Submitted {label}: {run["run_id"]}')
+    return {'dataset': label, 'trace_id': trace_id, 'arrival': arrival, 'run': run}
+
+
+def wait_for_runs(client, results: list, poll_interval: float):
+    active = list(results)
+    while active:
+        for result in list(active):
+            run = client.get_status(result['run']['action_id'])
+            if run['status'] in ('SUCCEEDED', 'FAILED'):
+                result['run'] = getattr(run, 'data', run)
+                result['run_logs'] = get_run_logs(client, run['run_id'])
+                active.remove(result)
+        if active:
+            print(f'Waiting on {len(active)}/{len(results)} runs...')
+            time.sleep(poll_interval)
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+    deployment = deployment_map[args.deployment]
+    samples = [loadgen.parse_sample(line) for line in open(args.samples) if line.strip()]
+    samples = samples if args.count == -1 else samples[:args.count]
+    offsets = loadgen.get_arrival_offsets(args.distribution, len(samples), args.mean_interval,
+                                          seed=args.seed, burst_size=args.burst_size)
+
+    if deployment.emulated:
+        client = LocalFlowsEmulator.from_client(
+            XPCSBoost(auto_registration=False), deployment, functions=loadgen.SIMULATED_FUNCTIONS,
+            transfer_bandwidth=args.transfer_bandwidth, compute_workers=args.compute_workers,
+            max_runs=args.max_runs)
+    else:
+        client = XPCSBoost()
+
+    print(f'Replaying {len(samples)} samples over {offsets[-1] / args.speedup:.0f}s '
+          f'({args.distribution}, mean interval {args.mean_interval}s, speedup {args.speedup}x)')
+    start, results = time.time(), []
+    for offset, sample in zip(offsets, samples):
+        time.sleep(max(start + offset / args.speedup - time.time(), 0))
+        results.append(submit(client, sample, args, deployment))
+
+    wait_for_runs(client, results, args.poll_interval)
+    if deployment.emulated:
+        client.shutdown()
+
+    report = loadgen.summarize_load(results)
+    print(loadgen.format_report(report))
+    if args.output:
+        pathlib.Path(args.output).write_text(json.dumps({'report': report, 'runs': results}, indent=2, default=str))
+        print(f'Results written to {args.output}')
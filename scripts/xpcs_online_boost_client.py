@@ -12,6 +12,8 @@ import traceback
 from gladier_xpcs.flows import XPCSBoost
 from gladier_xpcs.deployments import deployment_map
 from gladier_xpcs import log  # noqa Add INFO logging
+from gladier_xpcs import tracing, profiling
+from gladier_xpcs.emulator import LocalFlowsEmulator
 
 from globus_sdk import ConfidentialAppAuthClient, AccessTokenAuthorizer, FlowsClient
 from globus_sdk.exc.convert import GlobusConnectionError
@@ -26,7 +28,7 @@ CLIENT_ID = os.getenv("GLADIER_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GLADIER_CLIENT_SECRET")
 
 
-def arg_parse():
+def arg_parse(argv=None):
     parser = argparse.ArgumentParser()
     parser.add_argument('--experiment', help='Name of the DM experiment', default='comm202410')
     parser.add_argument('--hdf', help='Path to the hdf (metadata) file',
@@ -54,8 +56,14 @@ def arg_parse():
     parser.add_argument('-ow', '--overwrite', default=False, action='store_true', help=f'Overwrite the existing result file.')
     parser.add_argument('-dq', '--dq', default='all', help=f'A string that selects the dq list, eg. \'1, 2, 5-7\' selects [1,2,5,6,7]')
     parser.add_argument('-o', '--output_dir', help=f'Output directory')
+    parser.add_argument('--profile', action='store_true', default=False, help='Profile each compute function, and '
+                        'transfer the profiles back to a "profiles" directory next to the result.')
+    parser.add_argument('--defer-ingest', action='store_true', default=False, help='Publish without ingesting '
+                        'the search record, so many datasets can be ingested at once with xpcs_batch_ingest.py')
+    parser.add_argument('--trace-id', default=None, help='Trace ID shared by every stage processing this dataset. '
+                        'A new one is generated if not given.')
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 def globus_connection(func, *args, **kwargs):
     try:
@@ -65,17 +73,8 @@ def globus_connection(func, *args, **kwargs):
         time.sleep(1)
         return globus_connection(func, *args, **kwargs)
 
-if __name__ == '__main__':
-    args = arg_parse()
-    print(args)
-    deployment = deployment_map.get(args.deployment)
-    if "/gdata/dm/XPCS8" in args.raw:
-        deployment = deployment_map.get('voyager-xpcs8-polaris')
-    if not deployment:
-        raise ValueError(f'Invalid Deployment, deployments available: {list(deployment_map.keys())}')
-    elif deployment.service_account and not (os.getenv('GLADIER_CLIENT_ID') and os.getenv('GLADIER_CLIENT_SECRET')):
-        raise ValueError(f'Deployment requires setting GLADIER_CLIENT_ID and GLADIER_CLIENT_SECRET')
-
+def get_flow_input(args, deployment, trace_id: str) -> dict:
+    """Build the XPCSBoost flow input for a single dataset from parsed arguments"""
     atype_options = ['Multitau', 'Both', 'Twotime']
     if args.atype not in atype_options:
         raise ValueError(f'Invalid --atype, must be one of: {", ".join(atype_options)}')
@@ -108,6 +107,8 @@ if __name__ == '__main__':
     output_dir = os.path.join(dataset_dir, 'output')
     # This tells the corr state where to place version specific info
     execution_metadata_file = os.path.join(dataset_dir, 'execution_metadata.json')
+    # This tells the fit state where to place relaxation time and contrast fits
+    fit_metadata_file = os.path.join(dataset_dir, 'fit_metadata.json')
 
     if not args.skip_transfer_back:
         result_path_destination_filename = os.path.join(args.output_dir, hdf_name)
@@ -167,7 +168,7 @@ if __name__ == '__main__':
                     'visible_to': [f'urn:globus:groups:id:{args.group}', developerGroup] if args.group else [developerGroup],
 
                     # Ingest and Transfer can be disabled for dry-run testing.
-                    'enable_publish': True,
+                    'enable_publish': not args.defer_ingest,
                     'enable_transfer': True,
 
                     'enable_meta_dc': True,
@@ -203,10 +204,15 @@ if __name__ == '__main__':
                 'destination_endpoint_id': deployment.source_collection.uuid,
                 'transfer_items': result_path_transfer_items,
             },
+            # Run compute functions under a profiler, writing profiles beside proc_dir
+            'profile': args.profile,
             'proc_dir': dataset_dir,
             'metadata_file': input_hdf_file,
             'hdf_file': output_hdf_file,
             'execution_metadata_file': execution_metadata_file,
+            'fit_metadata_file': fit_metadata_file,
+            # Shared by all compute functions in the flow to record spans under proc_dir
+            'trace_id': trace_id,
 
             # globus compute endpoints
             'login_node_endpoint': depl_input['input']['login_node_endpoint'],
@@ -214,13 +220,51 @@ if __name__ == '__main__':
         }
     }
 
-    corr_flow = XPCSBoost()
+    if args.profile and result_path_destination_filename:
+        # Profiles are transferred back next to the result at the end of the flow
+        flow_input['input']['profile_transfer'] = {
+            'source_endpoint_id': deployment.staging_collection.uuid,
+            'destination_endpoint_id': deployment.source_collection.uuid,
+            'transfer_items': [{
+                'source_path': deployment.staging_collection.to_globus(str(profiling.get_profile_dir(dataset_dir))),
+                'destination_path': deployment.source_collection.to_globus(
+                    os.path.join(args.output_dir, 'profiles', dataset_name)),
+                'recursive': True,
+            }],
+        }
+    return flow_input
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+    print(args)
+    trace_id = args.trace_id or tracing.new_trace_id()
+    deployment = deployment_map.get(args.deployment)
+    if "/gdata/dm/XPCS8" in args.raw:
+        deployment = deployment_map.get('voyager-xpcs8-polaris')
+    if not deployment:
+        raise ValueError(f'Invalid Deployment, deployments available: {list(deployment_map.keys())}')
+    elif deployment.service_account and not (os.getenv('GLADIER_CLIENT_ID') and os.getenv('GLADIER_CLIENT_SECRET')):
+        raise ValueError(f'Deployment requires setting GLADIER_CLIENT_ID and GLADIER_CLIENT_SECRET')
+
+    flow_input = get_flow_input(args, deployment, trace_id)
+    hdf_name = os.path.basename(args.hdf)
+    dataset_name = hdf_name[:hdf_name.rindex('.')]
+
+    if deployment.emulated:
+        corr_flow = LocalFlowsEmulator.from_client(XPCSBoost(auto_registration=False), deployment)
+    else:
+        corr_flow = XPCSBoost()
 
     corr_run_label = pathlib.Path(hdf_name).name[:62]
    
     print("Submitting flow to Globus...")
-    flow_run = globus_connection(corr_flow.run_flow, flow_input=flow_input, label=corr_run_label, tags=['aps', 'xpcs', args.experiment])
+    with tracing.span('submit', trace_id, tracing.TRACE_FILE, dataset=dataset_name,
+                      experiment=args.experiment, deployment=args.deployment) as attributes:
+        flow_run = globus_connection(corr_flow.run_flow, flow_input=flow_input, label=corr_run_label, tags=['aps', 'xpcs', args.experiment])
+        attributes['run_id'] = flow_run['run_id']
     print("Flow successfully submitted to Globus.")
+    print(f"Trace ID: {trace_id}")
 
     actionID = flow_run['action_id']
     print(f"Flow Action ID: {actionID}")
@@ -228,4 +272,10 @@ if __name__ == '__main__':
 
     print("Getting flow status from Globus...")
     status = globus_connection(corr_flow.get_status, action_id=actionID).get('status')
-    print(f"Status: {status}")
\ No newline at end of file
+    print(f"Status: {status}")
+
+    if deployment.emulated:
+        # Emulated runs only exist within this process, so wait for it to finish
+        print("Waiting for the emulated run to finish...")
+        print(f"Status: {corr_flow.wait(actionID)['status']}")
+        corr_flow.shutdown()
\ No newline at end of file
@@ -60,6 +60,8 @@ if __name__ == '__main__':
                 # Extra groups can be specified here. The XPCS Admins group will always
                 # be provided automatically.
                 'groups': [args.group] if args.group else [],
+                # Shared by every publish from this deployment, so each ACL is created once
+                'acl_state_file': os.path.join(depl_input['input']['staging_dir'], 'acl_state.json'),
             },
 
             'transfer_from_clutch_to_theta_items': [
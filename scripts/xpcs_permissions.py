@@ -0,0 +1,40 @@
+#!/home/beams/8IDIUSER/.conda/envs/gladier/bin/python
+"""
+Decide whether a DM job should restore its experiment's permissions, so that
+dm-restore-permissions runs once per experiment per window instead of for every job.
+Used by scripts/dm/permissions.sh and scripts/dm/flush_permissions.sh.
+
+    # Exits 0 if this job should restore permissions now, 1 if it should skip
+    python xpcs_permissions.py claim-restore comm202410 --window 600
+    # Experiments whose last jobs skipped restoring, and are due
+    python xpcs_permissions.py pending-restores
+"""
+import argparse
+import os
+import sys
+
+from gladier_xpcs.permissions import PermissionState, RESTORE_WINDOW_SECONDS
+
+STATE_FILE = os.getenv('XPCS_PERMISSIONS_STATE', '~/.xpcs/permissions_state.json')
+
+
+def arg_parse(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--state-file', default=STATE_FILE, help='Shared by every job on this host')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    claim = subparsers.add_parser('claim-restore', help='Exit 0 if permissions should be restored now')
+    claim.add_argument('experiment', help='Name of the DM experiment')
+    pending = subparsers.add_parser('pending-restores', help='Print experiments with skipped restores')
+    for subparser in (claim, pending):
+        subparser.add_argument('--window', type=float, default=RESTORE_WINDOW_SECONDS,
+                               help='Seconds between restores for the same experiment')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+    state = PermissionState(args.state_file)
+    if args.command == 'claim-restore':
+        sys.exit(0 if state.claim_restore(args.experiment, args.window) else 1)
+    for experiment in state.get_pending_restores(args.window):
+        print(experiment)
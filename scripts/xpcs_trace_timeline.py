@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"""
+Assemble trace spans into per-dataset timelines.
+
+Spans are written by the online client, get_status.py and each compute function in
+the flow. Pass any span files or directories containing them (such as the staging
+dir), and optionally the run timings cache from `batch_status.py profile` to include
+the Globus Flows states in each timeline.
+
+Usage: python xpcs_trace_timeline.py /tmp/XPCSTraceSpans.jsonl /eagle/.../xpcs_staging/comm202410
+"""
+import argparse
+import json
+from gladier_xpcs import tracing
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*', default=[tracing.TRACE_FILE],
+                        help='Span files, or directories to search for span files')
+    parser.add_argument('--trace-id', help='Only show this trace', default=None)
+    parser.add_argument('--run-timings', default=None,
+                        help='Run timings cache written by "batch_status.py profile"')
+    parser.add_argument('--json', action='store_true', default=False, help='Output timelines as JSON')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+    spans = tracing.load_spans(args.paths)
+    if args.run_timings:
+        with open(args.run_timings) as f:
+            spans += tracing.flow_state_spans(spans, json.load(f)['run_timings'])
+
+    timelines = tracing.build_timelines(spans)
+    if args.trace_id:
+        timelines = {args.trace_id: timelines.get(args.trace_id, [])}
+
+    if args.json:
+        print(json.dumps(timelines, indent=2))
+    else:
+        for trace_id, trace_spans in timelines.items():
+            if trace_spans:
+                print(tracing.format_timeline(trace_id, trace_spans))
@@ -0,0 +1,101 @@
+"""
+Run the offline benchmark suite, and compare results against baselines recorded locally.
+
+Usage:
+
+    python -m tests.benchmarks --size small
+    python -m tests.benchmarks --size medium --benchmark gather_xpcs_metadata --repeat 10
+
+A benchmark is reported as a regression if its fastest time is slower than its baseline
+by more than --threshold (25% by default), and the command exits non-zero. The fastest
+time is compared rather than the median, since it is the least affected by whatever
+else is running on a laptop.
+
+Baselines are machine specific, so none are committed. Record them on your own machine
+with --update-baselines before making changes (they're saved to baselines.json, which
+git ignores), then run again afterwards to compare. Benchmarks without a baseline are
+reported as NO BASELINE and never fail.
+"""
+import argparse
+import json
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+
+from tests.benchmarks.generators import SIZES
+from tests.benchmarks.suite import BENCHMARKS, get_skip_reason
+
+BASELINES_FILE = pathlib.Path(__file__).parent / 'baselines.json'
+
+
+def arg_parse():
+    parser = argparse.ArgumentParser(description='Run the offline XPCS benchmark suite.')
+    parser.add_argument('--size', choices=list(SIZES), default='small', help='Size of the generated input files')
+    parser.add_argument('--benchmark', action='append', choices=list(BENCHMARKS),
+                        help='Benchmark to run, may be given more than once. Runs all by default.')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of times to run each benchmark')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown over the baseline before failing, as a fraction')
+    parser.add_argument('--baselines', default=str(BASELINES_FILE), help='File to store baselines')
+    parser.add_argument('--update-baselines', action='store_true', default=False,
+                        help='Store the results of this run as the new baselines')
+    return parser.parse_args()
+
+
+def run_benchmark(bench, size: str, repeat: int) -> list:
+    """Run a benchmark `repeat` times, each with freshly generated input files, since
+    some compute functions move or delete their inputs."""
+    timings = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as workdir:
+            func = bench(pathlib.Path(workdir), size)
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def get_baseline_key(name: str, size: str) -> str:
+    return f'{name}[{size}]'
+
+
+def compare(fastest: float, baseline: dict, threshold: float) -> str:
+    if not baseline:
+        return 'NO BASELINE'
+    return 'REGRESSION' if fastest > baseline['min'] * (1 + threshold) else 'OK'
+
+
+if __name__ == '__main__':
+    args = arg_parse()
+    baselines_file = pathlib.Path(args.baselines)
+    baselines = json.loads(baselines_file.read_text()) if baselines_file.exists() else {}
+
+    regressions = []
+    print(f'{"Benchmark":<40}{"Median (s)":>12}{"Min (s)":>12}{"Baseline min (s)":>18}  Status')
+    for name in args.benchmark or BENCHMARKS:
+        key = get_baseline_key(name, args.size)
+        skip_reason = get_skip_reason(name)
+        if skip_reason:
+            print(f'{key:<40}{"":>12}{"":>12}{"":>18}  SKIPPED ({skip_reason})')
+            continue
+
+        timings = run_benchmark(BENCHMARKS[name], args.size, args.repeat)
+        median = statistics.median(timings)
+        baseline = baselines.get(key)
+        status = compare(min(timings), baseline, args.threshold)
+        baseline_min = f'{baseline["min"]:.4f}' if baseline else '-'
+        print(f'{key:<40}{median:>12.4f}{min(timings):>12.4f}{baseline_min:>18}  {status}')
+
+        if status == 'REGRESSION':
+            regressions.append(key)
+        if args.update_baselines:
+            baselines[key] = {'median': round(median, 6), 'min': round(min(timings), 6), 'repeat': args.repeat}
+
+    if args.update_baselines:
+        baselines_file.write_text(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f'Baselines saved to {baselines_file}')
+    if regressions:
+        print(f'Regressions over {args.threshold:.0%}: {", ".join(regressions)}', file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,110 @@
+"""
+Generate synthetic XPCS files for benchmarking. None of these contain real data, but
+they have the same layout (and roughly the same size, for a given size preset) as the
+files each compute function reads on the beamline.
+"""
+import pathlib
+import h5py
+import numpy
+
+# Sizes are loosely based on real 8-ID datasets. 'large' uses the eiger4M detector shape.
+SIZES = {
+    'tiny': {'n_q': 4, 'n_tau': 8, 'detector_shape': (16, 16), 'n_extra_keys': 5},
+    'small': {'n_q': 36, 'n_tau': 64, 'detector_shape': (256, 256), 'n_extra_keys': 50},
+    'medium': {'n_q': 360, 'n_tau': 128, 'detector_shape': (1024, 1024), 'n_extra_keys': 500},
+    'large': {'n_q': 3600, 'n_tau': 256, 'detector_shape': (2162, 2068), 'n_extra_keys': 5000},
+}
+
+BLUESKY_METADATA = 'entry/instrument/bluesky/metadata'
+DATA_DIR = '/gdata/dm/8IDI/2024-1/zhang202402_2/data'
+
+
+def write_scalar(group, name, value):
+    if isinstance(value, str):
+        group[name] = value.encode('utf-8')
+    else:
+        group.create_dataset(name, data=numpy.array([[value]]))
+
+
+def write_results(hframe, n_q, n_tau, detector_shape, n_extra_keys, **size):
+    """Write correlation results, in the same layout boost_corr uses"""
+    rng = numpy.random.default_rng(0)
+    tau = numpy.logspace(-5, 2, n_tau)
+    g2 = 1 + 0.2 * numpy.exp(-numpy.outer(tau, rng.uniform(1, 100, n_q)))
+    hframe.create_dataset('xpcs/multitau/normalized_g2', data=g2)
+    hframe.create_dataset('xpcs/multitau/normalized_g2_err', data=numpy.full_like(g2, 0.01))
+    hframe.create_dataset('xpcs/multitau/delay_list', data=tau)
+    hframe.create_dataset('xpcs/qmap/dynamic_v_list_dim0', data=numpy.linspace(0.001, 0.05, n_q))
+    hframe.create_dataset('xpcs/temporal_mean/scattering_2d',
+                          data=rng.random(detector_shape, dtype=numpy.float32))
+    for name in ['analysis_type', 'qmap_hdf5_filename']:
+        write_scalar(hframe, f'xpcs/{name}', f'synthetic_{name}')
+    for name in ['dnoq', 'dnophi', 'snoq', 'snophi', 'avg_frames', 'stride_frames']:
+        write_scalar(hframe, f'xpcs/{name}', numpy.uint64(n_q))
+    for idx in range(n_extra_keys):
+        write_scalar(hframe, f'xpcs/extra/key_{idx}', float(idx))
+
+
+def make_result_hdf(path: pathlib.Path, dataset_name: str = 'H001_27445_QZ_XPCS_test-01000',
+                    size: str = 'small') -> pathlib.Path:
+    """A result HDF with Bluesky style metadata, as read by gather_xpcs_metadata"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(path, 'w') as hframe:
+        metadata = hframe.create_group(BLUESKY_METADATA)
+        write_scalar(metadata, 'dataDir', f'{DATA_DIR}/{dataset_name}')
+        write_scalar(metadata, 'title', dataset_name)
+        write_scalar(metadata, 'owner', 'zhang')
+        write_scalar(metadata, 'detector_name', 'eiger4M')
+        write_scalar(metadata, 'X_energy', 10.0)
+        write_scalar(metadata, 'det_dist', 12.5)
+        write_scalar(metadata, 'num_images', numpy.uint64(1000))
+        metadata.create_dataset('incident_beam_size_nm_xy', data=numpy.array([[10.0, 20.0]]))
+        write_scalar(hframe, 'entry/start_time', '2024-07-17T16:01:36.595827')
+        write_scalar(hframe, 'entry/title', dataset_name)
+        write_results(hframe, **SIZES[size])
+    return path
+
+
+def make_legacy_hdf(path: pathlib.Path, size: str = 'small') -> pathlib.Path:
+    """A pre-Bluesky result HDF with a /measurement group, as read by xpcs_metadata.gather
+    and apply_qmap"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(path, 'w') as hframe:
+        detector = hframe.create_group('measurement/instrument/detector')
+        for name in ['blemish_enabled', 'flatfield_enabled', 'kinetics_enabled', 'lld']:
+            write_scalar(detector, name, numpy.uint64(0))
+        write_scalar(detector, 'sigma', 4.0)
+        write_scalar(detector, 'manufacturer', 'LAMBDA')
+
+        acquisition = hframe.create_group('measurement/instrument/acquisition')
+        for name, value in [('compression', 0), ('dark_begin', 1), ('dark_end', 10), ('data_begin', 11),
+                            ('data_end', 1000), ('specscan_dark_number', 0), ('specscan_data_number', 1)]:
+            write_scalar(acquisition, name, numpy.uint64(value))
+        write_scalar(acquisition, 'datafilename', f'{path.stem}.imm')
+        write_scalar(acquisition, 'parent_folder', '/data/2019-1/comm201901/')
+        write_scalar(acquisition, 'data_folder', path.stem)
+        write_scalar(acquisition, 'specfile', 'comm201901.spec')
+        write_scalar(acquisition, 'root_folder', '/data/2019-1/comm201901/')
+        write_results(hframe, **SIZES[size])
+    return path
+
+
+def make_qmap(path: pathlib.Path, size: str = 'small') -> pathlib.Path:
+    """A qmap with static and dynamic q partitions over the detector, as used by apply_qmap"""
+    n_q, shape = SIZES[size]['n_q'], SIZES[size]['detector_shape']
+    path.parent.mkdir(parents=True, exist_ok=True)
+    yy, xx = numpy.indices(shape)
+    radius = numpy.hypot(yy - shape[0] / 2, xx - shape[1] / 2)
+    qmap = numpy.digitize(radius, numpy.linspace(0, radius.max(), n_q + 1)).astype(numpy.uint32)
+    with h5py.File(path, 'w') as hframe:
+        data = hframe.create_group('data')
+        data.create_dataset('mask', data=numpy.ones(shape, dtype=numpy.uint8))
+        for prefix, mapname in [('d', 'dynamicMap'), ('s', 'staticMap')]:
+            data.create_dataset(mapname, data=qmap)
+            data.create_dataset(f'{prefix}qval', data=numpy.linspace(0.001, 0.1, n_q))
+            data.create_dataset(f'{prefix}qspan', data=numpy.linspace(0.001, 0.1, n_q + 1))
+            data.create_dataset(f'{prefix}phival', data=numpy.zeros(1))
+            data.create_dataset(f'{prefix}phispan', data=numpy.array([-180.0, 180.0]))
+            data.create_dataset(f'{prefix}noq', data=numpy.array([[n_q]], dtype=numpy.uint64))
+            data.create_dataset(f'{prefix}nophi', data=numpy.array([[1]], dtype=numpy.uint64))
+    return path
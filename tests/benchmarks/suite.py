@@ -0,0 +1,87 @@
+"""
+Benchmarks for compute functions which can run locally. Each benchmark takes a fresh
+working directory and a size preset, generates its input files, and returns a function
+to be timed. Setup is never included in the timing.
+"""
+import pathlib
+import h5py
+from tests.benchmarks import generators
+
+DATASET = 'H001_27445_QZ_XPCS_test-01000'
+
+
+def bench_gather_xpcs_metadata(workdir: pathlib.Path, size: str):
+    from gladier_xpcs.tools.gather_xpcs_metadata import gather_xpcs_metadata
+
+    proc_dir = workdir / DATASET
+    hdf_file = generators.make_result_hdf(proc_dir / 'output' / f'{DATASET}.hdf', DATASET, size)
+    data = {
+        'proc_dir': str(proc_dir),
+        'hdf_file': str(hdf_file),
+        'execution_metadata_file': str(proc_dir / 'execution_metadata.json'),
+        'publishv2': {'metadata': {}, 'destination': '/XPCSDATA/Automate/'},
+    }
+    return lambda: gather_xpcs_metadata(**data)
+
+
+def bench_fit_correlation(workdir: pathlib.Path, size: str):
+    from gladier_xpcs.tools.fit_corr import fit_correlation
+
+    proc_dir = workdir / DATASET
+    hdf_file = generators.make_result_hdf(proc_dir / 'output' / f'{DATASET}.hdf', DATASET, size)
+    return lambda: fit_correlation(proc_dir=str(proc_dir), hdf_file=str(hdf_file))
+
+
+def bench_xpcs_metadata_gather(workdir: pathlib.Path, size: str):
+    from gladier_xpcs.tools.xpcs_metadata import gather
+
+    hdf_file = generators.make_legacy_hdf(workdir / f'{DATASET}.hdf', size)
+    return lambda: gather(str(hdf_file))
+
+
+def bench_apply_qmap(workdir: pathlib.Path, size: str):
+    from gladier_xpcs.reprocessing_tools.apply_qmap import apply_qmap
+
+    proc_dir = workdir / DATASET
+    data = {
+        'proc_dir': str(proc_dir),
+        'hdf_file': str(generators.make_legacy_hdf(proc_dir / f'{DATASET}.hdf', size)),
+        'qmap_file': str(generators.make_qmap(proc_dir / 'qmap.h5', size)),
+    }
+    return lambda: apply_qmap(**data)
+
+
+def bench_publish_preparation(workdir: pathlib.Path, size: str):
+    from gladier_xpcs.reprocessing_tools.publish_preparation import publish_preparation
+
+    proc_dir = workdir / DATASET
+    data = {
+        'proc_dir': str(proc_dir),
+        'hdf_file': str(generators.make_result_hdf(proc_dir / f'{DATASET}.hdf', DATASET, size)),
+        'qmap_file': str(generators.make_qmap(proc_dir / 'qmap.h5', size)),
+        'delete_qmap': True,
+        'reprocessing_suffix': '_qmap',
+        'qmap_source_endpoint': 'qmap_source_endpoint',
+        'qmap_source_path': '/GlobusPortal_XPCS/qmap.h5',
+        'globus_endpoint_source': 'globus_endpoint_source',
+        'hdf_file_source': f'/XPCSDATA/Automate/{DATASET}/{DATASET}.hdf',
+        'imm_file_source': f'/XPCSDATA/Automate/{DATASET}/{DATASET}.imm',
+        'pilot': {'metadata': {}},
+    }
+    return lambda: publish_preparation(**data)
+
+
+BENCHMARKS = {
+    'gather_xpcs_metadata': bench_gather_xpcs_metadata,
+    'fit_correlation': bench_fit_correlation,
+    'xpcs_metadata.gather': bench_xpcs_metadata_gather,
+    'apply_qmap': bench_apply_qmap,
+    'publish_preparation': bench_publish_preparation,
+}
+
+
+def get_skip_reason(name: str):
+    """apply_qmap still reads datasets with the h5py 2 only '.value' attribute"""
+    if name == 'apply_qmap' and int(h5py.__version__.split('.')[0]) != 2:
+        return f'requires h5py 2, found {h5py.__version__}'
+    return None
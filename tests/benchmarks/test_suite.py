@@ -0,0 +1,10 @@
+import pytest
+from tests.benchmarks.suite import BENCHMARKS, get_skip_reason
+
+
+@pytest.mark.parametrize('name', BENCHMARKS)
+def test_benchmark_inputs(name, tmp_path):
+    """Ensure generated files can still be read by each compute function"""
+    if get_skip_reason(name):
+        pytest.skip(get_skip_reason(name))
+    BENCHMARKS[name](tmp_path, 'tiny')()
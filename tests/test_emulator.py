@@ -0,0 +1,140 @@
+import pytest
+
+from gladier_xpcs import emulator, failures, latency
+from gladier_xpcs.collections import SharedCollection
+from gladier_xpcs.flows import XPCSBoost
+
+
+def fake_compute(**data):
+    return {'proc_dir': data['proc_dir'], 'execution_time_seconds': 0.1}
+
+
+def failing_compute(**data):
+    raise KeyError('dataDir')
+
+
+@pytest.fixture
+def collections(tmp_path):
+    source = SharedCollection('source', tmp_path / 'source')
+    staging = SharedCollection('staging', tmp_path / 'staging')
+    (source.path / 'data').mkdir(parents=True)
+    (source.path / 'data' / 'A001.hdf').write_text('metadata')
+    return source, staging
+
+
+@pytest.fixture
+def boost_emulator(collections):
+    functions = {name: fake_compute for name in ['xpcs_boost_corr_function_id', 'make_corr_plots_function_id',
+                                                 'fit_correlation_function_id', 'gather_xpcs_metadata_function_id']}
+    emu = emulator.LocalFlowsEmulator(XPCSBoost(auto_registration=False).get_flow_definition(),
+                                      collections, functions=functions, compute_workers=1)
+    yield emu
+    emu.shutdown()
+
+
+def get_flow_input(source, staging, enable_result_transfer=True):
+    proc_dir = str(staging.path / 'A001')
+    return {'input': {
+        'proc_dir': proc_dir,
+        'login_node_endpoint': 'login',
+        'compute_endpoint': 'compute',
+        'source_transfer': {
+            'source_endpoint_id': source.uuid,
+            'destination_endpoint_id': staging.uuid,
+            'transfer_items': [{'source_path': '/data/A001.hdf', 'destination_path': '/A001/input/A001.hdf'}],
+        },
+        'enable_result_transfer': enable_result_transfer,
+        'result_transfer': {
+            'source_endpoint_id': staging.uuid,
+            'destination_endpoint_id': source.uuid,
+            'transfer_items': [{'source_path': '/A001/input', 'destination_path': '/analysis/A001',
+                                'recursive': True}],
+        },
+    }}
+
+
+def test_get_and_set_path():
+    document = {'input': {'items': [{'path': '/a'}]}}
+    assert emulator.get_path(document, '$.input.items[0].path') == '/a'
+    assert emulator.is_present(document, '$.input.missing') is False
+    emulator.set_path(document, '$.Result.details', {'ok': True})
+    assert document['Result'] == {'details': {'ok': True}}
+    assert emulator.set_path(document, '$', {'new': 1}) == {'new': 1}
+
+
+def test_evaluate_rule():
+    document = {'input': {'enabled': True, 'count': 3}}
+    rule = {'And': [{'Variable': '$.input.enabled', 'IsPresent': True},
+                    {'Variable': '$.input.enabled', 'BooleanEquals': True}]}
+    assert emulator.evaluate_rule(rule, document) is True
+    assert emulator.evaluate_rule({'Variable': '$.input.missing', 'BooleanEquals': True}, document) is False
+    assert emulator.evaluate_rule({'Not': {'Variable': '$.input.count', 'NumericGreaterThan': 5}}, document)
+
+
+def test_run_boost_flow(boost_emulator, collections):
+    source, staging = collections
+    run = boost_emulator.run_flow(get_flow_input(source, staging), label='A001')
+    run = boost_emulator.wait(run['run_id'], timeout=60)
+
+    assert run['status'] == 'SUCCEEDED', run['details']
+    assert (source.path / 'analysis' / 'A001' / 'A001.hdf').read_text() == 'metadata'
+    output = run['details']['output']
+    assert output['XpcsBoostCorr']['details']['results'][0]['output']['proc_dir'] == str(staging.path / 'A001')
+
+    logs = boost_emulator.get_run_logs(run['run_id'])
+    states = {d['state'] for d in latency.get_state_durations(logs)}
+    assert {'SourceTransfer', 'XpcsBoostCorr', 'XpcsBoostCorr (execution)', 'ResultTransferDoTransfer',
+            'ProfileTransferSkipTransfer', latency.TOTAL} <= states
+
+
+def test_run_boost_flow_skips_result_transfer(boost_emulator, collections):
+    source, staging = collections
+    run = boost_emulator.run_flow(get_flow_input(source, staging, enable_result_transfer=False))
+    assert boost_emulator.wait(run['run_id'], timeout=60)['status'] == 'SUCCEEDED'
+    assert not (source.path / 'analysis').exists()
+    passed = [e['details']['state_name'] for e in boost_emulator.get_run_logs(run['run_id'])
+              if e['code'] == 'PassCompleted']
+    assert 'ResultTransferSkipTransfer' in passed
+
+
+def test_failed_compute_function_is_classified(collections):
+    source, staging = collections
+    functions = {name: failing_compute if name == 'gather_xpcs_metadata_function_id' else fake_compute
+                 for name in ['xpcs_boost_corr_function_id', 'make_corr_plots_function_id',
+                              'fit_correlation_function_id', 'gather_xpcs_metadata_function_id']}
+    emu = emulator.LocalFlowsEmulator(XPCSBoost(auto_registration=False).get_flow_definition(),
+                                      collections, functions=functions, compute_workers=1)
+    try:
+        run = emu.run_flow(get_flow_input(source, staging))
+        assert emu.wait(run['run_id'], timeout=60)['status'] == 'FAILED'
+        classified = failures.classify_failure(emu.get_run_logs(run['run_id']))
+    finally:
+        emu.shutdown()
+    assert classified['category'] == failures.METADATA_KEY_ERROR
+    assert classified['state_name'] == 'GatherXpcsMetadata'
+
+
+def test_missing_transfer_source_fails(boost_emulator, collections):
+    source, staging = collections
+    flow_input = get_flow_input(source, staging)
+    flow_input['input']['source_transfer']['transfer_items'][0]['source_path'] = '/data/missing.hdf'
+    run = boost_emulator.wait(boost_emulator.run_flow(flow_input)['run_id'], timeout=60)
+    assert run['status'] == 'FAILED'
+    assert run['details']['state_name'] == 'SourceTransfer'
+
+
+def test_run_boost_flow_skips_fit_without_function(collections):
+    # Flows started with pinned function ids may not have one for fit_correlation
+    source, staging = collections
+    functions = {name: fake_compute for name in ['xpcs_boost_corr_function_id', 'make_corr_plots_function_id',
+                                                 'gather_xpcs_metadata_function_id']}
+    emu = emulator.LocalFlowsEmulator(XPCSBoost(auto_registration=False).get_flow_definition(),
+                                      collections, functions=functions, compute_workers=1)
+    try:
+        run = emu.wait(emu.run_flow(get_flow_input(source, staging))['run_id'], timeout=60)
+        passed = [e['details']['state_name'] for e in emu.get_run_logs(run['run_id'])
+                  if e['code'] == 'PassCompleted']
+    finally:
+        emu.shutdown()
+    assert run['status'] == 'SUCCEEDED', run['details']
+    assert 'FitCorrelationSkip' in passed
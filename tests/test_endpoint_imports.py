@@ -0,0 +1,60 @@
+"""
+Compute functions run on endpoints which may only have their own requirements (h5py,
+boost_corr, xpcs_webplot) installed, not gladier_xpcs. Helpers they import from
+gladier_xpcs must be optional.
+"""
+import json
+import sys
+import pytest
+from gladier_xpcs import tracing
+from gladier_xpcs.tools.fit_corr import fit_correlation
+from gladier_xpcs.tools.gather_xpcs_metadata import gather_xpcs_metadata
+from tests.benchmarks import generators, suite
+
+# Modules a compute function may only use if they are installed
+OPTIONAL_MODULES = [
+    'gladier_xpcs.profiling',
+]
+
+
+@pytest.fixture
+def without_gladier_xpcs(monkeypatch):
+    for module in OPTIONAL_MODULES:
+        # A None entry makes any import of the module raise ImportError
+        monkeypatch.setitem(sys.modules, module, None)
+
+
+def test_gather_xpcs_metadata(tmp_path, without_gladier_xpcs):
+    publish_data = suite.bench_gather_xpcs_metadata(tmp_path, 'tiny')()
+    assert publish_data['resources']['name'] == 'gather_xpcs_metadata'
+    with open(publish_data['metadata_file']) as f:
+        project_metadata = json.load(f)['project_metadata']
+    assert project_metadata['preview_categories']['version'] == 1
+    assert project_metadata['metadata_fingerprint'].startswith('v1:')
+
+
+def test_publish_preparation(tmp_path, without_gladier_xpcs):
+    event = suite.bench_publish_preparation(tmp_path, 'tiny')()
+    assert event['proc_dir'].endswith('_qmap')
+    resources = event['resources']
+    assert resources['name'] == 'publish_preparation' and resources['hostname']
+    assert resources['wall_time_seconds'] >= 0 and resources['cpu_time_seconds'] >= 0
+    assert resources['peak_rss_bytes'] > 0
+    assert resources['bytes_read'] >= 0 and resources['bytes_written'] >= 0
+
+
+def test_fit_correlation(tmp_path, without_gladier_xpcs):
+    output = suite.bench_fit_correlation(tmp_path, 'tiny')()
+    assert output['fitted_bins'] == output['total_bins'] == 4
+    assert output['resources']['name'] == 'fit_correlation'
+
+
+def test_compute_spans_recorded(tmp_path, without_gladier_xpcs):
+    proc_dir = tmp_path / suite.DATASET
+    hdf_file = generators.make_result_hdf(proc_dir / 'output' / f'{suite.DATASET}.hdf', suite.DATASET, 'tiny')
+    gather_xpcs_metadata(proc_dir=str(proc_dir), hdf_file=str(hdf_file), trace_id='abc',
+                         execution_metadata_file=str(proc_dir / 'execution_metadata.json'),
+                         publishv2={'metadata': {}, 'destination': '/XPCSDATA/Automate/'})
+    gather, = tracing.load_spans([str(tmp_path)])
+    assert gather['trace_id'] == 'abc' and gather['name'] == 'gather_xpcs_metadata'
+    assert gather['status'] == 'OK' and gather['duration'] >= 0
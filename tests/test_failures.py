@@ -0,0 +1,42 @@
+import pytest
+from gladier_xpcs import failures
+
+
+def failed_entry(state_name, **details):
+    details['state_name'] = state_name
+    return {'code': 'ActionFailed', 'details': details}
+
+
+@pytest.mark.parametrize('entry, category', [
+    (failed_entry('SourceTransfer', error='ActionTimedOut', cause='WaitTime exceeded'),
+     failures.TRANSFER_TIMEOUT),
+    (failed_entry('AcquireNodes', error='ActionTimedOut'),
+     failures.NODE_ACQUISITION_TIMEOUT),
+    (failed_entry('XpcsBoostCorr', output={'exception': 'Command returned non-zero exit status 1'}),
+     failures.CORR_NON_ZERO_EXIT),
+    (failed_entry('GatherXpcsMetadata',
+                  output={'exception': "KeyError: 'entry.instrument.bluesky.metadata.dataDir'"}),
+     failures.METADATA_KEY_ERROR),
+    (failed_entry('PublishIngest', cause='mapper_parsing_exception: failed to parse field'),
+     failures.INGEST_TYPE_CONFLICT),
+    (failed_entry('MakeCorrPlots', cause='Something new and exciting'),
+     failures.UNKNOWN),
+])
+def test_classify_failure(entry, category):
+    result = failures.classify_failure([{'code': 'FlowStarted', 'details': {}}, entry])
+    assert result['category'] == category
+    assert result['state_name'] == entry['details']['state_name']
+    assert result['retryable'] is (category in failures.RETRYABLE)
+
+
+def test_classify_failure_skips_uninformative_entries():
+    entries = [
+        {'code': 'ActionFailed', 'details': {'state_name': 'GatherXpcsMetadata', 'cause': 'unknown'}},
+        {'code': 'FlowFailed', 'details': {'state_name': 'GatherXpcsMetadata', 'cause': 'KeyError'}},
+    ]
+    assert failures.classify_failure(entries)['category'] == failures.METADATA_KEY_ERROR
+
+
+def test_classify_failure_no_entries():
+    result = failures.classify_failure([])
+    assert result == {'category': failures.UNKNOWN, 'state_name': None, 'retryable': True}
@@ -0,0 +1,72 @@
+import json
+
+from gladier_xpcs import fingerprint, ingest
+from gladier_xpcs.tools.gather_xpcs_metadata import gather_xpcs_metadata
+from tests.benchmarks import generators
+
+DATASET = 'H001_27445_QZ_XPCS_test-01000'
+RECORD = {
+    'dc': {'titles': [{'title': 'A001'}], 'dates': [{'date': '2024-07-17T16:01:36', 'dateType': 'Created'}],
+           'publicationYear': '2024'},
+    'project_metadata': {'cycle': '2024-1', 'executable': {'name': 'boost_corr', 'execution_time_seconds': 1.5}},
+}
+
+
+def test_fingerprint_ignores_volatile_fields():
+    expected = fingerprint.get_fingerprint(RECORD)
+    rerun = json.loads(json.dumps(RECORD))
+    rerun['dc']['dates'][0]['date'] = '2025-01-01T00:00:00'
+    rerun['dc']['publicationYear'] = '2025'
+    rerun['project_metadata']['executable']['execution_time_seconds'] = 3.0
+    rerun['project_metadata'][fingerprint.FINGERPRINT_FIELD] = expected
+    # Key order doesn't matter either
+    rerun['project_metadata'] = dict(reversed(list(rerun['project_metadata'].items())))
+    assert fingerprint.get_fingerprint(rerun) == expected
+
+    rerun['project_metadata']['cycle'] = '2024-2'
+    assert fingerprint.get_fingerprint(rerun) != expected
+
+
+def test_fingerprint_store(tmp_path):
+    store = fingerprint.FingerprintStore(tmp_path / 'fingerprints.json')
+    assert store.get('index', 'globus://pub/A001') is None
+    store.update('index', {'globus://pub/A001': 'v1:a'})
+    store.update('index', {'globus://pub/A002': 'v1:b'})
+    assert store.get('index', 'globus://pub/A001') == 'v1:a'
+    assert store.get('other-index', 'globus://pub/A001') is None
+    assert store.load() == {'index': {'globus://pub/A001': 'v1:a', 'globus://pub/A002': 'v1:b'}}
+
+
+def test_split_unchanged(tmp_path):
+    entries = [{'subject': f'globus://pub/A00{i}', 'content': dict(RECORD, extra=i)} for i in range(3)]
+    store = fingerprint.FingerprintStore(tmp_path / 'fingerprints.json')
+    ingest.record_ingested(store, 'index', entries, {
+        'globus://pub/A000': {'status': ingest.SUCCESS},
+        'globus://pub/A001': {'status': ingest.FAILED},
+    })
+    changed, unchanged = ingest.split_unchanged(entries, store, 'index')
+    assert unchanged == entries[:1]
+    assert changed == entries[1:]
+
+
+def test_gather_fingerprints_record(tmp_path):
+    proc_dir = tmp_path / DATASET
+    hdf_file = generators.make_result_hdf(proc_dir / 'output' / f'{DATASET}.hdf', DATASET, 'tiny')
+
+    def gather():
+        publish_data = gather_xpcs_metadata(
+            proc_dir=str(proc_dir), hdf_file=str(hdf_file),
+            execution_metadata_file=str(proc_dir / 'execution_metadata.json'),
+            publishv2={'metadata': {}, 'dataset': str(proc_dir), 'destination': '/XPCSDATA/Automate/',
+                       'index': 'index', 'enable_publish': True},
+        )
+        # Flows always ingest their own record, only xpcs_batch_ingest.py skips unchanged ones
+        assert publish_data['enable_publish'] is True
+        with open(publish_data['metadata_file']) as f:
+            return json.load(f)
+
+    first, second = gather(), gather()
+    assert first['dc']['dates'] != second['dc']['dates']
+    stored = first['project_metadata'][fingerprint.FINGERPRINT_FIELD]
+    assert stored == fingerprint.get_fingerprint(first)
+    assert second['project_metadata'][fingerprint.FINGERPRINT_FIELD] == stored
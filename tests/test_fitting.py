@@ -0,0 +1,83 @@
+import json
+
+import h5py
+import numpy
+
+from gladier_xpcs.tools.fit_corr import fit_correlation
+from tests.benchmarks import generators
+
+DELAY = numpy.logspace(-5, 2, 64)
+
+
+def make_g2(tau, beta, baseline, noise=0.0):
+    rng = numpy.random.default_rng(0)
+    g2 = baseline + beta * numpy.exp(-2 * DELAY[:, None] / tau)
+    return g2 + rng.normal(0, noise, g2.shape) if noise else g2
+
+
+def fit(tmp_path, g2, g2_err=None, q=None) -> dict:
+    """Fit g2 (delays x bins) with fit_correlation, and return the published fit"""
+    hdf_file = tmp_path / 'output' / 'result.hdf'
+    hdf_file.parent.mkdir(parents=True, exist_ok=True)
+    with h5py.File(hdf_file, 'w') as hframe:
+        hframe['xpcs/multitau/delay_list'] = DELAY
+        hframe['xpcs/multitau/normalized_g2'] = g2
+        if g2_err is not None:
+            hframe['xpcs/multitau/normalized_g2_err'] = g2_err
+        if q is not None:
+            hframe['xpcs/dqlist'] = q
+    output = fit_correlation(proc_dir=str(tmp_path), hdf_file=str(hdf_file))
+    with open(output['fit_metadata_file']) as f:
+        return json.load(f)['fit']
+
+
+def test_fit_recovers_parameters(tmp_path):
+    tau = numpy.logspace(-3, 0, 12)
+    beta = numpy.linspace(0.1, 0.3, 12)
+    baseline = numpy.linspace(0.99, 1.01, 12)
+    metadata = fit(tmp_path, make_g2(tau, beta, baseline))
+    assert metadata['fitted_bins'] == metadata['total_bins'] == 12
+    numpy.testing.assert_allclose(metadata['bins']['tau'], tau, rtol=1e-2)
+    numpy.testing.assert_allclose(metadata['bins']['beta'], beta, rtol=1e-2)
+    numpy.testing.assert_allclose(metadata['bins']['baseline'], baseline, rtol=1e-3)
+
+
+def test_fit_with_noise_and_errors(tmp_path):
+    tau = numpy.logspace(-3, 0, 12)
+    g2 = make_g2(tau, 0.2, 1.0, noise=0.002)
+    g2_err = numpy.full_like(g2, 0.002)
+    # Points without an error are ignored, rather than failing the bin
+    g2_err[0, 0] = 0
+    g2[1, 1] = numpy.nan
+    metadata = fit(tmp_path, g2, g2_err)
+    assert metadata['fitted_bins'] == 12
+    numpy.testing.assert_allclose(metadata['bins']['tau'], tau, rtol=0.1)
+
+
+def test_fit_drops_bins_without_a_decay(tmp_path):
+    # Flat, and decaying long after the last delay
+    g2 = numpy.stack([numpy.ones_like(DELAY), 1 + 0.2 * numpy.exp(-2 * DELAY / 1e6)], axis=1)
+    metadata = fit(tmp_path, g2)
+    assert metadata['fitted_bins'] == 0 and metadata['total_bins'] == 2
+    assert 'bins' not in metadata
+
+
+def test_fit_reference_q(tmp_path):
+    tau = numpy.array([1.0, 1.2, 0.05, 0.07, 0.001, 0.001])
+    metadata = fit(tmp_path, make_g2(tau, 0.2, 1.0), q=[0.001, 0.0051, 0.03])
+    assert metadata['fitted_bins'] == metadata['total_bins'] == 6
+    assert metadata['bins']['q'] == numpy.repeat([0.001, 0.0051, 0.03], 2).tolist()
+    # Phi bins at the same q are combined
+    assert metadata['q_0p005']['q'] == 0.0051
+    assert abs(metadata['q_0p005']['tau'] - 0.06) < 1e-3
+    assert 'q_0p002' not in metadata and 'q_0p02' not in metadata
+    # Every value must be a plain number for Search
+    json.dumps(metadata, allow_nan=False)
+
+
+def test_fit_correlation(tmp_path):
+    hdf_file = generators.make_result_hdf(tmp_path / 'output' / 'result.hdf', size='tiny')
+    output = fit_correlation(proc_dir=str(tmp_path), hdf_file=str(hdf_file))
+    metadata = json.loads((tmp_path / 'fit_metadata.json').read_text())
+    assert output['fitted_bins'] == metadata['fit']['fitted_bins'] == 4
+    assert len(metadata['fit']['bins']['q']) == 4
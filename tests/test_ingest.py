@@ -0,0 +1,71 @@
+import json
+
+from gladier_xpcs import ingest
+
+
+class FakeSearchClient:
+    """Fails any ingest holding a subject in bad_subjects"""
+
+    class Response:
+        def __init__(self, data):
+            self.data = data
+
+    def __init__(self, bad_subjects=()):
+        self.bad_subjects = set(bad_subjects)
+        self.ingests = []
+
+    def ingest(self, index, document):
+        self.ingests.append(document)
+        return {'task_id': str(len(self.ingests) - 1)}
+
+    def get_task(self, task_id):
+        subjects = {e['subject'] for e in self.ingests[int(task_id)]['ingest_data']['gmeta']}
+        if subjects & self.bad_subjects:
+            return self.Response({'state': 'FAILED', 'message': 'Invalid document'})
+        return self.Response({'state': 'SUCCESS'})
+
+
+def make_entries(count, size=10):
+    return [{'subject': f'globus://pub/A{i:03}', 'id': 'metadata', 'visible_to': ['public'],
+             'content': {'padding': 'x' * size}} for i in range(count)]
+
+
+def test_batch_entries():
+    entries = make_entries(10)
+    assert [len(b) for b in ingest.batch_entries(entries, max_entries=4)] == [4, 4, 2]
+    entry_size = ingest.get_entry_size(entries[0])
+    assert [len(b) for b in ingest.batch_entries(entries, max_bytes=entry_size * 3)] == [3, 3, 3, 1]
+    # Entries too large on their own are still sent, alone
+    assert [len(b) for b in ingest.batch_entries(entries, max_bytes=1)] == [1] * 10
+
+
+def test_ingest_reports_each_subject():
+    entries = make_entries(10)
+    client = FakeSearchClient(bad_subjects=['globus://pub/A003'])
+    results = ingest.ingest(client, 'index', entries, max_entries=5, poll_interval=0)
+    assert results.pop('globus://pub/A003') == {'status': 'FAILED', 'task_id': '6',
+                                                'error': 'Invalid document'}
+    assert {r['status'] for r in results.values()} == {'SUCCESS'}
+    assert len(results) == 9
+    # Two batches, then halves of the failed batch until the bad subject is alone
+    assert [len(i['ingest_data']['gmeta']) for i in client.ingests] == [5, 5, 2, 3, 1, 2, 1, 1]
+
+
+def test_gather_entry(tmp_path):
+    proc_dir = tmp_path / 'A001'
+    (proc_dir / 'output').mkdir(parents=True)
+    metadata = {'dc': {'titles': [{'title': 'A001'}]},
+                'project_metadata': {'aps_cycle_v2': '2024-1/zhang202402'}}
+    (proc_dir / 'output' / 'xpcs_metadata.json').write_text(json.dumps(metadata))
+    publishv2 = {
+        'destination': '/XPCSDATA/Automate/',
+        'source_collection': 'staging',
+        'source_collection_basepath': str(tmp_path),
+        'destination_collection': 'pub',
+        'index': 'index',
+        'visible_to': ['public'],
+    }
+    entry = ingest.gather_entry(ingest.get_publish_input(proc_dir, publishv2))
+    assert entry['subject'] == 'globus://pub/XPCSDATA/Automate/2024-1/zhang202402/A001'
+    assert entry['content']['project_metadata'] == metadata['project_metadata']
+    assert [f['filename'] for f in entry['content']['files']] == ['xpcs_metadata.json']
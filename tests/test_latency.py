@@ -0,0 +1,72 @@
+from gladier_xpcs import latency
+
+
+def entry(code, time, state_name=None, **details):
+    if state_name:
+        details['state_name'] = state_name
+    return {'code': code, 'time': time, 'details': details}
+
+
+RUN_LOGS = [
+    entry('FlowStarted', '2024-07-17T16:00:00+00:00', input={'input': {
+        'compute_endpoint': 'f8f4692a-0ab7-40d0-b256-ba5b82b5e2ec',
+        'source_transfer': {'source_endpoint_id': 'dc86d51b-81d1-4827-81be-2b5e64ba7dc1'},
+    }}),
+    entry('ActionStarted', '2024-07-17T16:00:00+00:00', 'SourceTransfer'),
+    entry('ActionCompleted', '2024-07-17T16:00:30+00:00', 'SourceTransfer'),
+    entry('ActionStarted', '2024-07-17T16:00:30+00:00', 'XpcsBoostCorr'),
+    entry('ActionCompleted', '2024-07-17T16:02:30+00:00', 'XpcsBoostCorr', output={
+        'XpcsBoostCorr': {'details': {'results': [{'output': {'execution_time_seconds': 20.0}}]}}
+    }),
+    entry('FlowSucceeded', '2024-07-17T16:03:00Z'),
+]
+
+
+def test_get_state_durations():
+    durations = {d['state']: d['seconds'] for d in latency.get_state_durations(RUN_LOGS)}
+    assert durations == {
+        'SourceTransfer': 30,
+        'XpcsBoostCorr': 120,
+        'XpcsBoostCorr (queue wait)': 100,
+        'XpcsBoostCorr (execution)': 20,
+        latency.TOTAL: 180,
+    }
+
+
+def test_get_state_durations_only_splits_own_result():
+    # Output holds the whole flow state, including results of earlier states
+    boost_result = {'XpcsBoostCorr': {'details': {'results': [{'output': {'execution_time_seconds': 20.0}}]}}}
+    run_logs = RUN_LOGS[:-1] + [
+        entry('ActionStarted', '2024-07-17T16:02:30+00:00', 'MakeCorrPlots'),
+        entry('ActionCompleted', '2024-07-17T16:02:50+00:00', 'MakeCorrPlots', output=dict(
+            boost_result, MakeCorrPlots={'details': {'results': [{'output': {'plots': []}}]}}
+        )),
+        RUN_LOGS[-1],
+    ]
+    durations = {d['state']: d['seconds'] for d in latency.get_state_durations(run_logs)}
+    assert durations['MakeCorrPlots'] == 20
+    assert 'MakeCorrPlots (queue wait)' not in durations
+    assert 'MakeCorrPlots (execution)' not in durations
+    assert durations['XpcsBoostCorr (execution)'] == 20
+
+
+def test_get_run_timings():
+    run = {'run_id': 'abc', 'label': 'A001', 'start_time': '2024-07-17T16:00:00+00:00'}
+    timings = latency.get_run_timings(run, RUN_LOGS)
+    assert timings['day'] == '2024-07-17'
+    assert timings['deployment'] == 'voyager-8idi-polaris'
+
+
+def test_percentile():
+    assert latency.percentile([1, 2, 3, 4, 5], 50) == 3
+    assert latency.percentile([1, 2], 95) == 1.95
+    assert latency.percentile([7], 99) == 7
+
+
+def test_summarize():
+    timings = [
+        {'deployment': 'd', 'day': '2024-07-17', 'states': [{'state': 'S', 'seconds': s}]}
+        for s in range(1, 101)
+    ]
+    summary = latency.summarize(timings, group_by=('state',))
+    assert summary == [{'state': 'S', 'count': 100, 'mean': 50.5, 'p50': 50.5, 'p95': 95.05, 'p99': 99.01}]
@@ -0,0 +1,53 @@
+import pytest
+
+from gladier_xpcs import loadgen
+
+
+def entry(code, time, state_name=None):
+    return {'code': code, 'time': time, 'details': {'state_name': state_name} if state_name else {}}
+
+
+def result(run_id, arrival, start, end, status='SUCCEEDED'):
+    return {
+        'arrival': arrival,
+        'run': {'run_id': run_id, 'status': status, 'start_time': start, 'completion_time': end},
+        'run_logs': [
+            entry('FlowStarted', start),
+            entry('ActionStarted', start, 'SourceTransfer'),
+            entry('ActionCompleted', end, 'SourceTransfer'),
+            entry('FlowSucceeded' if status == 'SUCCEEDED' else 'FlowFailed', end),
+        ],
+    }
+
+
+def test_parse_sample():
+    line = 'filePath:/net/wolf/data/A010.hdf fileDataDir:A010 \n'
+    assert loadgen.parse_sample(line) == {'filePath': '/net/wolf/data/A010.hdf', 'fileDataDir': 'A010'}
+
+
+@pytest.mark.parametrize('distribution', list(loadgen.INTERARRIVALS))
+def test_get_arrival_offsets(distribution):
+    offsets = loadgen.get_arrival_offsets(distribution, 2001, 10, seed=1, burst_size=10)
+    assert offsets[0] == 0
+    assert offsets == sorted(offsets)
+    assert offsets[-1] / 2000 == pytest.approx(10, rel=0.15)
+    assert offsets == loadgen.get_arrival_offsets(distribution, 2001, 10, seed=1, burst_size=10)
+
+
+def test_summarize_load():
+    # 2024-07-17T16:00:00Z
+    epoch = 1721232000
+    results = [
+        result('a', epoch, '2024-07-17T16:00:05+00:00', '2024-07-17T16:10:00+00:00'),
+        result('b', epoch + 60, '2024-07-17T16:01:00+00:00', '2024-07-17T16:20:00+00:00'),
+        result('c', epoch + 120, '2024-07-17T16:02:10+00:00', '2024-07-17T16:30:00+00:00', status='FAILED'),
+    ]
+    report = loadgen.summarize_load(results)
+    assert report['succeeded'] == 2
+    assert report['failed'] == 1
+    assert report['elapsed_seconds'] == 1800
+    assert report['datasets_per_hour'] == 4
+    assert report['queue_delay']['p50'] == 5
+    states = {row['state']: row for row in report['stages']}
+    assert states['SourceTransfer']['count'] == 2
+    assert 'Datasets: 3 (2 succeeded, 1 failed)' in loadgen.format_report(report)
@@ -0,0 +1,91 @@
+import json
+import sys
+import types
+from unittest.mock import Mock
+
+import pytest
+
+from gladier_xpcs.permissions import PermissionState
+from gladier_xpcs.tools.publish import publish_gather_metadata, publish_record_acl
+
+PILOT = {'dataset': '/data/A001', 'destination': '2024-1/zhang', 'index': 'index', 'project': 'xpcs',
+         'groups': ['group'], 'source_globus_endpoint': 'source'}
+
+
+@pytest.fixture
+def pilot(monkeypatch):
+    """pilot isn't installed with the test requirements, publish only needs the client"""
+    client = Mock(**{'get_path.return_value': '/XPCSDATA/2024-1/zhang', 'get_endpoint.return_value': 'pub',
+                     'get_globus_transfer_paths.return_value': []})
+    monkeypatch.setitem(sys.modules, 'pilot', types.ModuleType('pilot'))
+    monkeypatch.setitem(sys.modules, 'pilot.client', types.SimpleNamespace(PilotClient=Mock(return_value=client)))
+    exc = types.SimpleNamespace(PilotClientException=type('PilotClientException', (Exception,), {}),
+                                FileOrFolderDoesNotExist=type('FileOrFolderDoesNotExist', (Exception,), {}))
+    monkeypatch.setitem(sys.modules, 'pilot.exc', exc)
+    return client
+
+
+def test_acl_created_until_recorded(tmp_path, pilot):
+    state_file = tmp_path / 'acl_state.json'
+    permissions = publish_gather_metadata(acl_state_file=str(state_file), **PILOT)['permissions']
+    assert permissions['path'] == '/XPCSDATA/2024-1/zhang/'
+    assert permissions['create'] is True and permissions['record'] is True
+    # Not recorded until it's known to exist
+    assert publish_gather_metadata(acl_state_file=str(state_file), **PILOT)['permissions']['create'] is True
+
+    publish_record_acl(set_permission={'status': 'SUCCEEDED'}, **permissions)
+    # Other datasets in the folder skip it, but not for other groups
+    assert publish_gather_metadata(acl_state_file=str(state_file), **PILOT)['permissions']['create'] is False
+    other_group = dict(PILOT, groups=['other-group'])
+    assert publish_gather_metadata(acl_state_file=str(state_file), **other_group)['permissions']['create'] is True
+
+    # Recorded a day ago, so it's created again in case it was removed
+    state = json.loads(state_file.read_text())
+    state['acls']['pub:/XPCSDATA/2024-1/zhang/:group'] -= 24 * 60 * 60
+    state_file.write_text(json.dumps(state))
+    assert publish_gather_metadata(acl_state_file=str(state_file), **PILOT)['permissions']['create'] is True
+
+
+def test_acl_not_recorded_without_a_state_file(pilot):
+    permissions = publish_gather_metadata(**PILOT)['permissions']
+    assert permissions['create'] is True and permissions['record'] is False
+
+
+def test_acl_recorded_only_once_it_exists(tmp_path):
+    state_file = tmp_path / 'acl_state.json'
+    permissions = {'acl_state_file': str(state_file), 'endpoint_id': 'pub',
+                   'path': '/XPCSDATA/2024-1/zhang/', 'principal_identifier': 'group'}
+    failed = {'status': 'FAILED', 'details': {'code': 'ServiceUnavailable'}}
+    assert publish_record_acl(set_permission=failed, **permissions) == {'recorded': False}
+    assert not state_file.exists()
+
+    # Created by another publish first
+    exists = {'status': 'FAILED', 'details': {'code': 'Exists', 'description': 'A duplicate access rule exists'}}
+    assert publish_record_acl(set_permission=exists, **permissions) == {'recorded': True}
+
+    # Trailing slashes don't matter
+    permissions.update(principal_identifier='other-group', path='/XPCSDATA/2024-1/zhang')
+    assert publish_record_acl(set_permission={'status': 'SUCCEEDED'}, **permissions) == {'recorded': True}
+    acls = json.loads(state_file.read_text())['acls']
+    assert set(acls) == {'pub:/XPCSDATA/2024-1/zhang/:group', 'pub:/XPCSDATA/2024-1/zhang/:other-group'}
+
+
+def test_acls_share_the_state_file_with_restores(tmp_path):
+    state = PermissionState(tmp_path / 'permissions_state.json')
+    assert state.claim_restore('comm202410', window=600, now=1000) is True
+    publish_record_acl(set_permission={'status': 'SUCCEEDED'}, acl_state_file=str(state.filename),
+                       endpoint_id='pub', path='/XPCSDATA/2024-1/zhang/', principal_identifier='group')
+    assert set(state.load()) == {'acls', 'restores'}
+
+
+def test_claim_restore_debounces(tmp_path):
+    state = PermissionState(tmp_path / 'permissions_state.json')
+    assert state.claim_restore('comm202410', window=600, now=1000) is True
+    assert state.claim_restore('comm202410', window=600, now=1100) is False
+    assert state.claim_restore('zhang202402', window=600, now=1100) is True
+    assert state.get_pending_restores(window=600, now=1200) == []
+    assert state.get_pending_restores(window=600, now=1600) == ['comm202410']
+
+    # The next claim after the window covers the skipped jobs
+    assert state.claim_restore('comm202410', window=600, now=1600) is True
+    assert state.get_pending_restores(window=600, now=3000) == []
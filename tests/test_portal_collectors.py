@@ -0,0 +1,104 @@
+import sys
+import types
+import pytest
+from unittest.mock import Mock
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+try:
+    import globus_app_flows  # noqa: F401
+except ImportError:
+    # globus_app_flows isn't installed with the test requirements. The batch code under
+    # test only needs the collector base classes to accept their arguments.
+    class Collector:
+        def __init__(self, *args, collection=None, path=None, user=None, **kwargs):
+            self.collection, self.path, self.user = collection, path, user
+
+    for name, collector in [('search', 'SearchCollector'), ('transfer', 'TransferCollector')]:
+        module = types.ModuleType(f'globus_app_flows.collectors.{name}')
+        setattr(module, collector, type(collector, (Collector,), {}))
+        sys.modules[module.__name__] = module
+    sys.modules['globus_app_flows'] = types.ModuleType('globus_app_flows')
+    sys.modules['globus_app_flows.collectors'] = types.ModuleType('globus_app_flows.collectors')
+
+from django.core.cache import cache  # noqa: E402
+from globus_app_flows.collectors.transfer import TransferCollector  # noqa: E402
+from xpcs_portal.xpcs_index.collectors import BatchRunInputMixin, XPCSTransferCollector  # noqa: E402
+
+COLLECTION = '74defd5b-5f61-42fc-bcc4-834c9f376a4f'
+FORM_DATA = {'facility': 'aps8idi-polaris'}
+# Two experiments, each with datasets and the qmaps in its cluster_results folder
+LISTINGS = {
+    '/XPCSDATA/2024-1/comm202401/A001': ['A001.hdf', 'A001.imm'],
+    '/XPCSDATA/2024-1/comm202401/A002': ['A002.hdf', 'A002.imm'],
+    '/XPCSDATA/2024-1/comm202401/cluster_results': ['A001.hdf', 'A002.hdf'],
+    '/XPCSDATA/2024-1/zhang202401/B001': ['B001.hdf', 'B001.imm'],
+    '/XPCSDATA/2024-1/zhang202401/cluster_results': ['B001.hdf'],
+}
+BATCH = [{'name': 'comm202401/A001'}, {'name': 'comm202401/A002'}, {'name': 'zhang202401/B001'}]
+
+
+@pytest.fixture
+def transfer_client():
+    def operation_ls(collection, path):
+        return Mock(data={'DATA': [{'name': n, 'type': 'file'} for n in LISTINGS[path]]})
+    return Mock(operation_ls=Mock(side_effect=operation_ls))
+
+
+@pytest.fixture
+def collector(transfer_client):
+    cache.clear()
+    collector = XPCSTransferCollector(collection=COLLECTION, path='/XPCSDATA/2024-1/', user=Mock(pk=1))
+    collector.get_transfer_client = Mock(return_value=transfer_client)
+    collector.flow_client = Mock(get_xpcs_input=Mock(side_effect=lambda *args: {'input': {'files': args[1:]}}))
+    return collector
+
+
+def test_batch_lists_each_directory_once(collector, transfer_client):
+    results = collector.get_run_inputs(BATCH, FORM_DATA)
+    assert [r['error'] for r in results] == [None, None, None]
+    # Each dataset folder, and one cluster_results folder per experiment
+    assert transfer_client.operation_ls.call_count == 5
+    listed = {c.kwargs['path'] for c in transfer_client.operation_ls.call_args_list}
+    assert listed == set(LISTINGS)
+    qmaps = [r['run_input']['input']['files'][2] for r in results]
+    assert qmaps == ['/XPCSDATA/2024-1/comm202401/cluster_results/A001.hdf',
+                     '/XPCSDATA/2024-1/comm202401/cluster_results/A002.hdf',
+                     '/XPCSDATA/2024-1/zhang202401/cluster_results/B001.hdf']
+
+
+def test_get_run_input_uses_the_batch(collector, transfer_client):
+    results = collector.get_run_inputs(BATCH, FORM_DATA)
+    collector.flow_client.get_xpcs_input.reset_mock()
+    for collector_data, result in zip(BATCH, results):
+        assert collector.get_run_input(collector_data, FORM_DATA) == result['run_input']
+    collector.flow_client.get_xpcs_input.assert_not_called()
+    assert transfer_client.operation_ls.call_count == 5
+
+
+def test_get_run_input_raises_batch_errors(collector):
+    missing = {'name': 'comm202401/A003'}
+    results = collector.get_run_inputs([missing], FORM_DATA)
+    assert results[0]['run_input'] is None and 'A003' in results[0]['error']
+    with pytest.raises(KeyError):
+        collector.get_run_input(missing, FORM_DATA)
+
+
+def test_batch_mixin_is_abstract():
+    class Incomplete(BatchRunInputMixin):
+        def get_batch_key(self, collector_data):
+            return collector_data['name']
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_failed_selections_left_out(collector, monkeypatch):
+    missing = {'name': 'comm202401/A003'}
+    monkeypatch.setattr(TransferCollector, 'get_collector_data', lambda self: BATCH + [missing], raising=False)
+    results = collector.get_run_inputs(collector.get_collector_data(), FORM_DATA)
+    assert [r['key'] for r in results if r['error']] == ['comm202401/A003']
+    # Flows are only started for the selections which could be built
+    assert collector.get_collector_data() == BATCH
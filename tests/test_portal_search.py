@@ -0,0 +1,66 @@
+import math
+import pytest
+from unittest.mock import Mock
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+from django.core.cache import cache  # noqa: E402
+from xpcs_portal.xpcs_index.mixins import CachedSearchView, PaginatedSearchView  # noqa: E402
+
+SUBJECT = 'globus://74defd5b-5f61-42fc-bcc4-834c9f376a4f/XPCSDATA/Automate/A001'
+
+
+def get_gmeta(*entry_ids):
+    return [{'subject': SUBJECT, 'entries': [{'entry_id': entry_id, 'content': {'title': entry_id}}
+                                             for entry_id in entry_ids]}]
+
+
+@pytest.fixture
+def index_info():
+    return {'uuid': 'xpcs', 'fields': [('titles', Mock(side_effect=lambda c: [e['title'] for e in c]))]}
+
+
+@pytest.fixture
+def search_view():
+    cache.clear()
+    view = CachedSearchView()
+    view.request = Mock(user=Mock(pk=1))
+    view.get_index_info = Mock(return_value={})
+    return view
+
+
+def test_processed_records_are_cached(search_view, index_info):
+    first = search_view.process_records(index_info, get_gmeta(None))
+    assert search_view.process_records(index_info, get_gmeta(None)) == first
+    process_titles = index_info['fields'][0][1]
+    assert process_titles.call_count == 1
+
+
+def test_processed_records_depend_on_visible_entries(search_view, index_info):
+    public, = search_view.process_records(index_info, get_gmeta(None))
+    # Another user who can also see the restricted entry of the same subject
+    restricted, = search_view.process_records(index_info, get_gmeta(None, 'restricted'))
+    assert public['titles'] == [None]
+    assert restricted['titles'] == [None, 'restricted']
+    # The first user still doesn't see it
+    assert search_view.process_records(index_info, get_gmeta(None)) == [public]
+
+
+def test_deep_page_clamped_to_last_page():
+    cache.clear()
+    total, per_page = 12000, 50
+
+    def scroll(index_uuid, data):
+        return Mock(data={'gmeta': [{}] * data['limit'], 'has_next_page': True, 'marker': 'next'})
+    client = Mock(post_search=Mock(return_value=Mock(data={'total': total, 'facet_results': []})),
+                  scroll=Mock(side_effect=scroll))
+    view = PaginatedSearchView()
+    view.request = Mock(user=Mock(pk=1))
+    search_client_data = {'q': '*', 'filters': [], 'offset': 10 ** 9, 'limit': per_page}
+
+    response = view.post_search(client, 'xpcs', search_client_data)
+    assert response['offset'] == total - per_page
+    # Only as many scroll requests as it takes to reach the last page
+    assert client.scroll.call_count == math.ceil((total - per_page) / view.scroll_batch_size) + 1
@@ -0,0 +1,53 @@
+import io
+import pytest
+from unittest.mock import Mock
+from PIL import Image
+from xpcs_portal.xpcs_index import thumbnails
+
+URL = 'https://g-1234.fd635.8443.data.globus.org/XPCSDATA/A001/scattering_pattern_log.png'
+
+
+def get_png(width=3840, height=864, mode='RGB'):
+    output = io.BytesIO()
+    Image.new(mode, (width, height)).save(output, format='PNG')
+    return output.getvalue()
+
+
+@pytest.fixture
+def request_image(monkeypatch):
+    request = Mock(return_value=Mock(content=get_png(), is_redirect=False, status_code=200))
+    monkeypatch.setattr(thumbnails.requests, 'request', request)
+    return request
+
+
+def test_make_thumbnail_resizes():
+    image = Image.open(io.BytesIO(thumbnails.make_thumbnail(get_png(), size=480)))
+    assert image.format == 'WEBP'
+    assert image.size == (480, 108)
+
+
+def test_make_thumbnail_converts_mode():
+    image = Image.open(io.BytesIO(thumbnails.make_thumbnail(get_png(100, 100, mode='I;16'), size=480)))
+    assert image.format == 'WEBP'
+    assert image.size == (100, 100)
+
+
+def test_make_thumbnail_invalid_image():
+    with pytest.raises(thumbnails.ThumbnailError):
+        thumbnails.make_thumbnail(b'not an image')
+
+
+def test_get_thumbnail_cached(tmp_path, request_image):
+    cache = thumbnails.ThumbnailCache(tmp_path, max_bytes=10 ** 6)
+    data = thumbnails.get_thumbnail(cache, URL, 'v1', lambda: 'token')
+    assert Image.open(io.BytesIO(data)).size == (480, 108)
+    # Served from the cache, after checking the user's access without fetching the image
+    assert thumbnails.get_thumbnail(cache, URL, 'v1', lambda: 'token') == data
+    assert [c.args[0] for c in request_image.call_args_list] == ['GET', 'HEAD']
+
+
+def test_get_thumbnail_access_denied(tmp_path, request_image):
+    request_image.return_value = Mock(is_redirect=True, status_code=302)
+    cache = thumbnails.ThumbnailCache(tmp_path, max_bytes=10 ** 6)
+    with pytest.raises(thumbnails.ThumbnailAccessDenied):
+        thumbnails.get_thumbnail(cache, URL, 'v1', lambda: 'token')
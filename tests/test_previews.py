@@ -0,0 +1,66 @@
+import json
+import mimetypes
+import pathlib
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+from gladier_xpcs.tools.gather_xpcs_metadata import gather_xpcs_metadata  # noqa: E402
+from xpcs_portal.xpcs_index import fields, filter_regexes  # noqa: E402
+from tests.benchmarks import generators, suite  # noqa: E402
+
+RECORD = pathlib.Path(__file__).parent / 'integration' / 'publish_v1_2024-02-20.json'
+DATASET_URL = ('https://g-f6125.fd635.8443.data.globus.org/XPCSDATA/Automate/2019-1/comm201901/'
+               'A001_Aerogel_1mm_att6_Lq0_001_0001-1000/')
+
+
+def test_classify_previews():
+    files = [
+        {'url': 'a/A001_g2_corr_000_008.png', 'mime_type': 'image/png'},
+        {'url': 'a/A001_g2_corr_fit000_008.png', 'mime_type': 'image/png'},
+        {'url': 'a/A001_intensity_t.png', 'mime_type': 'image/png'},
+        {'url': 'a/scattering_pattern_log.png', 'mime_type': 'image/png'},
+        {'url': 'b/scattering_pattern_log.png', 'mime_type': 'image/png'},
+        {'url': 'boost_corr.log', 'mime_type': 'text/x-log'},
+        {'url': 'a/A001.hdf', 'mime_type': 'application/x-hdf'},
+    ]
+    categories = fields.classify_previews(files)
+    assert categories['correlation_plot_previews'] == [files[0]]
+    assert categories['correlation_plot_with_fit_previews'] == [files[1]]
+    assert categories['intensity_plot_previews'] == [files[2]]
+    assert categories['listing_preview'] is files[3]
+    assert categories['total_intensity_vs_time_preview'] is None
+    assert categories['text_outputs'] == [files[5]]
+    # Only the first listing preview is used, later ones are structural analysis
+    assert categories['structural_analysis_prev'] == [files[4], files[6]]
+
+
+def test_gathered_categories_match_portal(tmp_path):
+    """Categories stored at publish time must match the portal classifying the files"""
+    proc_dir = tmp_path / suite.DATASET
+    hdf_file = generators.make_result_hdf(proc_dir / 'output' / f'{suite.DATASET}.hdf', suite.DATASET, 'tiny')
+    for f in json.loads(RECORD.read_text())['content']['files']:
+        path = proc_dir / f['url'].replace(DATASET_URL, '')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+    publish_data = gather_xpcs_metadata(proc_dir=str(proc_dir), hdf_file=str(hdf_file),
+                                        execution_metadata_file=str(proc_dir / 'execution_metadata.json'),
+                                        publishv2={'metadata': {}, 'destination': '/XPCSDATA/Automate/'})
+    with open(publish_data['metadata_file']) as f:
+        stored = json.load(f)['project_metadata']['preview_categories']
+
+    paths = sorted(p.relative_to(proc_dir).as_posix() for p in proc_dir.rglob('*') if p.is_file())
+    previews = [{'url': p, 'mime_type': 'text/x-log' if p.endswith('.log') else mimetypes.guess_type(p)[0]}
+                for p in paths]
+    expected = fields.classify_previews(previews)
+    assert stored['version'] == fields.PREVIEW_CATEGORIES_VERSION
+    for name in fields.SINGLE_CATEGORIES:
+        assert stored[name] == (expected[name] or {}).get('url')
+    for name in fields.LIST_CATEGORIES:
+        assert stored[name] == [p['url'] for p in expected[name]]
+    assert stored['listing_preview'].endswith(fields.LISTING_PREVIEW)
+    assert stored['text_outputs'] and stored['correlation_plot_previews']
+    assert stored['default_visible'] == [
+        p for p in paths if filter_regexes.SHOW_BY_DEFAULT_PATTERN.match(pathlib.PurePosixPath(p).name)]
+    assert stored['default_visible']
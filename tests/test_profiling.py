@@ -0,0 +1,46 @@
+import pstats
+import shutil
+import subprocess
+from unittest.mock import Mock
+from gladier_xpcs import profiling
+from gladier_xpcs.tools.eigen_corr import eigen_corr
+from gladier_xpcs.tools.gather_xpcs_metadata import gather_xpcs_metadata
+from tests.benchmarks import generators, suite
+
+
+def run_gather(tmp_path, **data):
+    proc_dir = tmp_path / suite.DATASET
+    hdf_file = generators.make_result_hdf(proc_dir / 'output' / f'{suite.DATASET}.hdf', suite.DATASET, 'tiny')
+    gather_xpcs_metadata(proc_dir=str(proc_dir), hdf_file=str(hdf_file),
+                         execution_metadata_file=str(proc_dir / 'execution_metadata.json'),
+                         publishv2={'metadata': {}, 'destination': '/XPCSDATA/Automate/'}, **data)
+    return proc_dir
+
+
+def test_profile_disabled(tmp_path):
+    proc_dir = run_gather(tmp_path)
+    assert not profiling.get_profile_dir(str(proc_dir)).exists()
+
+
+def test_profile_writes_beside_proc_dir(tmp_path):
+    proc_dir = run_gather(tmp_path, profile=True)
+    profile_dir = profiling.get_profile_dir(str(proc_dir))
+    assert profile_dir == tmp_path / profiling.PROFILE_DIRNAME / suite.DATASET
+    assert pstats.Stats(str(profile_dir / 'gather_xpcs_metadata.prof')).total_calls > 0
+    # Nothing is added to the published proc_dir
+    assert not list(proc_dir.rglob('*.prof'))
+
+
+def test_profile_command(tmp_path, monkeypatch):
+    run = Mock(return_value=Mock(stdout=b'', stderr=b''))
+    monkeypatch.setattr(subprocess, 'run', run)
+    monkeypatch.setattr(shutil, 'which', Mock(return_value='/usr/bin/py-spy'))
+    hdf_file = generators.make_result_hdf(tmp_path / 'A001.hdf', 'A001', 'tiny')
+    for profile in (False, True):
+        eigen_corr(proc_dir=str(tmp_path), hdf_file=str(hdf_file), imm_file='A001.imm', profile=profile)
+    (plain,), _ = run.call_args_list[0]
+    (profiled,), _ = run.call_args_list[1]
+    assert plain.startswith('corr ')
+    assert profiled.startswith('/usr/bin/py-spy record')
+    assert profiled.endswith(f'-- {plain}')
+    assert str(profiling.get_profile_dir(str(tmp_path)) / 'eigen_corr.speedscope.json') in profiled
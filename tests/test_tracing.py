@@ -0,0 +1,36 @@
+import pytest
+from gladier_xpcs import tracing
+
+
+def test_span_not_recorded_without_trace_id(tmp_path):
+    span_file = tmp_path / tracing.SPAN_FILENAME
+    with tracing.span('nothing', None, str(span_file)):
+        pass
+    assert not span_file.exists()
+
+
+def test_spans_build_timeline(tmp_path):
+    span_file = tracing.get_span_file(str(tmp_path))
+    trace_id = tracing.new_trace_id()
+    with tracing.span('submit', trace_id, span_file) as attributes:
+        attributes['run_id'] = 'abc'
+    with pytest.raises(ValueError):
+        with tracing.span('gather_xpcs_metadata', trace_id, span_file):
+            raise ValueError('Bad HDF')
+
+    timelines = tracing.build_timelines(tracing.load_spans([str(tmp_path)]))
+    submit, gather = timelines[trace_id]
+    assert submit['attributes'] == {'run_id': 'abc'}
+    assert gather['status'] == 'ERROR'
+    assert trace_id in tracing.format_timeline(trace_id, timelines[trace_id])
+
+
+def test_flow_state_spans():
+    spans = [{'trace_id': 't', 'attributes': {'run_id': 'abc'}}]
+    run_timings = {'abc': {'run_id': 'abc', 'states': [{
+        'state': 'SourceTransfer', 'start': '2024-07-17T16:00:00+00:00',
+        'end': '2024-07-17T16:00:30+00:00', 'seconds': 30, 'status': 'SUCCEEDED'
+    }]}}
+    state_span, = tracing.flow_state_spans(spans, run_timings)
+    assert state_span['name'] == 'flow:SourceTransfer'
+    assert state_span['end'] - state_span['start'] == 30
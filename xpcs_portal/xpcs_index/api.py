@@ -1,6 +1,17 @@
+import hashlib
+import logging
+from urllib.parse import urlparse
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from xpcs_portal.xpcs_index.models import FilenameFilter
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from globus_portal_framework.gclients import load_globus_access_token, load_search_client
+from globus_portal_framework.gsearch import get_index, get_search_filters, get_search_query
+from xpcs_portal.xpcs_index import export, thumbnails
+from xpcs_portal.xpcs_index.models import FilenameFilter, QmapFile, ReprocessingJob
+
+log = logging.getLogger(__name__)
 
 
 @login_required
@@ -11,3 +22,90 @@ def toggle_filename_filter(request, index):
         FilenameFilter.toggle(request.user, request.POST['regex'])
         return JsonResponse({'created': True}, status=201)
     return JsonResponse({'error': 'regex not provided'}, status=400)
+
+
+@login_required
+def export_search_results(request, index):
+    """Stream the metadata for every record matching the search in the query params.
+    Takes the same 'q' and filter params as the search page, plus 'format' (csv,
+    ndjson or parquet) and an optional comma separated list of 'columns'."""
+    export_format = request.GET.get('format', 'csv')
+    columns = [c for c in request.GET.get('columns', '').split(',') if c] or None
+    index_info = get_index(index)
+    filters = get_search_filters(request) + index_info.get('default_filters', [])
+    try:
+        chunks = export.iter_export(load_search_client(request.user), index_info['uuid'],
+                                    get_search_query(request), filters, export_format, columns)
+    except export.ExportError as ee:
+        return JsonResponse({'error': str(ee)}, status=400)
+    response = StreamingHttpResponse(chunks, content_type=export.EXPORT_FORMATS[export_format]['content_type'])
+    filename = f'{index}-export.{export.EXPORT_FORMATS[export_format]["extension"]}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def search_qmaps(request, index):
+    """Qmaps in the catalog matching 'q', for the reprocessing form's autocomplete"""
+    qmaps = QmapFile.search(request.GET.get('q', ''))
+    return JsonResponse({'results': [q.as_json() for q in qmaps]})
+
+
+@login_required
+def reprocessing_job_status(request, index, pk):
+    """Status of a reprocessing job, from the cache the worker updates"""
+    status = ReprocessingJob.get_cached_status(pk, request.user)
+    if status is None:
+        return JsonResponse({'error': 'No reprocessing job found'}, status=404)
+    return JsonResponse(status)
+
+
+def get_thumbnail_access_key(request) -> str:
+    """Set while a user's access to an image is known, checked with their own token"""
+    access = f'{request.user.pk}\n{request.GET.get("url", "")}'
+    return f'xpcs-thumbnail-access-{hashlib.sha256(access.encode()).hexdigest()}'
+
+
+def get_thumbnail_etag(request, index):
+    # Thumbnails are shared between users, only answer 304 for users whose access to
+    # the image has been verified
+    if not cache.get(get_thumbnail_access_key(request)):
+        return None
+    config = get_index(index).get('thumbnails', {})
+    return thumbnails.get_thumbnail_key(request.GET.get('url', ''), request.GET.get('v', ''),
+                                        config.get('size', thumbnails.DEFAULT_SIZE))
+
+
+@login_required
+@condition(etag_func=get_thumbnail_etag)
+def thumbnail(request, index):
+    """Serve a thumbnail of the preview image at 'url'. 'v' is the file's checksum, so a
+    new version of the file gets a new thumbnail and ETag."""
+    config = get_index(index).get('thumbnails')
+    if not config:
+        return JsonResponse({'error': 'Thumbnails are not enabled for this index'}, status=404)
+    url = request.GET.get('url', '')
+    parsed = urlparse(url)
+    if parsed.scheme != 'https' or parsed.hostname not in config['hosts']:
+        return JsonResponse({'error': f'Thumbnails are not available for "{url}"'}, status=400)
+
+    thumbnail_cache = thumbnails.get_cache(config['directory'], config['max_bytes'])
+    access_key = get_thumbnail_access_key(request)
+    size = config.get('size', thumbnails.DEFAULT_SIZE)
+    try:
+        data = thumbnails.get_thumbnail(
+            thumbnail_cache, url, request.GET.get('v', ''),
+            lambda: load_globus_access_token(request.user, config['resource_server']),
+            size, verified=bool(cache.get(access_key)))
+    except thumbnails.ThumbnailAccessDenied as tad:
+        log.info(f'{request.user}: {tad}')
+        return JsonResponse({'error': 'You do not have access to this image'}, status=403)
+    except thumbnails.ThumbnailError as te:
+        log.warning(str(te))
+        return JsonResponse({'error': 'Unable to load thumbnail'}, status=502)
+    cache.set(access_key, True, config.get('access_timeout', thumbnails.ACCESS_TIMEOUT))
+    response = HttpResponse(data, content_type=thumbnails.CONTENT_TYPE)
+    response['ETag'] = quote_etag(thumbnails.get_thumbnail_key(url, request.GET.get('v', ''), size))
+    # The url and version identify this thumbnail, it never changes
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
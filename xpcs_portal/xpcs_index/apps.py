@@ -21,12 +21,36 @@ AVAILABLE_DEPLOYMENTS = {
     'aps8idi-polaris-backup',
 }
 
+# Qmap files offered on the reprocessing form. See qmaps.py and the sync_qmap_catalog command.
+QMAP_LIBRARY = {
+    'collection': RESOURCE_SERVER,
+    'path': '/XPCSDATA/partitionMapLibrary/',
+    # HTTPS server for the collection, qmaps are downloaded from here to be indexed
+    'https_url': 'https://g-f6125.fd635.8443.data.globus.org',
+    'extensions': ['.h5', '.hdf'],
+    # Seconds to keep folder listings
+    'listing_cache_timeout': 60 * 60,
+}
+
 SEARCH_INDEXES = {
     'xpcs': {
         'uuid': '6871e83e-866b-41bc-8430-e3cf83b43bdc',
         'name': 'APS XPCS',
         # 'tagline': 'APS Beamline Data',
         'results_per_page': 50,
+        # Seconds to cache search responses and processed records for
+        'cache_timeout': 60 * 5,
+        # Preview thumbnails served by the portal, see thumbnails.py
+        'thumbnails': {
+            'resource_server': RESOURCE_SERVER,
+            # Only images on these hosts are fetched
+            'hosts': ['g-f6125.fd635.8443.data.globus.org'],
+            'directory': os.getenv('XPCS_THUMBNAIL_DIR', '/tmp/xpcs_thumbnails'),
+            'max_bytes': int(os.getenv('XPCS_THUMBNAIL_MAX_BYTES', 512 * 1024 ** 2)),
+            'size': 480,
+            # Seconds before a user's access to a cached image is checked again
+            'access_timeout': 60 * 10,
+        },
         'group': '',
         'base_templates': 'globus-portal-framework/v2/',
         'tabbed_project': False,
@@ -108,6 +132,29 @@ SEARCH_INDEXES = {
                 "name": "Reprocessed Datasets",
                 "field_name": "project_metadata.reprocessing.suffix",
             },
+            # Fit by the fit_correlation compute function. Any fit field can be range filtered from the url,
+            # ex: filter-range.project_metadata.fit.q_0p005.tau=1--10
+            {
+                "name": "Relaxation Time (s, median over q)",
+                "field_name": "project_metadata.fit.tau_median",
+                "type": "numeric_histogram",
+                "size": 10,
+                "histogram_range": {"low": 0, "high": 100},
+            },
+            {
+                "name": "Contrast (median over q)",
+                "field_name": "project_metadata.fit.beta_median",
+                "type": "numeric_histogram",
+                "size": 10,
+                "histogram_range": {"low": 0, "high": 0.5},
+            },
+            {
+                "name": "Baseline (median over q)",
+                "field_name": "project_metadata.fit.baseline_median",
+                "type": "numeric_histogram",
+                "size": 10,
+                "histogram_range": {"low": 0.9, "high": 1.1},
+            },
         ],
         'facet_modifiers': [
             'xpcs_portal.xpcs_index.modifiers.sort_cycle',
@@ -1,8 +1,13 @@
+import abc
 import logging
 import pathlib
 import urllib
 import copy
 import collections
+import concurrent.futures
+import functools
+import hashlib
+from django.core.cache import cache
 from globus_app_flows.collectors.search import SearchCollector
 from globus_app_flows.collectors.transfer import TransferCollector
 from gladier_xpcs.deployments import deployment_map
@@ -11,40 +16,146 @@ from gladier_xpcs.flows.flow_boost import XPCSBoost
 log = logging.getLogger(__name__)
 
 
-class XPCSTransferCollector(TransferCollector):
+class BatchRunInputMixin(abc.ABC):
+    """Build the run inputs for a whole batch of selections at once.
+
+    prepare_batch() is called first to fetch anything the batch needs up front, then
+    build_run_input() is called for every selection in a thread pool. The flow client is
+    built once and shared. A selection which fails doesn't fail the batch, its error is
+    returned in its place.
+
+    Each result is kept, so the get_run_input() call BatchCreateView makes for each
+    selection when it starts the flows returns the input already built. Selections
+    which failed are left out of get_collector_data() after that, so flows are only
+    started for the rest."""
+    RUN_INPUT_WORKERS = 8
+
+    @functools.cached_property
+    def flow_client(self):
+        return XPCSBoost(login_manager=None)
+
+    @functools.cached_property
+    def run_inputs(self):
+        # Futures for the run inputs built by get_run_inputs(), by batch key
+        return {}
+
+    @abc.abstractmethod
+    def get_batch_key(self, collector_data) -> str:
+        """A unique key for a selection within the batch"""
+
+    def prepare_batch(self, collector_data_list):
+        pass
+
+    @abc.abstractmethod
+    def build_run_input(self, collector_data, form_data) -> dict:
+        """Build the run input for a single selection. Called from a thread pool."""
+
+    def get_collector_data(self):
+        failed = {key for key, future in self.run_inputs.items() if future.exception()}
+        return [c for c in super().get_collector_data() if self.get_batch_key(c) not in failed]
+
+    def get_run_input(self, collector_data, form_data):
+        """Return the run input built for this selection by get_run_inputs(), raising its
+        error if it failed. Selections which weren't part of the batch are built now."""
+        future = self.run_inputs.get(self.get_batch_key(collector_data))
+        if future is None:
+            return self.build_run_input(collector_data, form_data)
+        return future.result()
+
+    def get_run_inputs(self, collector_data_list, form_data) -> list:
+        """Returns a dict for each selection, in order, with its 'key', and either its
+        'run_input' or an 'error' message."""
+        self.prepare_batch(collector_data_list)
+        # Build the client before any threads need it
+        self.flow_client
+        with concurrent.futures.ThreadPoolExecutor(self.RUN_INPUT_WORKERS) as executor:
+            futures = [executor.submit(self.build_run_input, c, form_data) for c in collector_data_list]
+        results = []
+        for collector_data, future in zip(collector_data_list, futures):
+            key = self.get_batch_key(collector_data)
+            self.run_inputs[key] = future
+            try:
+                results.append({"key": key, "run_input": future.result(), "error": None})
+            except Exception as e:
+                log.warning(f"Unable to build run input for {key}: {e}")
+                results.append({"key": key, "run_input": None, "error": str(e)})
+        return results
+
+
+class XPCSTransferCollector(BatchRunInputMixin, TransferCollector):
 
     import_string = "xpcs_portal.xpcs_index.collectors.XPCSTransferCollector"
     SKIP_FOLDERS = ["ALCF_results", "cluster_results", "logs"]
+    # Seconds to keep directory listings in the shared cache
+    LISTING_CACHE_TIMEOUT = 60 * 10
+    # Directories listed at once when prefetching a batch
+    LISTING_WORKERS = 8
 
     def __init__(self, *args, **kwargs):
-        self.cluster_results = None
+        # Listings for this batch, checked before the shared cache
+        self.listings = {}
         # super().__init__(collection="74defd5b-5f61-42fc-bcc4-834c9f376a4f", path="/XPCSDATA/2019-1/comm201901/", user=kwargs["user"])
         super().__init__(*args, **kwargs)
 
-    def get_files(self, globus_dir: str):
+    def get_listing_cache_key(self, globus_dir: str) -> str:
+        # Listings are per user, since not every user can see every directory
+        user = getattr(self, "user", None)
+        listing = f"{self.collection}:{globus_dir}:{getattr(user, 'pk', None)}"
+        return f"xpcs-listing-{hashlib.sha256(listing.encode()).hexdigest()}"
+
+    def list_directory(self, globus_dir: str, transfer_client=None) -> list:
+        """List a directory, using this batch's listings or the shared cache if possible"""
+        globus_dir = str(globus_dir)
+        if globus_dir in self.listings:
+            return self.listings[globus_dir]
+        cache_key = self.get_listing_cache_key(globus_dir)
+        entries = cache.get(cache_key)
+        if entries is None:
+            tc = transfer_client or self.get_transfer_client()
+            response = tc.operation_ls(self.collection, path=globus_dir)
+            entries = [{"name": f["name"], "type": f["type"]} for f in response.data["DATA"]]
+            cache.set(cache_key, entries, self.LISTING_CACHE_TIMEOUT)
+        self.listings[globus_dir] = entries
+        return entries
+
+    def list_directories(self, globus_dirs: list):
+        """List many directories at once, so each is ready when the batch gets to it.
+        A directory which can't be listed is logged and left for list_directory to
+        raise on when it's used."""
+        globus_dirs = {str(d) for d in globus_dirs} - set(self.listings)
+        if not globus_dirs:
+            return
         tc = self.get_transfer_client()
-        response = tc.operation_ls(self.collection, path=globus_dir)
+        with concurrent.futures.ThreadPoolExecutor(self.LISTING_WORKERS) as executor:
+            futures = {executor.submit(self.list_directory, d, tc): d for d in globus_dirs}
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception():
+                    log.warning(f"Unable to list {futures[future]}: {future.exception()}")
+
+    def prefetch_listings(self, names: list):
+        """List the dataset folders for a batch, and the cluster_results folders for the
+        experiments they belong to"""
+        datasets = [pathlib.Path(self.path) / name for name in names]
+        cluster_dirs = {d.parent / "cluster_results" for d in datasets}
+        self.list_directories(datasets + list(cluster_dirs))
+
+    def get_files(self, globus_dir: str):
         return [
             str(pathlib.Path(globus_dir) / f["name"])
-            for f in response.data["DATA"]
+            for f in self.list_directory(globus_dir)
             if f["type"] == "file"
         ]
 
     def get_cluster_results(self, hdf_file: str):
-        if self.cluster_results:
-            log.debug(f"Fetching CACHED cluster results")
-            return self.cluster_results
-
         cluster_dir = pathlib.Path(hdf_file).parent.parent / "cluster_results"
-        self.cluster_results = self.get_files(cluster_dir)
-        return self.cluster_results
+        return self.get_files(cluster_dir)
 
     def get_qmap_file(self, hdf_file: str):
         for f in self.get_cluster_results(hdf_file):
             if pathlib.Path(hdf_file).name == pathlib.Path(f).name:
                 return f
 
-    def get_run_input(self, collector_data, form_data):
+    def build_run_input(self, collector_data, form_data):
         """
         This is the main interesting method. Collect all files for running this XPCS dataset.
         """
@@ -58,12 +169,19 @@ class XPCSTransferCollector(TransferCollector):
         qmap_file = self.get_qmap_file(hdf_file)
         deployment = deployment_map[form_data["facility"]]
 
-        run_input = XPCSBoost(login_manager=None).get_xpcs_input(
+        run_input = self.flow_client.get_xpcs_input(
             deployment, imm_file, hdf_file, qmap_file
         )
         run_input["input"].update(deployment.function_ids)
         return run_input
 
+    def get_batch_key(self, collector_data):
+        return collector_data["name"]
+
+    def prepare_batch(self, collector_data_list):
+        # List every dataset folder up front, rather than one at a time in each thread
+        self.prefetch_listings([c["name"] for c in collector_data_list])
+
     def get_run_start_kwargs(self, collector_data, form_data):
         return {
             "label": pathlib.Path(collector_data["name"]).name,
@@ -77,7 +195,7 @@ class XPCSTransferCollector(TransferCollector):
         }
 
 
-class XPCSSearchCollector(SearchCollector):
+class XPCSSearchCollector(BatchRunInputMixin, SearchCollector):
 
     import_string = "xpcs_portal.xpcs_index.collectors.XPCSSearchCollector"
 
@@ -111,9 +229,24 @@ class XPCSSearchCollector(SearchCollector):
             path = path.parent
         return path
 
-    def get_run_input(self, collector_data, form_data):
-        files = collector_data["entries"][0]["content"]["files"]
-        input_files = self.get_files_based_on_parent(files, "input")
+    @functools.cached_property
+    def input_files(self):
+        # Input files parsed from each record's file urls, by subject
+        return {}
+
+    def get_input_files(self, collector_data) -> list:
+        """Get the input files for a record, parsing its file urls only the first time"""
+        subject = collector_data["subject"]
+        if subject not in self.input_files:
+            files = collector_data["entries"][0]["content"]["files"]
+            self.input_files[subject] = self.get_files_based_on_parent(files, "input")
+        return self.input_files[subject]
+
+    def get_batch_key(self, collector_data):
+        return collector_data["subject"]
+
+    def build_run_input(self, collector_data, form_data):
+        input_files = self.get_input_files(collector_data)
         hdf_file = self.get_file_by_extension(input_files, ".hdf")
         imm_file = self.get_file_by_extension(input_files, ".imm")
         deployment = deployment_map[form_data["facility"]]
@@ -127,13 +260,12 @@ class XPCSSearchCollector(SearchCollector):
         if deployment.service_account is False:
             gpu_flag = -1
         log.info(f"GPU Flag set to {gpu_flag} for service account {deployment.__class__.__name__}")
-        return XPCSBoost(login_manager=None).get_xpcs_input(
+        return self.flow_client.get_xpcs_input(
             deployment, imm_file, hdf_file, qmap_file, gpu_flag=gpu_flag
         )
 
     def get_run_start_kwargs(self, collector_data, form_data):
-        files = collector_data["entries"][0]["content"]["files"]
-        input_files = self.get_files_based_on_parent(files, "input")
+        input_files = self.get_input_files(collector_data)
         hdf_file = self.get_file_by_extension(input_files, ".hdf")
         return {
             "label": pathlib.Path(hdf_file).name,
@@ -155,9 +287,8 @@ class XPCSSuffixSearchCollector(XPCSSearchCollector):
 
     import_string = "xpcs_portal.xpcs_index.collectors.XPCSSuffixSearchCollector"
 
-    def get_run_input(self, collector_data, form_data):
-        files = collector_data["entries"][0]["content"]["files"]
-        input_files = self.get_files_based_on_parent(files, "input")
+    def build_run_input(self, collector_data, form_data):
+        input_files = self.get_input_files(collector_data)
         hdf_file = self.get_file_by_extension(input_files, ".hdf")
         imm_file = self.get_file_by_extension(input_files, ".imm")
 
@@ -0,0 +1,200 @@
+"""
+Stream the project_metadata of every record matching a search to CSV, NDJSON or Parquet.
+
+Records are paged through with the Globus Search scroll API, so exports aren't limited
+to the first 10,000 results. Pages are fetched in a background thread into a bounded
+queue, so the next page is on its way while the current one is written out, and at
+most prefetch_pages pages are held in memory no matter how many records match.
+
+Columns default to the fields picked out for the detail page (CHERRY_PICKED_FIELDS),
+preceded by the record subject. Parquet requires pyarrow.
+"""
+import csv
+import io
+import json
+import queue
+import threading
+from xpcs_portal.xpcs_index.fields import CHERRY_PICKED_FIELDS
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+DEFAULT_COLUMNS = ['subject'] + CHERRY_PICKED_FIELDS
+# Records per scroll request
+PAGE_SIZE = 1000
+# Pages fetched ahead of the one being written
+PREFETCH_PAGES = 2
+# Rows in each Parquet row group. Rows are held in memory until a group is written.
+PARQUET_ROW_GROUP_SIZE = 10000
+
+EXPORT_FORMATS = {
+    'csv': {'content_type': 'text/csv', 'extension': 'csv'},
+    'ndjson': {'content_type': 'application/x-ndjson', 'extension': 'ndjson'},
+    'parquet': {'content_type': 'application/vnd.apache.parquet', 'extension': 'parquet'},
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def iter_records(client, index_uuid: str, query: str, filters: list, page_size: int = PAGE_SIZE,
+                 prefetch_pages: int = PREFETCH_PAGES):
+    """Yield every GMeta result matching the query, scrolling through Search in a
+    background thread. Errors fetching a page are raised from here."""
+    pages = queue.Queue(maxsize=prefetch_pages)
+    stop = threading.Event()
+
+    def put(item):
+        # Give up if the consumer goes away, rather than blocking on a full queue forever
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch():
+        data, marker = {'q': query, 'filters': filters, 'limit': page_size}, None
+        try:
+            while True:
+                response = client.scroll(index_uuid, dict(data, marker=marker) if marker else data)
+                if not put(response.data['gmeta']) or not response.data.get('has_next_page'):
+                    break
+                marker = response.data['marker']
+        except Exception as e:
+            put(e)
+        put(None)
+
+    threading.Thread(target=fetch, daemon=True).start()
+    try:
+        while True:
+            page = pages.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+    finally:
+        stop.set()
+
+
+def get_row(gmeta: dict, columns: list) -> dict:
+    """Pick columns out of a record's project_metadata. 'subject' is the record subject."""
+    content = gmeta['entries'][0]['content'] if gmeta.get('entries') else {}
+    metadata = content.get('project_metadata', {})
+    return {c: gmeta['subject'] if c == 'subject' else metadata.get(c) for c in columns}
+
+
+def get_scalar(value):
+    """Flatten lists and dicts to JSON, for formats which only hold scalars"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return value
+
+
+def iter_csv(rows, columns: list):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow({k: get_scalar(v) for k, v in row.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def iter_ndjson(rows, columns: list):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+class ChunkSink(io.RawIOBase):
+    """A write-only file which hands back everything written to it since the last read"""
+
+    def __init__(self):
+        self.chunks, self.position = [], 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def read_written(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def get_parquet_schema(rows: list, columns: list):
+    """Columns holding only numbers in the first row group are float64, everything else is
+    a string. Metadata has no fixed schema, so types can't be known ahead of time."""
+    fields = []
+    for column in columns:
+        values = [r[column] for r in rows if r[column] is not None]
+        numeric = values and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+        fields.append(pyarrow.field(column, pyarrow.float64() if numeric else pyarrow.string()))
+    return pyarrow.schema(fields)
+
+
+def get_parquet_value(value, pyarrow_type):
+    if value is None:
+        return None
+    if pyarrow_type == pyarrow.float64():
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    value = get_scalar(value)
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def iter_parquet(rows, columns: list, row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+    sink, writer, schema, group = ChunkSink(), None, None, []
+
+    def write_group():
+        nonlocal writer, schema
+        if writer is None:
+            schema = get_parquet_schema(group, columns)
+            writer = pyarrow.parquet.ParquetWriter(sink, schema)
+        converted = [{f.name: get_parquet_value(r[f.name], f.type) for f in schema} for r in group]
+        writer.write_table(pyarrow.Table.from_pylist(converted, schema=schema))
+        group.clear()
+
+    for row in rows:
+        group.append(row)
+        if len(group) >= row_group_size:
+            write_group()
+            yield sink.read_written()
+    if group or writer is None:
+        write_group()
+    writer.close()
+    yield sink.read_written()
+
+
+WRITERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+    'parquet': iter_parquet,
+}
+
+
+def iter_export(client, index_uuid: str, query: str, filters: list, export_format: str = 'csv',
+                columns: list = None):
+    """Yield chunks of the export for every record matching the query. CSV and NDJSON
+    chunks are str, Parquet chunks are bytes."""
+    if export_format not in WRITERS:
+        raise ExportError(f'Unknown export format "{export_format}", choose from {list(WRITERS)}')
+    if export_format == 'parquet' and pyarrow is None:
+        raise ExportError('Parquet export requires pyarrow, please install it with "pip install pyarrow"')
+    columns = columns or DEFAULT_COLUMNS
+    rows = (get_row(gmeta, columns) for gmeta in iter_records(client, index_uuid, query, filters))
+    return WRITERS[export_format](rows, columns)
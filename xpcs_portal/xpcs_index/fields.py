@@ -1,9 +1,67 @@
+import collections
 import os
+import posixpath
+import threading
 from urllib.parse import urlsplit, urlencode, urlunsplit
 from xpcs_portal.xpcs_index.templatetags.xpcs_filters import format_aps_cycle_v2
 
-LISTING_PREVIEW = 'scattering_pattern_log.png'
+_preview_cache = threading.local()
+
+# Bump this when the preview rules below change. gather_xpcs_metadata stores categories
+# in records when they're published, under the same rules and version. Records stored
+# with any other version are classified again here.
+PREVIEW_CATEGORIES_VERSION = 1
 
+LISTING_PREVIEW = 'scattering_pattern_log.png'
+TOTAL_INTENSITY_PREVIEW = 'total_intensity_vs_time.png'
+TEXT_OUTPUT_MIME_TYPE = 'text/x-log'
+
+# Categories holding a single preview (the first match). The rest hold lists.
+SINGLE_CATEGORIES = ['listing_preview', 'total_intensity_vs_time_preview']
+LIST_CATEGORIES = [
+    'correlation_plot_previews',
+    'correlation_plot_with_fit_previews',
+    'intensity_plot_previews',
+    'text_outputs',
+    'structural_analysis_prev',
+]
+
+
+# Fields shown in the detail summary, in order. Also the default columns for exports.
+CHERRY_PICKED_FIELDS = [
+    'aps_cycle_v2',
+    'measurement.instrument.acquisition.parent_folder',
+    'measurement.instrument.acquisition.datafilename',
+    'measurement.instrument.acquisition.data_folder',
+
+    'xpcs.data_begin',
+    'xpcs.data_begin_todo',
+    'xpcs.data_end',
+    'xpcs.data_end_todo',
+    'xpcs.qmap_hdf5_filename',
+
+    'measurement.instrument.acquisition.stage_x',
+    'measurement.instrument.acquisition.stage_z',
+    'measurement.instrument.acquisition.attenuation',
+
+    'measurement.instrument.detector.exposure_time',
+    'measurement.instrument.detector.exposure_period',
+    'measurement.instrument.detector.manufacturer',
+
+    'measurement.instrument.source_begin.beam_intensity_transmitted',
+    'measurement.instrument.source_begin.current',
+    'measurement.instrument.source_begin.datetime',
+    'measurement.instrument.source_begin.energy',
+
+    'measurement.instrument.source_end.current',
+    'measurement.instrument.source_end.datetime',
+
+    'measurement.sample.translation',
+    'measurement.sample.translation_table',
+    'measurement.sample.orientation',
+    'measurement.sample.temperature_A',
+    'measurement.sample.temperature_A_set',
+]
 
 
 def cherry_picked_detail(result):
@@ -16,40 +74,6 @@ def cherry_picked_detail(result):
         if group['name'] == 'Instrument Acquisition Measurements':
             if len(aps_cycle) > 0:
                 group['fields'].append(aps_cycle[0])
-    cherry_list = [
-        'aps_cycle_v2',
-        'measurement.instrument.acquisition.parent_folder',
-        'measurement.instrument.acquisition.datafilename',
-        'measurement.instrument.acquisition.data_folder',
-
-        'xpcs.data_begin',
-        'xpcs.data_begin_todo',
-        'xpcs.data_end',
-        'xpcs.data_end_todo',
-        'xpcs.qmap_hdf5_filename',
-
-        'measurement.instrument.acquisition.stage_x',
-        'measurement.instrument.acquisition.stage_z',
-        'measurement.instrument.acquisition.attenuation',
-
-        'measurement.instrument.detector.exposure_time',
-        'measurement.instrument.detector.exposure_period',
-        'measurement.instrument.detector.manufacturer',
-
-        'measurement.instrument.source_begin.beam_intensity_transmitted',
-        'measurement.instrument.source_begin.current',
-        'measurement.instrument.source_begin.datetime',
-        'measurement.instrument.source_begin.energy',
-
-        'measurement.instrument.source_end.current',
-        'measurement.instrument.source_end.datetime',
-
-        'measurement.sample.translation',
-        'measurement.sample.translation_table',
-        'measurement.sample.orientation',
-        'measurement.sample.temperature_A',
-        'measurement.sample.temperature_A_set',
-    ]
     # Groups are ordered manually by the order they appear in this list.
     # Uncomment the below lines to list all available groups
     # from pprint import pprint
@@ -66,8 +90,8 @@ def cherry_picked_detail(result):
     cherries = []
     for group in all_groups:
         dict_info = {'name': group['name']}
-        fields = [f for f in group['fields'] if f['field'] in cherry_list]
-        fields.sort(key=lambda fset: cherry_list.index(fset['field']))
+        fields = [f for f in group['fields'] if f['field'] in CHERRY_PICKED_FIELDS]
+        fields.sort(key=lambda fset: CHERRY_PICKED_FIELDS.index(fset['field']))
         dict_info['fields'] = fields
         cherries.append(dict_info)
     cherries.sort(key=lambda g: group_order.index(g['name']))
@@ -130,69 +154,40 @@ def detail_field_groups(result):
 
 
 def listing_preview(result):
-    for entry in fetch_all_previews(result):
-        if entry['url'].endswith(LISTING_PREVIEW):
-            return entry
+    return get_preview_categories(result)['listing_preview']
 
 
 def correlation_plot_previews(result):
-    return [
-        entry for entry in fetch_all_previews(result)
-        if 'g2_corr' in entry['url'] and 'g2_corr_fit' not in entry['url']
-    ]
+    return get_preview_categories(result)['correlation_plot_previews']
 
 
 def correlation_plot_with_fit_previews(result):
-    return [
-        entry for entry in fetch_all_previews(result)
-        if 'g2_corr_fit' in entry['url'] or
-           entry['url'].endswith('_corr_params.png')
-    ]
+    return get_preview_categories(result)['correlation_plot_with_fit_previews']
 
 
 def intensity_plot_previews(result):
-    return [
-        entry for entry in fetch_all_previews(result)
-        if entry and
-        entry['url'].endswith('intensity.png') or
-        entry['url'].endswith('intensity_t.png')
-    ]
+    return get_preview_categories(result)['intensity_plot_previews']
 
 
 def text_outputs(result):
-    return [
-        entry for entry in fetch_all_previews(result)
-        if entry['mime_type'] == 'text/x-log'
-    ]
+    return get_preview_categories(result)['text_outputs']
 
 
 def total_intensity_vs_time_preview(result):
-    prev = [
-        entry for entry in fetch_all_previews(result)
-        if entry and entry['url'].endswith('total_intensity_vs_time.png')
-    ]
-    if prev:
-        return prev[0]
+    return get_preview_categories(result)['total_intensity_vs_time_preview']
 
 
 def structural_analysis_prev(result):
     """Structural Analysis are any beamlines that aren't correlation plots
     (and also not the listing image). """
-    other_prevs = (
-        correlation_plot_previews(result) +
-        correlation_plot_with_fit_previews(result) +
-        [listing_preview(result)] +
-        [total_intensity_vs_time_preview(result)] +
-        intensity_plot_previews(result) +
-        text_outputs(result)
-    )
-    other_urls = [p['url'] for p in other_prevs if p]
-    previews = [entry for entry in fetch_all_previews(result)
-                if entry['url'] not in other_urls]
-    return previews
+    return get_preview_categories(result)['structural_analysis_prev']
 
 
 def fetch_all_previews(result):
+    return get_preview_categories(result)['all_preview']
+
+
+def build_previews(result):
     # Gather base previews from the remote file manifest
     base_previews = {
         entry['url']: {
@@ -201,7 +196,9 @@ def fetch_all_previews(result):
             'name': get_xpcs_field_title(entry['filename'], ''),
             'url': entry.get('https_url') or entry['url'],
             'filename': entry['filename'],
-            'mime_type': entry['mime_type']
+            'mime_type': entry['mime_type'],
+            # Changes whenever the file does, for caching thumbnails
+            'version': entry.get('sha256') or entry.get('md5') or '',
         } for entry in result[0].get('files', {})}
     # If the user provided 'preview' info, overwrite the manifest entry with
     # the 'preview' entry
@@ -216,6 +213,90 @@ def fetch_all_previews(result):
     return sorted(previews, key=lambda p: p['url'], reverse=False)
 
 
+def get_categories(url, mime_type):
+    """Every category a preview could belong to, by its url and mime type"""
+    matched = []
+    if url.endswith(LISTING_PREVIEW):
+        matched.append('listing_preview')
+    if url.endswith(TOTAL_INTENSITY_PREVIEW):
+        matched.append('total_intensity_vs_time_preview')
+    if 'g2_corr' in url and 'g2_corr_fit' not in url:
+        matched.append('correlation_plot_previews')
+    if 'g2_corr_fit' in url or url.endswith('_corr_params.png'):
+        matched.append('correlation_plot_with_fit_previews')
+    if url.endswith(('intensity.png', 'intensity_t.png')):
+        matched.append('intensity_plot_previews')
+    if mime_type == TEXT_OUTPUT_MIME_TYPE:
+        matched.append('text_outputs')
+    return matched
+
+
+def classify_previews(previews):
+    """Sort previews into each category in one pass. A preview may land in more
+    than one category, and any preview in none of them is structural analysis."""
+    categories = {name: None for name in SINGLE_CATEGORIES}
+    categories.update({name: [] for name in LIST_CATEGORIES})
+    for preview in previews:
+        # Only the first listing and total intensity previews are used
+        matched = [name for name in get_categories(preview['url'], preview['mime_type'])
+                   if name not in SINGLE_CATEGORIES or categories[name] is None]
+        for name in matched:
+            if name in SINGLE_CATEGORIES:
+                categories[name] = preview
+            else:
+                categories[name].append(preview)
+        if not matched:
+            categories['structural_analysis_prev'].append(preview)
+    categories['all_preview'] = previews
+    return categories
+
+
+def lookup_previews(previews, stored):
+    """Build the categories from the ones stored in the record when it was published.
+    Stored categories hold paths relative to the dataset, which are found by filename
+    and checked against the end of the url. Previews are also marked with whether
+    they are shown by default."""
+    by_filename = collections.defaultdict(list)
+    for preview in previews:
+        by_filename[preview.get('filename')].append(preview)
+
+    def lookup(path):
+        for preview in by_filename.get(posixpath.basename(path), []):
+            if preview['url'].endswith(f'/{path}'):
+                return preview
+
+    categories = {'all_preview': previews}
+    for name in SINGLE_CATEGORIES:
+        categories[name] = lookup(stored[name]) if stored.get(name) else None
+    for name in LIST_CATEGORIES:
+        categories[name] = [p for p in map(lookup, stored.get(name, [])) if p is not None]
+    default_visible = {id(p) for p in map(lookup, stored.get('default_visible', [])) if p is not None}
+    for preview in previews:
+        preview['default_visible'] = id(preview) in default_visible
+    return categories
+
+
+def get_stored_categories(result):
+    """Preview categories stored at publish time, if the record has current ones"""
+    stored = result[0].get('project_metadata', {}).get('preview_categories')
+    if stored and stored.get('version') == PREVIEW_CATEGORIES_VERSION:
+        return stored
+
+
+def get_preview_categories(result):
+    """Build and classify previews once per result. Every field processor for a
+    result is called in turn with the same content, so only the last result needs
+    to be kept (per thread, since requests may be served concurrently)."""
+    cached = getattr(_preview_cache, 'entry', None)
+    if cached is None or cached[0] is not result[0]:
+        previews, stored = build_previews(result), get_stored_categories(result)
+        # Records published before categories were stored are classified here
+        categories = lookup_previews(previews, stored) if stored else classify_previews(previews)
+        cached = (result[0], categories)
+        _preview_cache.entry = cached
+    return cached[1]
+
+
 def get_full_description(result):
     try:
         return result[0]['dc']['descriptions'][0]['description']
@@ -1,3 +1,4 @@
+import functools
 import logging
 import re
 
@@ -24,6 +25,9 @@ RANGE_REGEXES = [
     r'.+(_g2_corr_)(\d\d\d)_(\d\d\d).png',
 ]
 
+# Filenames shown until a user turns them off. Every other preview is hidden until a
+# user turns it on. gather_xpcs_metadata stores which files match this in records when
+# they're published, keep its copy the same.
 SHOW_BY_DEFAULT = [
     'scattering_pattern_log.png',
     'total_intensity_vs_time.png',
@@ -59,3 +63,37 @@ def check_range(filename):
         if match:
             fmt_strings = zip(['name', 'low', 'high'], match.groups())
             return RANGE_REGEX_TEMPLATE.format(**dict(fmt_strings))
+
+
+def combine_regexes(regexes):
+    """Compile many regexes into one pattern which matches if any of them would.
+    Regexes which fail to compile on their own are skipped."""
+    valid = []
+    for regex in regexes:
+        try:
+            re.compile(regex)
+            valid.append(regex)
+        except re.error:
+            log.warning(f'Skipping invalid filename filter regex: {regex}')
+    if valid:
+        return re.compile('|'.join(f'(?:{regex})' for regex in valid))
+
+
+SHOW_BY_DEFAULT_PATTERN = combine_regexes(SHOW_BY_DEFAULT)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_matcher(regexes):
+    """Build a function which returns True if a filename should be shown, given a
+    tuple of a user's filter regexes. Matchers are cached, so users with the same
+    filters share one. Pass default if it's already known whether the filename is shown
+    by default (records classify their previews when they are published), to skip
+    matching it against SHOW_BY_DEFAULT."""
+    pattern = combine_regexes(regexes)
+
+    def match(filename, default=None):
+        show = bool(pattern and pattern.match(filename))
+        if (SHOW_BY_DEFAULT_PATTERN.match(filename) if default is None else default):
+            show = not show
+        return show
+    return match
@@ -0,0 +1,207 @@
+"""
+Benchmark the XPCS search and detail pages against recorded Globus Search records.
+
+A recorded search record is copied into as many results as needed, and served by a
+replay search client instead of Globus Search, so no network access or tokens are
+required. Pages are fetched with the Django test client against a throwaway test
+database. Each field processor in SEARCH_INDEXES and FilenameFilter.get_matcher are timed,
+and database queries are counted per request. Caching is disabled, so every request
+processes its results from scratch.
+
+Usage:
+
+    python manage.py benchmark_portal
+    python manage.py benchmark_portal --sizes 50 500 --output portal_benchmark.json
+"""
+import collections
+import copy
+import functools
+import json
+import pathlib
+import time
+from unittest import mock
+from urllib.parse import quote_plus
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.urls import reverse
+
+from xpcs_portal.xpcs_index.models import FilenameFilter
+from xpcs_portal.xpcs_index.views import XPCSSearchView
+
+RECORD = pathlib.Path(__file__).parents[4] / 'tests' / 'integration' / 'publish_v1_2024-02-20.json'
+INDEX = 'xpcs'
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class ReplayResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class ReplaySearchClient:
+    """Serve a fixed list of GMeta results, in place of a globus_sdk.SearchClient"""
+
+    def __init__(self, gmeta: list):
+        self.gmeta = gmeta
+        self.subjects = {g['subject']: g for g in gmeta}
+
+    def post_search(self, index_uuid, data):
+        offset, limit = int(data.get('offset', 0)), int(data.get('limit', 10))
+        page = self.gmeta[offset:offset + limit]
+        return ReplayResponse({
+            'gmeta': page,
+            'facet_results': [],
+            'count': len(page),
+            'offset': offset,
+            'total': len(self.gmeta),
+        })
+
+    def get_subject(self, index_uuid, subject):
+        return ReplayResponse(self.subjects[subject])
+
+
+class Timings:
+    """Accumulate the number of calls and total time spent in wrapped functions"""
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[name] += time.perf_counter() - start
+                self.calls[name] += 1
+        return timed
+
+    def rows(self):
+        return [{
+            'name': name,
+            'calls': self.calls[name],
+            'total_ms': round(self.seconds[name] * 1000, 2),
+            'mean_ms': round(self.seconds[name] * 1000 / self.calls[name], 4),
+        } for name, _ in self.seconds.most_common()]
+
+
+def load_gmeta(record_file: pathlib.Path, count: int) -> list:
+    """Copy a single recorded ingest document into `count` GMeta results, each with
+    its own subject and title so nothing is shared between results."""
+    record = json.loads(record_file.read_text())
+    gmeta = []
+    for idx in range(count):
+        content = copy.deepcopy(record['content'])
+        title = f'{content["dc"]["titles"][0]["title"]}_{idx:05d}'
+        content['dc']['titles'][0]['title'] = title
+        gmeta.append({
+            'subject': f'{record["subject"]}_{idx:05d}',
+            'entries': [{'content': content, 'entry_id': record.get('id')}],
+        })
+    return gmeta
+
+
+def get_timed_indexes(timings: Timings) -> dict:
+    """Wrap each field processor for the index with a timer"""
+    indexes = copy.deepcopy(settings.SEARCH_INDEXES)
+    indexes[INDEX]['fields'] = [
+        (field[0], timings.wrap(field[0], field[1]))
+        if isinstance(field, tuple) and callable(field[1]) else field
+        for field in indexes[INDEX]['fields']
+    ]
+    return indexes
+
+
+def add_filename_filters(user, gmeta: list):
+    """Toggle every preview of the first result, so the filename matcher has a
+    realistic number of regexes to check."""
+    for entry in gmeta[0]['entries'][0]['content'].get('files', []):
+        if entry['filename'].endswith('.png'):
+            FilenameFilter.toggle(user, entry['filename'])
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the XPCS search and detail views with recorded search records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[50, 500, 5000],
+                            help='Number of results to process for each search page')
+        parser.add_argument('--record', default=str(RECORD),
+                            help='A recorded search ingest document, used for every result')
+        parser.add_argument('--detail-requests', type=int, default=50,
+                            help='Number of detail pages to fetch for each size')
+        parser.add_argument('--output', required=False, help='Write full results to this JSON file')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user = User.objects.create_user('benchmark')
+            results = [self.benchmark(user, size, options) for size in options['sizes']]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for result in results:
+            self.report(result)
+        if options['output']:
+            pathlib.Path(options['output']).write_text(json.dumps(results, indent=2))
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def benchmark(self, user, size: int, options: dict) -> dict:
+        gmeta = load_gmeta(pathlib.Path(options['record']), size)
+        add_filename_filters(user, gmeta)
+        search_client = ReplaySearchClient(gmeta)
+        client = Client()
+        client.force_login(user)
+
+        result = {'size': size}
+        for view, urls in [
+            ('search', [reverse('xpcs-index:search', kwargs={'index': INDEX})]),
+            ('detail', [reverse('xpcs-index:detail', kwargs={'index': INDEX, 'subject': quote_plus(g['subject'])})
+                        for g in gmeta[:options['detail_requests']]]),
+        ]:
+            timings = Timings()
+            get_matcher = timings.wrap('FilenameFilter.get_matcher', FilenameFilter.get_matcher.__func__)
+            with override_settings(SEARCH_INDEXES=get_timed_indexes(timings), CACHES=NO_CACHE), \
+                    mock.patch('globus_portal_framework.views.generic.load_search_client',
+                               return_value=search_client), \
+                    mock.patch('globus_portal_framework.gsearch.load_search_client',
+                               return_value=search_client), \
+                    mock.patch('xpcs_portal.xpcs_index.mixins.load_search_client',
+                               return_value=search_client), \
+                    mock.patch.object(XPCSSearchView, 'results_per_page', size), \
+                    mock.patch.object(FilenameFilter, 'get_matcher', classmethod(get_matcher)), \
+                    CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for url in urls:
+                    response = client.get(url)
+                    if response.status_code != 200:
+                        raise ValueError(f'{url} returned {response.status_code}')
+                seconds = time.perf_counter() - start
+
+            result[view] = {
+                'requests': len(urls),
+                'total_ms': round(seconds * 1000, 2),
+                'mean_ms': round(seconds * 1000 / len(urls), 2),
+                'queries_per_request': round(len(queries) / len(urls), 2),
+                'functions': timings.rows(),
+            }
+        return result
+
+    def report(self, result: dict):
+        for view in ('search', 'detail'):
+            vr = result[view]
+            self.stdout.write(
+                f'\n{view.capitalize()} view, {result["size"]} results: {vr["requests"]} request(s), '
+                f'{vr["mean_ms"]}ms per request, {vr["queries_per_request"]} queries per request'
+            )
+            self.stdout.write(f'  {"Function":<40}{"Calls":>8}{"Total (ms)":>14}{"Mean (ms)":>12}')
+            for row in vr['functions']:
+                self.stdout.write(f'  {row["name"]:<40}{row["calls"]:>8}{row["total_ms"]:>14}{row["mean_ms"]:>12}')
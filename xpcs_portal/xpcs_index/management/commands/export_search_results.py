@@ -0,0 +1,70 @@
+"""
+Export the metadata for every record matching a search, the same as the export endpoint.
+
+Usage:
+
+    python manage.py export_search_results --user jdoe --filter aps_cycle_v2=2024-1 -o 2024-1.csv
+    python manage.py export_search_results -q 'A001*' --format parquet -o A001.parquet
+"""
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from globus_portal_framework.gclients import load_search_client
+from globus_portal_framework.gsearch import get_index
+
+from xpcs_portal.xpcs_index import export
+
+
+class Command(BaseCommand):
+    help = 'Export the metadata for every record matching a search to CSV, NDJSON or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-q', '--query', default='*')
+        parser.add_argument('--filter', action='append', default=[],
+                            help='field=value, may be given more than once')
+        parser.add_argument('--format', choices=list(export.EXPORT_FORMATS), default='csv')
+        parser.add_argument('--columns', default=None,
+                            help='Comma separated project_metadata fields, defaults to the detail page fields')
+        parser.add_argument('-o', '--output', default=None, help='Defaults to stdout for csv and ndjson')
+        parser.add_argument('--index', default='xpcs')
+        parser.add_argument('--user', default=None,
+                            help='Search as this user. Without one, only public records are exported.')
+
+    def get_filters(self, filters):
+        parsed = {}
+        for f in filters:
+            if '=' not in f:
+                raise CommandError(f'Filters must be given as field=value, got "{f}"')
+            field, value = f.split('=', 1)
+            parsed.setdefault(field, []).append(value)
+        return [{'field_name': field, 'type': 'match_any', 'values': values}
+                for field, values in parsed.items()]
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user "{options["user"]}" found')
+        if options['format'] == 'parquet' and not options['output']:
+            raise CommandError('Parquet exports must be written to a file with --output')
+
+        index_info = get_index(options['index'])
+        filters = self.get_filters(options['filter']) + index_info.get('default_filters', [])
+        columns = options['columns'].split(',') if options['columns'] else None
+        try:
+            chunks = export.iter_export(load_search_client(user), index_info['uuid'], options['query'],
+                                        filters, options['format'], columns)
+            if options['output']:
+                mode = 'wb' if options['format'] == 'parquet' else 'w'
+                with open(options['output'], mode) as fh:
+                    for chunk in chunks:
+                        fh.write(chunk)
+                self.stderr.write(f'Exported to {options["output"]}')
+            else:
+                for chunk in chunks:
+                    sys.stdout.write(chunk)
+        except export.ExportError as ee:
+            raise CommandError(str(ee))
@@ -0,0 +1,100 @@
+"""
+Submit queued reprocessing jobs, started from the portal's reprocessing pages.
+
+Each job is the form POST a user made. It's replayed through the same view as that
+user, which starts the flows, and the job's status is updated for the progress page.
+Jobs are submitted one at a time, oldest first, and no faster than --rate per minute.
+More than one worker may run at once, each job is only claimed by one of them.
+
+Usage:
+
+    python manage.py reprocessing_worker
+    python manage.py reprocessing_worker --rate 2 --once
+"""
+import logging
+import time
+
+from django.contrib.messages.storage import default_storage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from xpcs_portal.xpcs_index.models import ReprocessingJob
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Submit queued portal reprocessing jobs, with rate limiting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=6.0,
+                            help='Most jobs to submit per minute')
+        parser.add_argument('--poll', type=float, default=5.0,
+                            help='Seconds to wait before checking an empty queue again')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty, instead of waiting for more jobs')
+        parser.add_argument('--requeue-running', action='store_true',
+                            help='Queue jobs left running by a worker which stopped, before starting')
+
+    def handle(self, *args, **options):
+        if options['requeue_running']:
+            requeued = ReprocessingJob.objects.filter(status=ReprocessingJob.RUNNING).update(
+                status=ReprocessingJob.QUEUED, date_started=None)
+            self.stderr.write(f'Queued {requeued} running jobs again')
+
+        interval = 60 / options['rate']
+        last_submitted = None
+        while True:
+            close_old_connections()
+            job = ReprocessingJob.get_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            if last_submitted is not None:
+                time.sleep(max(0, last_submitted + interval - time.monotonic()))
+            if not job.claim():
+                continue
+            last_submitted = time.monotonic()
+            self.submit(job)
+
+    def get_request(self, job):
+        """Rebuild the request the user made when they submitted the form"""
+        path = reverse(job.view_name, kwargs=job.view_kwargs)
+        url = f'{path}?{job.query_string}' if job.query_string else path
+        request = RequestFactory().post(url, data=job.post_data)
+        request.user = job.user
+        # A session which is never saved, holding what the user's session held
+        request.session = SessionBase()
+        request.session.update(job.session_data)
+        request._messages = default_storage(request)
+        request.resolver_match = resolve(path)
+        # Tells the view to start the flows now, rather than queue the job again
+        request.reprocessing_job = job
+        return request
+
+    def get_form_errors(self, response) -> str:
+        form = (getattr(response, 'context_data', None) or {}).get('form')
+        if form is not None and form.errors:
+            return form.errors.as_text()
+        return f'The reprocessing page returned status {response.status_code}'
+
+    def submit(self, job):
+        self.stderr.write(f'Submitting job {job.pk}: {job}')
+        try:
+            request = self.get_request(job)
+            match = request.resolver_match
+            response = match.func(request, *match.args, **match.kwargs)
+        except Exception as e:
+            log.exception(f'Reprocessing job {job.pk} failed')
+            job.finish(ReprocessingJob.FAILED, error=str(e))
+            return
+        if 300 <= response.status_code < 400:
+            job.finish(ReprocessingJob.SUCCEEDED, result_url=response['Location'])
+        else:
+            job.finish(ReprocessingJob.FAILED, error=self.get_form_errors(response))
+        self.stderr.write(f'Job {job.pk} {job.status.lower()}')
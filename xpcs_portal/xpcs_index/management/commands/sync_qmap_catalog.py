@@ -0,0 +1,45 @@
+"""
+Update the catalog of qmap files offered on the reprocessing form.
+
+Lists every cycle folder in the partitionMapLibrary, and indexes files which are new or
+have changed since the last sync. Run it periodically (from cron) as a user who can
+read the library.
+
+Usage:
+
+    python manage.py sync_qmap_catalog --user jdoe
+    python manage.py sync_qmap_catalog --user jdoe --cycle 2024-1 --reindex
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from globus_portal_framework.gclients import load_globus_access_token, load_transfer_client
+
+from xpcs_portal.xpcs_index import qmaps
+from xpcs_portal.xpcs_index.apps import QMAP_LIBRARY
+
+
+class Command(BaseCommand):
+    help = 'List the partitionMapLibrary and update the qmap catalog for the reprocessing form'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True,
+                            help='List and download qmaps with this user\'s tokens')
+        parser.add_argument('--cycle', action='append', default=[],
+                            help='Only sync this cycle, may be given more than once')
+        parser.add_argument('--reindex', action='store_true',
+                            help='Index every file again, even ones which have not changed')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'No user "{options["user"]}" found')
+        if qmaps.h5py is None:
+            self.stderr.write('h5py is not installed, detector dimensions and bin counts will not be recorded')
+
+        counts = qmaps.sync_catalog(
+            load_transfer_client(user),
+            lambda: load_globus_access_token(user, QMAP_LIBRARY['collection']),
+            QMAP_LIBRARY, cycles=options['cycle'], reindex=options['reindex'],
+        )
+        self.stderr.write(', '.join(f'{count} {outcome}' for outcome, count in counts.items()))
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("xpcs_index", "0001_new_2023_11_16_initial_xpcs_migration"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReprocessingJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("view_name", models.CharField(max_length=128)),
+                ("view_kwargs", models.JSONField(default=dict)),
+                ("query_string", models.TextField(blank=True)),
+                ("post_data", models.JSONField(default=dict)),
+                ("session_data", models.JSONField(default=dict)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("QUEUED", "Queued"),
+                            ("RUNNING", "Running"),
+                            ("SUCCEEDED", "Succeeded"),
+                            ("FAILED", "Failed"),
+                        ],
+                        db_index=True,
+                        default="QUEUED",
+                        max_length=16,
+                    ),
+                ),
+                ("error", models.TextField(blank=True)),
+                ("result_url", models.CharField(blank=True, max_length=512)),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                ("date_started", models.DateTimeField(blank=True, null=True)),
+                ("date_finished", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date_created"],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("xpcs_index", "0002_reprocessingjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QmapFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path", models.CharField(max_length=512, unique=True)),
+                ("name", models.CharField(db_index=True, max_length=256)),
+                ("cycle", models.CharField(db_index=True, max_length=32)),
+                ("size", models.BigIntegerField(null=True)),
+                ("last_modified", models.DateTimeField(null=True)),
+                ("checksum", models.CharField(blank=True, max_length=64)),
+                ("detector_rows", models.IntegerField(null=True)),
+                ("detector_cols", models.IntegerField(null=True)),
+                ("dynamic_q_bins", models.IntegerField(null=True)),
+                ("dynamic_phi_bins", models.IntegerField(null=True)),
+                ("static_q_bins", models.IntegerField(null=True)),
+                ("static_phi_bins", models.IntegerField(null=True)),
+                ("date_indexed", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-cycle", "name"],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# The qmaps the reprocessing form offered before the catalog, so the form still has them
+# until sync_qmap_catalog first runs. The sync indexes them, or removes any which are gone.
+SEED_CYCLE = "2019-1"
+SEED_QMAPS = [
+    "Rigaku_test.h5",
+    "Rigaku_test_2.h5",
+    "Rigaku_test_3.h5",
+    "comm201901_qmap_aerogel_Lq0.h5",
+    "conrad201902_qmap_Aerogel_Lq0_S360_D72.h5",
+    "conrad201902_qmap_Star_S260_D36_lin.h5",
+    "conrad201902_qmap_Star_S260_D36_lin_D061.h5",
+    "conrad201902_qmap_polymer_Lq0_S270_D54_log.h5",
+    "conrad201902_qmap_polymer_Lq0_S360_D36_log.h5",
+]
+
+
+def get_seed_path(name):
+    return f"/XPCSDATA/partitionMapLibrary/{SEED_CYCLE}/{name}"
+
+
+def seed_qmaps(apps, schema_editor):
+    QmapFile = apps.get_model("xpcs_index", "QmapFile")
+    for name in SEED_QMAPS:
+        QmapFile.objects.get_or_create(
+            path=get_seed_path(name), defaults={"name": name, "cycle": SEED_CYCLE}
+        )
+
+
+def remove_seeded_qmaps(apps, schema_editor):
+    # Only remove seeds the sync never indexed
+    QmapFile = apps.get_model("xpcs_index", "QmapFile")
+    QmapFile.objects.filter(
+        path__in=[get_seed_path(name) for name in SEED_QMAPS], checksum=""
+    ).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("xpcs_index", "0003_qmapfile"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_qmaps, remove_seeded_qmaps),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("xpcs_index", "0004_seed_qmapfile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reprocessingjob",
+            name="run_input_errors",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,13 +1,46 @@
+import hashlib
+import json
+import logging
 import math
+import threading
+from urllib.parse import quote_plus, unquote_plus
+from django.core.cache import cache
 from globus_portal_framework.views.generic import SearchView
-from globus_portal_framework.gsearch import get_index
+from globus_portal_framework.gsearch import get_index, process_search_data
+from globus_portal_framework.gclients import get_user_groups, load_search_client
 
+log = logging.getLogger(__name__)
+
+
+class CachedSearchResponse:
+    """Stands in for the globus_sdk response from post_search, which can't be cached"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __getitem__(self, key):
+        return self.data[key]
 
 
 class PaginatedSearchView(SearchView):
+    """Paginate search results, including pages past the Globus Search offset limit.
+
+    Pages up to maximum_pagination are fetched with a regular offset search. Deeper
+    pages are fetched with the Search scroll API, which pages with a marker instead
+    of an offset. Markers are cached per query, so each deep page only needs one scroll
+    request once the page before it has been seen, and the next page is prefetched in
+    the background while the user reads the current one. The first time a query goes
+    past the limit, the first maximum_pagination results are skipped in batches of
+    scroll_batch_size. Pages past the last result are shown the last page.
+
+    Scroll doesn't support sorting, so deep pages follow the index order rather than
+    the order of the pages before them."""
     results_per_page = 50
     # Maximum offset defined in Globus Search
     maximum_pagination = 10000
+    # Results fetched per scroll request when skipping ahead to a deep page
+    scroll_batch_size = 1000
+    scroll_cache_timeout = 60 * 5
 
     def __init__(self, *args, **kwargs):
         kwargs['results_per_page'] = self.results_per_page
@@ -16,18 +49,112 @@ class PaginatedSearchView(SearchView):
     def process_result(self, *args, **kwargs):
         # Include pagination in results
         result = super().process_result(*args, **kwargs)
-        result['search']['pagination'] = self.get_pagination(result['search']['total'],
-                                                             result['search']['offset'],
-                                                             self.get_results_per_page())
+        total, offset = result['search']['total'], result['search']['offset']
+        per_page = self.get_results_per_page()
+        if total > self.maximum_pagination:
+            result['search']['pagination'] = self.get_deep_pagination(total, offset, per_page)
+        else:
+            result['search']['pagination'] = self.get_pagination(total, offset, per_page)
         return result
 
     @property
     def page(self):
-        max_page = self.maximum_pagination // self.results_per_page
-        page = super().page
-        if int(page) > max_page:
-            page = max_page
-        return str(page)
+        try:
+            return str(max(int(super().page), 1))
+        except ValueError:
+            return '1'
+
+    def post_search(self, client, index_uuid, search_client_data):
+        offset, limit = search_client_data['offset'], search_client_data['limit']
+        if offset + limit <= self.maximum_pagination:
+            response = super().post_search(client, index_uuid, search_client_data)
+            if offset + 2 * limit > self.maximum_pagination and response.data['total'] > offset + limit:
+                # The next page is past the limit, start scrolling to it now
+                scroll_data = self.get_scroll_data(search_client_data)
+                self.prefetch_scroll_page(client, index_uuid, scroll_data, offset + limit)
+            return response
+
+        # Facets and the total still come from a regular search, without any results
+        summary = super().post_search(client, index_uuid, dict(search_client_data, offset=0, limit=0))
+        # Pages past the last result show the last page, instead of scrolling through the
+        # whole index looking for them
+        last_page_offset = max(math.ceil(summary.data['total'] / limit) - 1, 0) * limit
+        if offset > last_page_offset:
+            return self.post_search(client, index_uuid, dict(search_client_data, offset=last_page_offset))
+        scroll_data = self.get_scroll_data(search_client_data)
+        gmeta = self.get_scroll_page(client, index_uuid, scroll_data, offset)
+        if offset + limit < summary.data['total']:
+            self.prefetch_scroll_page(client, index_uuid, scroll_data, offset + limit)
+        return CachedSearchResponse(dict(summary.data, gmeta=gmeta, offset=offset, count=len(gmeta)))
+
+    def get_scroll_data(self, search_client_data):
+        return {
+            'q': search_client_data['q'],
+            'filters': search_client_data['filters'],
+            'limit': search_client_data['limit'],
+        }
+
+    def get_scroll_cache_key(self, index_uuid, scroll_data):
+        """Markers are tied to the user's credentials, so they aren't shared"""
+        scroll = json.dumps([index_uuid, scroll_data, self.request.user.pk], sort_keys=True, default=str)
+        return f'xpcs-scroll-{hashlib.sha256(scroll.encode()).hexdigest()}'
+
+    def get_scroll_marker(self, client, index_uuid, scroll_data, offset):
+        """Get the marker which starts scrolling at offset. Scrolling starts from the
+        furthest cached marker before the offset, and every marker found along the
+        way is cached. Returns None if the offset is past the last result."""
+        markers_key = f'{self.get_scroll_cache_key(index_uuid, scroll_data)}-markers'
+        markers = cache.get(markers_key) or {0: ''}
+        position = max(p for p in markers if p <= offset)
+        marker = markers[position]
+        while position < offset:
+            limit = min(self.scroll_batch_size, offset - position)
+            response = self.scroll(client, index_uuid, dict(scroll_data, limit=limit), marker)
+            if not response.data.get('has_next_page'):
+                return None
+            position, marker = position + limit, response.data['marker']
+            markers[position] = marker
+        cache.set(markers_key, markers, self.scroll_cache_timeout)
+        return marker
+
+    def scroll(self, client, index_uuid, scroll_data, marker):
+        # An empty marker starts from the first result
+        return client.scroll(index_uuid, dict(scroll_data, marker=marker) if marker else scroll_data)
+
+    def get_scroll_page(self, client, index_uuid, scroll_data, offset):
+        page_key = f'{self.get_scroll_cache_key(index_uuid, scroll_data)}-{offset}'
+        gmeta = cache.get(page_key)
+        if gmeta is not None:
+            return gmeta
+        marker = self.get_scroll_marker(client, index_uuid, scroll_data, offset)
+        if marker is None:
+            return []
+        response = self.scroll(client, index_uuid, scroll_data, marker)
+        gmeta = response.data['gmeta']
+        if response.data.get('has_next_page'):
+            # Save scrolling through this page again for the page after it
+            markers_key = f'{self.get_scroll_cache_key(index_uuid, scroll_data)}-markers'
+            markers = cache.get(markers_key) or {0: ''}
+            markers[offset + scroll_data['limit']] = response.data['marker']
+            cache.set(markers_key, markers, self.scroll_cache_timeout)
+        cache.set(page_key, gmeta, self.scroll_cache_timeout)
+        return gmeta
+
+    def prefetch_scroll_page(self, client, index_uuid, scroll_data, offset):
+        """Fetch the page at offset in the background, unless it's already cached or
+        another request is already fetching it"""
+        page_key = f'{self.get_scroll_cache_key(index_uuid, scroll_data)}-{offset}'
+        if cache.get(page_key) is not None or not cache.add(f'{page_key}-prefetch', True, 60):
+            return
+
+        def prefetch():
+            try:
+                self.get_scroll_page(client, index_uuid, scroll_data, offset)
+            except Exception:
+                log.debug(f'Unable to prefetch search page at offset {offset}', exc_info=True)
+            finally:
+                cache.delete(f'{page_key}-prefetch')
+        threading.Thread(target=prefetch, daemon=True).start()
 
 
     def get_results_per_page(self):
@@ -79,3 +206,116 @@ class PaginatedSearchView(SearchView):
                 'high': offset + per_page if offset + per_page < total_results else total_results
                 }
         }
+
+    def get_deep_pagination(self, total_results, offset, per_page):
+        """Pagination for results which go past maximum_pagination. Numbered pages
+        cover the results reachable by offset, with 'previous' and 'next' links to
+        step through the rest one page at a time."""
+        max_page = self.maximum_pagination // per_page
+        current_page = offset // per_page + 1
+        pagination = self.get_pagination(total_results, min(offset, (max_page - 1) * per_page), per_page)
+        if current_page > max_page:
+            pagination['pages'] = pagination['pages'] + [{'number': current_page}]
+        pagination['current_page'] = current_page
+        pagination['current_range'] = {
+            'low': offset,
+            'high': min(offset + per_page, total_results),
+        }
+        pagination['previous_page'] = current_page - 1 if current_page > max_page else None
+        has_next = current_page >= max_page and offset + per_page < total_results
+        pagination['next_page'] = current_page + 1 if has_next else None
+        return pagination
+
+
+class CachedSearchView(SearchView):
+    """Cache raw Globus Search responses and the processed fields for each record.
+
+    Search responses are keyed by the index, the full search request (query, filters,
+    facets, page and sort), and the set of groups the user belongs to, since records
+    are only visible through group membership. Processed records are keyed by subject
+    and the ids of the entries the user can see, so a record already processed for one
+    page or query isn't processed again for another, but users who can see different
+    entries of the same subject don't share it. Both expire after the index's
+    'cache_timeout' in seconds."""
+    cache_timeout = 60 * 5
+
+    def get_cache_timeout(self):
+        return self.get_index_info().get('cache_timeout', self.cache_timeout)
+
+    def get_user_group_ids(self):
+        """Get the ids of the user's groups, cached so the Groups API isn't called on
+        every search. If groups can't be fetched, the user's own id is used instead
+        so nothing is shared with other users."""
+        user = self.request.user
+        cache_key = f'xpcs-user-groups-{user.pk}'
+        group_ids = cache.get(cache_key)
+        if group_ids is None:
+            try:
+                group_ids = sorted(group['id'] for group in get_user_groups(user))
+            except Exception:
+                log.debug(f'Unable to fetch groups for {user}, search cache will not be shared',
+                          exc_info=True)
+                group_ids = [f'user-{user.pk}']
+            cache.set(cache_key, group_ids, self.get_cache_timeout())
+        return group_ids
+
+    def get_search_cache_key(self, index_uuid, search_client_data):
+        search = json.dumps([index_uuid, search_client_data, self.get_user_group_ids()],
+                            sort_keys=True, default=str)
+        return f'xpcs-search-{hashlib.sha256(search.encode()).hexdigest()}'
+
+    def get_record_cache_key(self, index_uuid, gmeta_record):
+        entry_ids = sorted(str(entry.get('entry_id')) for entry in gmeta_record['entries'])
+        record = json.dumps([gmeta_record['subject'], entry_ids])
+        return f'xpcs-record-{index_uuid}-{hashlib.sha256(record.encode()).hexdigest()}'
+
+    def post_search(self, client, index_uuid, search_client_data):
+        cache_key = self.get_search_cache_key(index_uuid, search_client_data)
+        data = cache.get(cache_key)
+        if data is None:
+            data = super().post_search(client, index_uuid, search_client_data).data
+            cache.set(cache_key, data, self.get_cache_timeout())
+        return CachedSearchResponse(data)
+
+    def process_result(self, index_info, search_result):
+        # Fields are processed below instead, only for records which aren't cached
+        result = super().process_result(dict(index_info, fields=[]), search_result)
+        result['search']['search_results'] = self.process_records(
+            index_info, search_result.data['gmeta'])
+        return result
+
+    def process_records(self, index_info, gmeta):
+        keys = {quote_plus(g['subject']): self.get_record_cache_key(index_info['uuid'], g)
+                for g in gmeta}
+        records = cache.get_many(keys.values())
+        missing = [g for g in gmeta if keys[quote_plus(g['subject'])] not in records]
+        if missing:
+            processed = {keys[record['subject']]: record
+                         for record in process_search_data(index_info.get('fields', []), missing)}
+            cache.set_many(processed, self.get_cache_timeout())
+            records.update(processed)
+        # Records without any content are skipped, the same as process_search_data
+        return [records[key] for key in keys.values() if key in records]
+
+
+class CachedSubjectMixin:
+    """Fetch the raw GMeta for a single subject. The detail page and each of its lazily
+    loaded preview sections need the same record, so it's cached for the index's
+    'cache_timeout' instead of fetched from Search on every request. Records are
+    cached per user, since visibility depends on who is asking."""
+    cache_timeout = 60 * 5
+
+    def get_subject_cache_key(self, index_uuid, subject):
+        subject_hash = hashlib.sha256(unquote_plus(subject).encode()).hexdigest()
+        return f'xpcs-subject-{index_uuid}-{self.request.user.pk}-{subject_hash}'
+
+    def get_subject_data(self, index, subject):
+        """Raises globus_sdk.SearchAPIError if the subject doesn't exist"""
+        index_info = get_index(index)
+        cache_key = self.get_subject_cache_key(index_info['uuid'], subject)
+        data = cache.get(cache_key)
+        if data is None:
+            client = load_search_client(self.request.user)
+            data = client.get_subject(index_info['uuid'], unquote_plus(subject)).data
+            cache.set(cache_key, data, index_info.get('cache_timeout', self.cache_timeout))
+        return data
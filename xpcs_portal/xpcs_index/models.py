@@ -1,8 +1,9 @@
 import logging
-import re
 import os
 import datetime
+from django.core.cache import cache
 from django.db import models
+from django.utils import timezone
 from django.urls import reverse
 from django.contrib.auth.models import User
 from xpcs_portal.xpcs_index import filter_regexes
@@ -13,6 +14,11 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+# Filters only change through FilenameFilter.toggle(), which clears the cache
+FILENAME_FILTER_CACHE_TIMEOUT = 60 * 60 * 24
+# Job status is cached whenever it changes, so the progress page never polls the database
+REPROCESSING_JOB_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 class ReprocessingTask(models.Model):
 
@@ -99,6 +105,20 @@ class FilenameFilter(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     regex = models.CharField(max_length=512)
 
+    @classmethod
+    def get_cache_key(cls, user):
+        return f'xpcs-filename-filters-{user.pk}'
+
+    @classmethod
+    def get_regexes(cls, user):
+        """Get all of a user's filter regexes, cached until the user toggles one"""
+        cache_key = cls.get_cache_key(user)
+        regexes = cache.get(cache_key)
+        if regexes is None:
+            regexes = tuple(cls.objects.filter(user=user).values_list('regex', flat=True))
+            cache.set(cache_key, regexes, FILENAME_FILTER_CACHE_TIMEOUT)
+        return regexes
+
     @classmethod
     def toggle(cls, user, filename):
         """Toggle a given filename on or off. """
@@ -110,19 +130,200 @@ class FilenameFilter(models.Model):
         else:
             cls.objects.create(user=user, regex=regex)
             log.debug(f'Regex created for {user}: {regex}')
+        cache.delete(cls.get_cache_key(user))
+
+    @classmethod
+    def get_matcher(cls, user):
+        """Return a function which returns True or False if a given filename
+        *should* be shown. Most images will record a 'filter' regex if the given
+        filename should be shown. Some filenames override the default, and are
+        shown by default but allow the user to turn them off, so a 'reverse' filter
+        is used in that case.
+
+        Get the matcher once and use it for every filename, rather than calling
+        match() for each one."""
+        return filter_regexes.compile_matcher(cls.get_regexes(user))
 
     @classmethod
     def match(cls, user, filename):
         """Return True or False if the given filename *should* be shown.
-        Most images will record a 'filter' regex if the given filename should
-        be shown. Some filenames override the default, and are shown by default
-        but allow the user to turn them off, so a 'reverse' filter is used in
-        that case.
         Returns: True if filename should be shown, False otherwise."""
-        show = False
-        for rfilter in cls.objects.filter(user=user):
-            if re.match(rfilter.regex, filename):
-                show = True
-        if any(re.match(r, filename) for r in filter_regexes.SHOW_BY_DEFAULT):
-            show = not show
-        return show
+        return cls.get_matcher(user)(filename)
+
+
+class QmapFile(models.Model):
+    """A qmap file in the partitionMapLibrary, found by the sync_qmap_catalog command.
+    The reprocessing form searches this table instead of listing the library."""
+    path = models.CharField(max_length=512, unique=True)
+    name = models.CharField(max_length=256, db_index=True)
+    cycle = models.CharField(max_length=32, db_index=True)
+    size = models.BigIntegerField(null=True)
+    last_modified = models.DateTimeField(null=True)
+    checksum = models.CharField(max_length=64, blank=True)
+    detector_rows = models.IntegerField(null=True)
+    detector_cols = models.IntegerField(null=True)
+    dynamic_q_bins = models.IntegerField(null=True)
+    dynamic_phi_bins = models.IntegerField(null=True)
+    static_q_bins = models.IntegerField(null=True)
+    static_phi_bins = models.IntegerField(null=True)
+    date_indexed = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-cycle', 'name']
+
+    def __str__(self):
+        return self.path
+
+    @property
+    def summary(self) -> str:
+        """Short description of the qmap, shown next to it when searching"""
+        parts = [self.cycle]
+        if self.detector_rows and self.detector_cols:
+            parts.append(f'{self.detector_cols}x{self.detector_rows}')
+        if self.dynamic_q_bins is not None:
+            parts.append(f'dynamic {self.dynamic_q_bins}q/{self.dynamic_phi_bins}phi')
+        if self.static_q_bins is not None:
+            parts.append(f'static {self.static_q_bins}q/{self.static_phi_bins}phi')
+        return ', '.join(parts)
+
+    @classmethod
+    def search(cls, query: str = '', limit: int = 20):
+        """Qmaps with every word of the query in their name or cycle, newest cycles first"""
+        qmaps = cls.objects.all()
+        for word in query.split():
+            qmaps = qmaps.filter(models.Q(name__icontains=word) | models.Q(cycle__icontains=word))
+        return qmaps[:limit]
+
+    def as_json(self) -> dict:
+        return {
+            'path': self.path,
+            'name': self.name,
+            'cycle': self.cycle,
+            'checksum': self.checksum,
+            'detector_rows': self.detector_rows,
+            'detector_cols': self.detector_cols,
+            'dynamic_q_bins': self.dynamic_q_bins,
+            'dynamic_phi_bins': self.dynamic_phi_bins,
+            'static_q_bins': self.static_q_bins,
+            'static_phi_bins': self.static_phi_bins,
+            'summary': self.summary,
+        }
+
+
+class ReprocessingJob(models.Model):
+    """A reprocessing submission waiting for the reprocessing_worker command.
+
+    Starting flows for every selected dataset takes too long to do while the browser
+    waits, so the reprocessing views save the form POST here instead. The worker replays
+    it through the same view, which then starts the flows as it would have originally.
+    Everything the view reads from the request is saved: the POST, the query string and
+    the session, which holds the user's last search."""
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    SUCCEEDED = 'SUCCEEDED'
+    FAILED = 'FAILED'
+    STATUS_CHOICES = [(s, s.title()) for s in (QUEUED, RUNNING, SUCCEEDED, FAILED)]
+    # Session keys which belong to the login, and are set again by the worker
+    PRIVATE_SESSION_KEYS = ('_auth_user_id', '_auth_user_backend', '_auth_user_hash')
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    view_name = models.CharField(max_length=128)
+    view_kwargs = models.JSONField(default=dict)
+    query_string = models.TextField(blank=True)
+    post_data = models.JSONField(default=dict)
+    session_data = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True)
+    # Where the view redirected after starting the flows
+    result_url = models.CharField(max_length=512, blank=True)
+    # Selections which couldn't be reprocessed, each with its 'key' and 'error'. Flows
+    # are still started for the rest.
+    run_input_errors = models.JSONField(default=list, blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True, blank=True)
+    date_finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['date_created']
+
+    def __str__(self):
+        return f'{self.view_name} for {self.user} ({self.status})'
+
+    def get_absolute_url(self):
+        return reverse('xpcs-index:reprocessing-job',
+                       kwargs={'index': self.view_kwargs.get('index', 'xpcs'), 'pk': self.pk})
+
+    @classmethod
+    def enqueue(cls, request):
+        """Save a reprocessing form POST to be submitted by the worker"""
+        post_data = {k: v for k, v in request.POST.lists() if k != 'csrfmiddlewaretoken'}
+        session_data = {k: v for k, v in request.session.items() if k not in cls.PRIVATE_SESSION_KEYS}
+        job = cls.objects.create(
+            user=request.user,
+            view_name=request.resolver_match.view_name,
+            view_kwargs=request.resolver_match.kwargs,
+            query_string=request.META.get('QUERY_STRING', ''),
+            post_data=post_data,
+            session_data=session_data,
+        )
+        job.cache_status()
+        log.debug(f'Queued reprocessing job {job.pk} for {request.user}')
+        return job
+
+    @classmethod
+    def get_next(cls):
+        return cls.objects.filter(status=cls.QUEUED).select_related('user').first()
+
+    def claim(self) -> bool:
+        """Mark a queued job running. Returns False if another worker got to it first."""
+        now = timezone.now()
+        claimed = type(self).objects.filter(pk=self.pk, status=self.QUEUED).update(
+            status=self.RUNNING, date_started=now)
+        if claimed:
+            self.status, self.date_started = self.RUNNING, now
+            self.cache_status()
+        return bool(claimed)
+
+    def finish(self, status: str, error: str = '', result_url: str = ''):
+        self.status, self.error, self.result_url = status, error, result_url
+        self.date_finished = timezone.now()
+        self.save(update_fields=['status', 'error', 'result_url', 'date_finished'])
+        self.cache_status()
+
+    def record_run_input_errors(self, errors: list):
+        self.run_input_errors = errors
+        self.save(update_fields=['run_input_errors'])
+        self.cache_status()
+
+    @classmethod
+    def get_status_cache_key(cls, pk):
+        return f'xpcs-reprocessing-job-{pk}'
+
+    def get_status(self) -> dict:
+        return {
+            'id': self.pk,
+            'user': self.user_id,
+            'status': self.status,
+            'error': self.error,
+            'result_url': self.result_url,
+            'run_input_errors': self.run_input_errors,
+            'date_created': self.date_created.isoformat() if self.date_created else None,
+            'date_started': self.date_started.isoformat() if self.date_started else None,
+            'date_finished': self.date_finished.isoformat() if self.date_finished else None,
+        }
+
+    def cache_status(self):
+        cache.set(self.get_status_cache_key(self.pk), self.get_status(), REPROCESSING_JOB_CACHE_TIMEOUT)
+
+    @classmethod
+    def get_cached_status(cls, pk, user):
+        """Get a job's status, from the database only if it has dropped out of the cache.
+        Returns None if the user has no such job."""
+        status = cache.get(cls.get_status_cache_key(pk))
+        if status is None:
+            job = cls.objects.filter(pk=pk, user=user).first()
+            if job is None:
+                return None
+            job.cache_status()
+            status = job.get_status()
+        return status if status['user'] == user.pk else None
@@ -0,0 +1,147 @@
+"""
+Build the catalog of qmap files offered on the reprocessing form.
+
+Qmaps live in one folder per cycle under partitionMapLibrary on the XPCS data collection.
+Folders are listed with Transfer, and each listing is cached for listing_cache_timeout
+seconds. A file is only downloaded (over the collection's HTTPS server) when it's new or
+its size or modification time has changed, to record its checksum and read its detector
+dimensions and q/phi bin counts. Reading qmaps requires h5py; without it only the
+listing is stored.
+
+The catalog is stored in the QmapFile table by the sync_qmap_catalog command, so the
+form only ever queries the database.
+"""
+import hashlib
+import logging
+import pathlib
+import tempfile
+
+import requests
+from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from xpcs_portal.xpcs_index.models import QmapFile
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+log = logging.getLogger(__name__)
+
+DOWNLOAD_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 ** 2
+
+
+class QmapError(Exception):
+    pass
+
+
+def get_listing_cache_key(collection: str, path: str) -> str:
+    return f'xpcs-qmap-listing-{hashlib.sha256(f"{collection}:{path}".encode()).hexdigest()}'
+
+
+def list_directory(transfer_client, collection: str, path: str, cache_timeout: int) -> list:
+    """List a folder, from the cache if it was listed in the last cache_timeout seconds"""
+    cache_key = get_listing_cache_key(collection, path)
+    entries = cache.get(cache_key)
+    if entries is None:
+        response = transfer_client.operation_ls(collection, path=path)
+        entries = [{k: f[k] for k in ('name', 'type', 'size', 'last_modified')}
+                   for f in response.data['DATA']]
+        cache.set(cache_key, entries, cache_timeout)
+    return entries
+
+
+def list_library(transfer_client, library: dict, cycles: list = None):
+    """Yield every qmap file in the library, with the cycle folder it was found in.
+    Only the given cycles are listed, if any are given."""
+    root = pathlib.PurePosixPath(library['path'])
+    timeout = library['listing_cache_timeout']
+    for folder in list_directory(transfer_client, library['collection'], str(root), timeout):
+        if folder['type'] != 'dir' or (cycles and folder['name'] not in cycles):
+            continue
+        cycle_path = root / folder['name']
+        for f in list_directory(transfer_client, library['collection'], str(cycle_path), timeout):
+            if f['type'] == 'file' and pathlib.PurePosixPath(f['name']).suffix in library['extensions']:
+                yield dict(f, cycle=folder['name'], path=str(cycle_path / f['name']))
+
+
+def get_dataset_int(qmap, name: str):
+    """Bin counts are stored as scalars or single element arrays"""
+    if name not in qmap:
+        return None
+    value = qmap[name][()]
+    return int(value.flat[0] if hasattr(value, 'flat') else value)
+
+
+def read_qmap_info(filename) -> dict:
+    """Read the detector dimensions and bin counts from a qmap file"""
+    if h5py is None:
+        return {}
+    try:
+        with h5py.File(filename, 'r') as qmap:
+            rows, cols = qmap['/data/mask'].shape[-2:] if '/data/mask' in qmap else (None, None)
+            return {
+                'detector_rows': rows,
+                'detector_cols': cols,
+                'dynamic_q_bins': get_dataset_int(qmap, '/data/dnoq'),
+                'dynamic_phi_bins': get_dataset_int(qmap, '/data/dnophi'),
+                'static_q_bins': get_dataset_int(qmap, '/data/snoq'),
+                'static_phi_bins': get_dataset_int(qmap, '/data/snophi'),
+            }
+    except (OSError, KeyError, ValueError) as e:
+        raise QmapError(f'Unable to read qmap {filename}: {e}') from e
+
+
+def index_qmap(url: str, access_token: str) -> dict:
+    """Download a qmap to a temporary file, and return its checksum and info"""
+    headers = {'Authorization': f'Bearer {access_token}'} if access_token else {}
+    checksum = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix='.h5') as tmp:
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+                response.raise_for_status()
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    checksum.update(chunk)
+                    tmp.write(chunk)
+        except requests.RequestException as re:
+            raise QmapError(f'Unable to fetch {url}: {re}') from re
+        tmp.flush()
+        return dict(read_qmap_info(tmp.name), checksum=checksum.hexdigest())
+
+
+def sync_catalog(transfer_client, get_access_token, library: dict, cycles: list = None,
+                 reindex: bool = False) -> dict:
+    """Update the QmapFile table from the library listing. Files which are new or have
+    changed are indexed, and files which are gone are removed. If cycles are given,
+    only those cycles are updated. Listing errors are raised before anything is removed,
+    so a folder which can't be listed never empties the catalog. Returns the number of
+    files in each outcome."""
+    existing = QmapFile.objects.all()
+    if cycles:
+        existing = existing.filter(cycle__in=cycles)
+    existing = {q.path: q for q in existing}
+    counts = {'created': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'failed': 0}
+    listing = list(list_library(transfer_client, library, cycles))
+    seen = {entry['path'] for entry in listing}
+    for entry in listing:
+        qmap = existing.get(entry['path'])
+        last_modified = parse_datetime(entry['last_modified'])
+        if qmap and not reindex and qmap.size == entry['size'] and qmap.last_modified == last_modified:
+            counts['unchanged'] += 1
+            continue
+        try:
+            info = index_qmap(library['https_url'] + entry['path'], get_access_token())
+        except QmapError as qe:
+            log.warning(str(qe))
+            counts['failed'] += 1
+            continue
+        defaults = dict(info, name=entry['name'], cycle=entry['cycle'], size=entry['size'],
+                        last_modified=last_modified)
+        QmapFile.objects.update_or_create(path=entry['path'], defaults=defaults)
+        counts['updated' if qmap else 'created'] += 1
+        log.debug(f'Indexed qmap {entry["path"]}')
+    removed = set(existing) - seen
+    if removed:
+        QmapFile.objects.filter(path__in=removed).delete()
+        counts['removed'] = len(removed)
+    return counts
@@ -0,0 +1,180 @@
+"""
+Small WebP thumbnails of preview images, fetched through the portal and cached on disk.
+
+Preview images on the Globus HTTPS server are full size (the scattering pattern is
+3840x864), and need the user's token. Thumbnails are fetched with the user's token,
+resized, and stored in a size bounded least recently used cache on disk.
+
+Cache keys include the file's checksum from the record as its version, so a file
+which is reprocessed gets a new thumbnail instead of a stale one, and cached
+thumbnails never need to be revalidated.
+
+Thumbnails are shared by every user, but not every user can read every image. A cached
+thumbnail is only served to a user once a HEAD request with their own token shows they
+can read the image, unless the caller has verified that recently.
+"""
+import hashlib
+import io
+import logging
+import os
+import pathlib
+import threading
+import uuid
+
+import requests
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SIZE = 480
+WEBP_QUALITY = 80
+CONTENT_TYPE = 'image/webp'
+FETCH_TIMEOUT = 30
+# Seconds a user's access to an image is trusted before it's checked again
+ACCESS_TIMEOUT = 60 * 10
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+class ThumbnailAccessDenied(ThumbnailError):
+    pass
+
+
+class ThumbnailCache:
+    """A directory of files which is kept under max_bytes by removing the least recently
+    used files. A file's modification time is updated each time it's read, so it
+    doubles as the last time it was used."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Bytes written since the cache was last measured. Other processes write to the
+        # same directory, so the directory is measured again whenever this might be over.
+        self.total_bytes = None
+
+    def get_path(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / key
+
+    def get(self, key: str):
+        path = self.get_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self.get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a partially written file is never read
+        tmp = path.with_name(f'.{key}.{uuid.uuid4().hex}')
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self.lock:
+            if self.total_bytes is not None:
+                self.total_bytes += len(data)
+            if self.total_bytes is None or self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        files = []
+        for path in self.directory.glob('*/*'):
+            if path.name.startswith('.'):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                log.debug(f'Evicted thumbnail {path.name}')
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.total_bytes = total
+
+
+def get_thumbnail_key(url: str, version: str, size: int) -> str:
+    return hashlib.sha256(f'{url}\n{version}\n{size}\nwebp'.encode()).hexdigest()
+
+
+def request_image(method: str, url: str, access_token: str) -> requests.Response:
+    """Request an image with the user's token. Raises ThumbnailAccessDenied if the user
+    can't read it. The HTTPS server redirects requests it can't authorize to a login
+    page, so a redirect is a denial too."""
+    headers = {'Authorization': f'Bearer {access_token}'} if access_token else {}
+    try:
+        response = requests.request(method, url, headers=headers, timeout=FETCH_TIMEOUT,
+                                    allow_redirects=False)
+    except requests.RequestException as re:
+        raise ThumbnailError(f'Unable to fetch {url}: {re}') from re
+    if response.is_redirect or response.status_code in (401, 403, 404):
+        raise ThumbnailAccessDenied(f'Access denied to {url}: {response.status_code}')
+    try:
+        response.raise_for_status()
+    except requests.RequestException as re:
+        raise ThumbnailError(f'Unable to fetch {url}: {re}') from re
+    return response
+
+
+def fetch_image(url: str, access_token: str) -> bytes:
+    return request_image('GET', url, access_token).content
+
+
+def check_access(url: str, access_token: str):
+    """Raise ThumbnailAccessDenied unless the token can read url, without fetching it"""
+    request_image('HEAD', url, access_token)
+
+
+def make_thumbnail(data: bytes, size: int = DEFAULT_SIZE) -> bytes:
+    """Shrink an image to fit in size x size pixels, and convert it to WebP"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        output = io.BytesIO()
+        image.save(output, format='WEBP', quality=WEBP_QUALITY)
+    except (OSError, ValueError) as e:
+        raise ThumbnailError(f'Unable to make a thumbnail: {e}') from e
+    return output.getvalue()
+
+
+def get_thumbnail(cache: ThumbnailCache, url: str, version: str, get_access_token,
+                  size: int = DEFAULT_SIZE, verified: bool = False) -> bytes:
+    """Get a thumbnail from the cache, or fetch and cache it. Unless the user's access
+    to url is already verified, a cached thumbnail is only returned after checking it
+    with their token. get_access_token is only called if the image needs to be fetched
+    or checked."""
+    key = get_thumbnail_key(url, version, size)
+    data = cache.get(key)
+    if data is None:
+        data = make_thumbnail(fetch_image(url, get_access_token()), size)
+        cache.put(key, data)
+    elif not verified:
+        check_access(url, get_access_token())
+    return data
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory, max_bytes) -> ThumbnailCache:
+    """Share one cache per directory within a process, so writes are counted together"""
+    with _caches_lock:
+        if directory not in _caches:
+            _caches[directory] = ThumbnailCache(directory, max_bytes)
+        return _caches[directory]
@@ -3,16 +3,29 @@ from globus_portal_framework.urls import register_custom_index
 from xpcs_portal.xpcs_index.views import (
     XPCSSearchView,
     XPCSDetailView,
+    XPCSPreviewSectionView,
     XPCSReprocessingSearchReprocessing,
     XPCSReprocessingTransferReprocessing,
+    XPCSReprocessingJobView,
+)
+from xpcs_portal.xpcs_index.api import (
+    toggle_filename_filter,
+    export_search_results,
+    thumbnail,
+    reprocessing_job_status,
+    search_qmaps,
 )
-from xpcs_portal.xpcs_index.api import toggle_filename_filter
 
 app_name = 'xpcs-index'
 register_custom_index('xpcs_index', ['xpcs'])
 
 apipatterns = [
     path('filename_filter/toggle/', toggle_filename_filter, name='toggle-filename-filter'),
+    path('export/', export_search_results, name='export-search-results'),
+    path('thumbnail/', thumbnail, name='thumbnail'),
+    path('previews/<str:section>/<path:subject>/', XPCSPreviewSectionView.as_view(), name='preview-section'),
+    path('reprocessing/jobs/<int:pk>/', reprocessing_job_status, name='reprocessing-job-status'),
+    path('qmaps/', search_qmaps, name='search-qmaps'),
 ]
 
 urlpatterns = [
@@ -20,6 +33,7 @@ urlpatterns = [
     path('<xpcs_index:index>/detail/<path:subject>/', XPCSDetailView.as_view(), name='detail'),
     path('<xpcs_index:index>/reprocessing/', XPCSReprocessingSearchReprocessing.as_view(), name='reprocessing'),
     path('<xpcs_index:index>/compute-transfer/', XPCSReprocessingTransferReprocessing.as_view(), name='compute-transfer'),
+    path('<xpcs_index:index>/reprocessing/jobs/<int:pk>/', XPCSReprocessingJobView.as_view(), name='reprocessing-job'),
 
     path('<xpcs_index:index>/api/', include(apipatterns)),
 ]
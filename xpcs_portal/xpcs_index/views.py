@@ -1,20 +1,34 @@
 import logging
+import globus_sdk
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django import forms
+from django.http import JsonResponse
+from django.views.generic import View, TemplateView
+from globus_portal_framework.gsearch import get_index, process_search_data
 from globus_portal_framework.views.generic import SearchView, DetailView
 from globus_app_flows.views import BatchCreateView
 from globus_app_flows.models import FlowAuthorization
 
+from xpcs_portal.xpcs_index import fields
 from xpcs_portal.xpcs_index.collectors import XPCSSearchCollector, XPCSTransferCollector, XPCSSuffixSearchCollector
 from xpcs_portal.xpcs_index.forms import ReprocessDatasetsCheckoutForm
-from xpcs_portal.xpcs_index.models import FilenameFilter
-from xpcs_portal.xpcs_index.mixins import PaginatedSearchView
+from xpcs_portal.xpcs_index.models import FilenameFilter, ReprocessingJob
+from xpcs_portal.xpcs_index.mixins import PaginatedSearchView, CachedSearchView, CachedSubjectMixin
 
 log = logging.getLogger(__name__)
 
+# Detail page sections which are loaded when expanded, rather than with the page
+LAZY_PREVIEW_SECTIONS = (
+    'structural_analysis_prev',
+    'correlation_plot_previews',
+    'correlation_plot_with_fit_previews',
+    'text_outputs',
+)
 
-class XPCSSearchView(LoginRequiredMixin, PaginatedSearchView, SearchView):
+
+class XPCSSearchView(LoginRequiredMixin, PaginatedSearchView, CachedSearchView, SearchView):
     """Custom XPCS Search view automatically filters on the xpcs-8id 'project'. This is old,
     based on the pilot project feature and will be going away eventually."""
 
@@ -23,33 +37,62 @@ class XPCSSearchView(LoginRequiredMixin, PaginatedSearchView, SearchView):
         return super().filters + self.get_index_info().get('default_filters', [])
 
 
-class XPCSDetailView(LoginRequiredMixin, DetailView):
-    """The custom XPCS detail view adds support for toggling images on and off"""
+class XPCSDetailView(LoginRequiredMixin, CachedSubjectMixin, DetailView):
+    """The custom XPCS detail view adds support for toggling images on and off.
 
-    def get_context_data(self, *args, **kwargs):
-        context = super().get_context_data(*args, **kwargs)
-        preview_list = (
-            'all_preview',
-            'correlation_plot_previews',
-            'correlation_plot_with_fit_previews',
-            'intensity_plot_previews',
-            'structural_analysis_prev',
-            'text_outputs',
-        )
+    Only the page shell and the previews at the top of the page are rendered here.
+    Sections listed in LAZY_PREVIEW_SECTIONS are skipped, and fetched by the page from
+    XPCSPreviewSectionView when the user expands them."""
+
+    def get_context_data(self, index, subject):
         try:
-            for preview in preview_list:
-                for manifest in context.get(preview, []):
-                    match = FilenameFilter.match(self.request.user,
-                                                 manifest.get('filename'))
-                    manifest['show_filename'] = match
+            data = self.get_subject_data(index, subject)
+        except globus_sdk.SearchAPIError:
+            return {'subject': subject, 'error': 'No data was found for subject'}
+        skipped = LAZY_PREVIEW_SECTIONS + ('all_preview',)
+        field_mappers = [f for f in get_index(index).get('fields', [])
+                         if (f if isinstance(f, str) else f[0]) not in skipped]
+        context = process_search_data(field_mappers, [data])[0]
+
+        shell_previews = list(context.get('intensity_plot_previews') or [])
+        shell_previews += [context.get(p) for p in ('listing_preview', 'total_intensity_vs_time_preview')
+                           if context.get(p)]
+        try:
+            match = FilenameFilter.get_matcher(self.request.user)
+            for manifest in shell_previews:
+                manifest['show_filename'] = match(manifest.get('filename'), manifest.get('default_visible'))
         except Exception as e:
             log.exception(e)
+        context['shell_previews'] = shell_previews
+        context['lazy_preview_sections'] = LAZY_PREVIEW_SECTIONS
         return context
 
 
+class XPCSPreviewSectionView(LoginRequiredMixin, CachedSubjectMixin, View):
+    """Return the previews in one section of the detail page as JSON"""
+
+    def get(self, request, index, section, subject):
+        if section not in LAZY_PREVIEW_SECTIONS:
+            return JsonResponse({'error': f'No preview section "{section}"'}, status=404)
+        try:
+            data = self.get_subject_data(index, subject)
+        except globus_sdk.SearchAPIError:
+            return JsonResponse({'error': 'No data was found for subject'}, status=404)
+        previews = fields.get_preview_categories([e['content'] for e in data['entries']])[section]
+        match = FilenameFilter.get_matcher(request.user)
+        return JsonResponse({
+            'section': section,
+            'previews': [dict(p, show_filename=match(p.get('filename'), p.get('default_visible')))
+                         for p in previews],
+        })
+
+
 class XPCSReprocessing(object):
-    """Reprocessing Checkout starts the flow immediately on verifying
-    each of the subject it can process are valid"""
+    """Reprocessing Checkout queues a ReprocessingJob once the form is valid, and sends
+    the user to its progress page. The reprocessing_worker command submits the job back
+    through this view, which builds the run inputs for the whole batch with the
+    collector's get_run_inputs(), then starts the flows for each subject it can process.
+    Subjects which can't be processed are recorded on the job."""
     form_class = ReprocessDatasetsCheckoutForm
     template_name = 'xpcs/reprocess-datasets-checkout.html'
     flow = '72e6469a-cf30-46bc-bff4-94dca46f2459'
@@ -70,6 +113,28 @@ class XPCSReprocessing(object):
         context['index'] = self.kwargs['index']
         return context
 
+    def get_collector(self, *args, **kwargs):
+        # One collector per request, so the flows are started with the run inputs
+        # built for the batch
+        if getattr(self, '_collector', None) is None:
+            self._collector = super().get_collector(*args, **kwargs)
+        return self._collector
+
+    def form_valid(self, form):
+        if getattr(self.request, 'reprocessing_job', None) is not None:
+            # Submitted by the worker. Build every run input at once, then start the flows
+            # for those which could be built
+            collector = self.get_collector()
+            results = collector.get_run_inputs(list(collector.get_collector_data()), form.cleaned_data)
+            errors = [{'key': r['key'], 'error': r['error']} for r in results if r['error']]
+            self.request.reprocessing_job.record_run_input_errors(errors)
+            if errors and len(errors) == len(results):
+                form.add_error(None, 'None of the selected datasets could be reprocessed')
+                return self.form_invalid(form)
+            return super().form_valid(form)
+        job = ReprocessingJob.enqueue(self.request)
+        return redirect(job)
+
     def get_success_url(self):
         url = reverse_lazy('search', kwargs={'index': 'xpcs'})
         return f'{url}?flow={self.flow}'
@@ -82,3 +147,15 @@ class XPCSReprocessingSearchReprocessing(XPCSReprocessing, BatchCreateView):
 
 class XPCSReprocessingTransferReprocessing(XPCSReprocessing, BatchCreateView):
     collector = XPCSTransferCollector
+
+
+class XPCSReprocessingJobView(LoginRequiredMixin, TemplateView):
+    """Progress page for a queued reprocessing job, which polls the job status api"""
+    template_name = 'xpcs/reprocessing-job.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        job = get_object_or_404(ReprocessingJob, pk=kwargs['pk'], user=self.request.user)
+        context['job'] = job
+        context['job_status'] = ReprocessingJob.get_cached_status(job.pk, self.request.user)
+        return context